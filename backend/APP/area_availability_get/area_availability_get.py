@@ -0,0 +1,135 @@
+import logging
+import json
+import os
+
+from common import (common_const, utils)
+from validation.restaurant_param_check import RestaurantParamCheck
+from restaurant.restaurant_shop_master import RestaurantShopMaster
+from restaurant.restaurant_shop_reservation import (
+    RESERVED_INFO_ATTRIBUTES, VACANCY_FLG_MAP, RestaurantShopReservation)
+
+# ログ出力の設定
+LOGGER_LEVEL = os.environ.get("LOGGER_LEVEL")
+logger = logging.getLogger()
+if LOGGER_LEVEL == 'DEBUG':
+    logger.setLevel(logging.DEBUG)
+else:
+    logger.setLevel(logging.INFO)
+
+# 地域の店舗一覧で使用する属性
+AREA_SHOP_ATTRIBUTES = ['shopId', 'areaId', 'shop.shopName']
+# 空き状況の算出に使用する属性
+# (maxReservableNumberがない以前の予約情報は、登録済みのvacancyFlgを使用する)
+AVAILABILITY_ATTRIBUTES = RESERVED_INFO_ATTRIBUTES + [
+    'totalReservedNumber', 'maxReservableNumber', 'vacancyFlg']
+
+# テーブル操作クラスの初期化
+shop_master_table_controller = RestaurantShopMaster()
+shop_reservation_table_controller = RestaurantShopReservation()
+
+
+def get_area_availability(area_id, preferred_day, people_number=1):
+    """
+    地域内の全店舗の指定日の空き状況と、予約できる最も早い時刻を取得する
+    ※店舗の予約モデルと指定日の予約情報はそれぞれBatchGetItemでまとめて取得し、
+    店舗数に関わらず読み込みの往復回数を一定にする
+
+    Parameters
+    ----------
+    area_id : str
+        エリアID
+    preferred_day : str
+        予約する日付
+    people_number : int, optional
+        予約人数, by default 1
+
+    Returns
+    -------
+    area_availability: list of dict
+        店舗ごとの空き状況
+        shopId, shopName, vacancyFlg,
+        earliestStartTime: 30分枠で予約できる最も早い時刻(ない場合はNone)
+    """
+    shops = [shop for shop in shop_master_table_controller.scan(
+        attributes=AREA_SHOP_ATTRIBUTES) if shop['areaId'] == int(area_id)]
+    shop_ids = [int(shop['shopId']) for shop in shops]
+    if not shop_ids:
+        return []
+
+    shop_models = shop_master_table_controller.get_models(shop_ids)
+    reserved_days = shop_reservation_table_controller.batch_get_days(
+        [(shop_id, preferred_day) for shop_id in shop_ids],
+        attributes=AVAILABILITY_ATTRIBUTES,
+        shard_counts={shop_id: shop_model.shard_count
+                      for shop_id, shop_model in shop_models.items()})
+
+    area_availability = []
+    for shop, shop_id in zip(shops, shop_ids):
+        shop_model = shop_models.get(shop_id)
+        if shop_model is None:
+            continue
+        reserved_day = reserved_days.get((shop_id, preferred_day), {})
+
+        start_times = []
+        if shop_model.is_open_on(preferred_day):
+            start_times = shop_model.feasible_start_times(
+                reserved_day.get('reservedSlots'), None, people_number)
+        if not start_times:
+            vacancy_flg = VACANCY_FLG_MAP['AVAILABLE_NOTHING']
+        else:
+            vacancy_flg = reserved_day.get(
+                'vacancyFlg', VACANCY_FLG_MAP['AVAILABLE_MUCH'])
+
+        area_availability.append({
+            'shopId': shop_id,
+            'shopName': shop['shop']['shopName'],
+            'vacancyFlg': vacancy_flg,
+            'earliestStartTime': start_times[0]['reservationStarttime']
+            if start_times else None,
+        })
+
+    return area_availability
+
+
+def lambda_handler(event, context):
+    """
+    地域内の全店舗の指定日の空き状況を返却する
+
+    Parameters
+    ----------
+    event : dict
+        フロントから送られたパラメータ等の情報
+    context : __main__.LambdaContext
+        Lambdaランタイムや関数名等のメタ情報
+
+    Returns
+    -------
+    response: dict
+        正常の場合、店舗ごとの空き状況を返却する。
+        エラーの場合、エラーコードとエラーメッセージを返却する。
+    """
+    logger.info(event)
+    req_param = event['queryStringParameters']
+
+    if req_param is None:
+        error_msg_disp = common_const.const.MSG_ERROR_NOPARAM
+        return utils.create_error_response(error_msg_disp, 400)
+
+    # パラメータのバリデーションチェック
+    param_checker = RestaurantParamCheck(req_param)
+    if error_msg := param_checker.check_api_area_availability():
+        error_msg_disp = ('\n').join(error_msg)
+        logger.error(error_msg_disp)
+        return utils.create_error_response(error_msg_disp, status=400)  # noqa: E501
+
+    try:
+        area_availability = get_area_availability(
+            req_param['areaId'], req_param['preferredDay'],
+            int(req_param.get('reservationPeopleNumber', 1)))
+    except Exception as e:
+        logger.exception('Occur Exception: %s', e)
+        return utils.create_error_response('ERROR')
+
+    return utils.create_success_response(json.dumps(
+        area_availability, default=utils.decimal_to_int,
+        ensure_ascii=False))
@@ -0,0 +1,148 @@
+import logging
+import json
+import os
+from datetime import (datetime, timedelta)
+
+from common import (common_const, utils)
+from validation.restaurant_param_check import RestaurantParamCheck
+from restaurant.restaurant_shop_master import RestaurantShopMaster
+from restaurant.restaurant_shop_reservation import (
+    get_reserved_info_attributes, RestaurantShopReservation)
+
+# ログ出力の設定
+LOGGER_LEVEL = os.environ.get("LOGGER_LEVEL")
+logger = logging.getLogger()
+if LOGGER_LEVEL == 'DEBUG':
+    logger.setLevel(logging.DEBUG)
+else:
+    logger.setLevel(logging.INFO)
+
+# 返却する日数と検索する期間(日数)の既定値と上限
+DEFAULT_COUNT = 5
+MAX_COUNT = 31
+DEFAULT_HORIZON_DAYS = 60
+MAX_HORIZON_DAYS = 180
+
+# テーブル操作クラスの初期化
+shop_master_table_controller = RestaurantShopMaster()
+shop_reservation_table_controller = RestaurantShopReservation()
+
+
+def get_available_dates(shop_id, preferred_day, course_id, people_number,
+                        count=DEFAULT_COUNT, horizon_days=DEFAULT_HORIZON_DAYS):
+    """
+    指定日から期間内で、コースと人数で予約できる直近の日付と開始時刻を取得する
+    (定休日を除く)
+    ※期間内の予約情報は1回の範囲指定のqueryで日付順に取得し、
+    必要な日数が見つかった時点で読み込みを終了する
+
+    Parameters
+    ----------
+    shop_id : str
+        予約する店舗のID
+    preferred_day : str
+        検索を開始する日付(YYYY-MM-DD)
+    course_id : str
+        予約するコースのID
+    people_number : str
+        予約人数
+    count : int, optional
+        返却する日数, by default DEFAULT_COUNT
+    horizon_days : int, optional
+        検索する期間(日数), by default DEFAULT_HORIZON_DAYS
+
+    Returns
+    -------
+    available_dates: list of dict
+        day: 日付, startTimes: 予約できる開始・終了時刻のリスト
+        (コースが存在しない場合はNone)
+    """
+    shop_model = shop_master_table_controller.get_model(int(shop_id))
+    if shop_model is None:
+        raise Exception('Shop not found: %s' % shop_id)
+    if shop_model.course_minutes(course_id) is None:
+        return None
+
+    from_day = datetime.strptime(preferred_day, '%Y-%m-%d')
+    to_day = from_day + timedelta(days=horizon_days - 1)
+    reserved_days = shop_reservation_table_controller.iter_days(
+        shop_model.shop_id, from_day.strftime('%Y-%m-%d'),
+        to_day.strftime('%Y-%m-%d'),
+        attributes=get_reserved_info_attributes(
+            shop_model.slot_start_times()))
+    reserved_day = next(reserved_days, None)
+
+    available_dates = []
+    for day_offset in range(horizon_days):
+        day = (from_day + timedelta(days=day_offset)).strftime('%Y-%m-%d')
+        # 予約情報がない日はすべての枠が空席
+        day_slots = None
+        if reserved_day and reserved_day['reservedDay'] == day:
+            day_slots = reserved_day.get('reservedSlots')
+            reserved_day = next(reserved_days, None)
+        if not shop_model.is_open_on(day):
+            continue
+
+        start_times = shop_model.feasible_start_times(
+            day_slots, course_id, int(people_number))
+        if not start_times:
+            continue
+        available_dates.append({'day': day, 'startTimes': start_times})
+        if len(available_dates) >= count:
+            break
+
+    return available_dates
+
+
+def lambda_handler(event, context):
+    """
+    コースと人数で予約できる直近の日付と開始時刻を返却する
+
+    Parameters
+    ----------
+    event : dict
+        フロントから送られたパラメータ等の情報
+    context : __main__.LambdaContext
+        Lambdaランタイムや関数名等のメタ情報
+
+    Returns
+    -------
+    response: dict
+        正常の場合、予約できる日付と開始時刻を返却する。
+        エラーの場合、エラーコードとエラーメッセージを返却する。
+    """
+    logger.info(event)
+    req_param = event['queryStringParameters']
+
+    if req_param is None:
+        error_msg_disp = common_const.const.MSG_ERROR_NOPARAM
+        return utils.create_error_response(error_msg_disp, 400)
+
+    # パラメータのバリデーションチェック
+    param_checker = RestaurantParamCheck(req_param)
+    if error_msg := param_checker.check_api_available_date():
+        error_msg_disp = ('\n').join(error_msg)
+        logger.error(error_msg_disp)
+        return utils.create_error_response(error_msg_disp, status=400)  # noqa: E501
+
+    count = min(max(int(req_param.get('count', DEFAULT_COUNT)), 1),
+                MAX_COUNT)
+    horizon_days = min(max(int(req_param.get(
+        'horizonDays', DEFAULT_HORIZON_DAYS)), 1), MAX_HORIZON_DAYS)
+
+    try:
+        available_dates = get_available_dates(
+            req_param['shopId'], req_param['preferredDay'],
+            req_param['courseId'], req_param['reservationPeopleNumber'],
+            count, horizon_days)
+        if available_dates is None:
+            error_msg_disp = common_const.const.MSG_ERROR_NO_COURSE
+            logger.error(error_msg_disp)
+            return utils.create_error_response(error_msg_disp, 400)
+    except Exception as e:
+        logger.exception('Occur Exception: %s', e)
+        return utils.create_error_response('ERROR')
+
+    return utils.create_success_response(json.dumps(
+        available_dates, default=utils.decimal_to_int,
+        ensure_ascii=False))
@@ -32,8 +32,10 @@ def get_course_list(shop_id):
     course_list : list of dict
         値段、コース名などのコース情報
     """
-    course_list = shop_master_table_controller.get_item(int(shop_id))['course']
-    return course_list
+    shop_model = shop_master_table_controller.get_model(int(shop_id))
+    if shop_model is None:
+        raise Exception('Shop not found: %s' % shop_id)
+    return shop_model.course_list
 
 
 def lambda_handler(event, context):
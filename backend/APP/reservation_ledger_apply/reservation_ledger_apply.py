@@ -0,0 +1,366 @@
+import logging
+import datetime
+import os
+from dateutil.tz import gettz
+
+from aws.dynamodb import transaction
+from restaurant import slot_array
+from restaurant.reservation_ledger import (
+    event_from_stream_record, ReservationLedger)
+from restaurant.restaurant_shop_master import RestaurantShopMaster
+from restaurant.restaurant_shop_reservation import (
+    get_reserved_info_attributes, get_vacancy_flg, LEDGER_TOTAL_ATTRIBUTE,
+    RestaurantShopReservation)
+
+# ログ出力の設定
+LOGGER_LEVEL = os.environ.get("LOGGER_LEVEL")
+logger = logging.getLogger()
+if LOGGER_LEVEL == 'DEBUG':
+    logger.setLevel(logging.DEBUG)
+else:
+    logger.setLevel(logging.INFO)
+
+# 1回のトランザクションの、予約状況と月間カレンダーの集計の更新アクションの数
+AGGREGATE_ACTION_COUNT = 2
+# 1回のトランザクションで集計する予約イベントの上限
+MAX_EVENTS_PER_TRANSACTION = \
+    transaction.TRANSACT_WRITE_ITEMS_LIMIT - AGGREGATE_ACTION_COUNT
+# 再集計の対象月数の既定値(開始月から)
+DEFAULT_REPLAY_MONTHS = 12
+# 再集計で台帳以外の予約を含む日か確認する属性
+REPLAY_CHECK_ATTRIBUTES = ['totalReservedNumber', LEDGER_TOTAL_ATTRIBUTE]
+
+# テーブル操作クラスの初期化
+shop_master_table_controller = RestaurantShopMaster()
+shop_reservation_table_controller = RestaurantShopReservation()
+reservation_ledger_table_controller = ReservationLedger()
+
+
+def group_stream_events(records):
+    """
+    ストリームのレコードから予約イベントを取り出し、店舗と予約日ごとにまとめる
+
+    Parameters
+    ----------
+    records : list of dict
+        DynamoDBストリームのレコード
+
+    Returns
+    -------
+    day_events : dict
+        (店舗ID, 予約日)をキーとした、(シーケンス番号, 予約イベント)のリスト
+    """
+    day_events = {}
+    for record in records:
+        ledger_event = event_from_stream_record(record)
+        if ledger_event is None:
+            continue
+        key = (int(ledger_event['shopId']), ledger_event['reservedDay'])
+        day_events.setdefault(key, []).append(
+            (int(record['dynamodb']['SequenceNumber']), ledger_event))
+    return day_events
+
+
+def fold_events(ledger_events):
+    """
+    予約イベントの予約人数を30分枠ごとに合算する
+
+    Parameters
+    ----------
+    ledger_events : list of dict
+        同じ店舗・予約日の予約イベント
+
+    Returns
+    -------
+    reserved_numbers : dict
+        30分枠の開始時刻(HH:MM)をキーとした予約人数
+    """
+    reserved_numbers = {}
+    for ledger_event in ledger_events:
+        for start_time in ledger_event['reservedStartTimes']:
+            reserved_numbers[start_time] = reserved_numbers.get(
+                start_time, 0) + int(ledger_event['reservationPeopleNumber'])
+    return reserved_numbers
+
+
+def apply_day_events(shop_id, reserved_day, ledger_events):
+    """
+    同じ店舗・予約日の予約イベントを店舗の予約状況と月間カレンダーの集計に反映する
+    ※集計の加算と予約イベントの反映済みの記録を1回のトランザクションで行い、
+    反映済みのイベント(ストリームの再送)は除いて再実行するため、
+    同じイベントが2回集計されることはない
+
+    Parameters
+    ----------
+    shop_id : int
+        店舗ID
+    reserved_day : str
+        予約日
+    ledger_events : list of dict
+        予約イベント
+
+    Returns
+    -------
+    applied_count : int
+        今回反映した予約イベントの数
+    """
+    applied_count = 0
+    for start in range(0, len(ledger_events), MAX_EVENTS_PER_TRANSACTION):
+        pending_events = ledger_events[start:start + MAX_EVENTS_PER_TRANSACTION]
+        while pending_events:
+            reserved_numbers = fold_events(pending_events)
+            max_reservable_number = pending_events[-1]['maxReservableNumber']
+            actions = [
+                shop_reservation_table_controller.create_add_slots_action(
+                    shop_id, reserved_day, reserved_numbers,
+                    max_reservable_number),
+                shop_reservation_table_controller.create_add_summary_action(
+                    shop_id, reserved_day, sum(reserved_numbers.values()),
+                    max_reservable_number),
+            ] + [
+                reservation_ledger_table_controller.create_mark_applied_action(
+                    shop_id, ledger_event['eventKey'])
+                for ledger_event in pending_events]
+            try:
+                transaction.transact_write_items(actions)
+            except transaction.TransactionCanceledError as e:
+                # 反映済みのイベントを除いて再実行する
+                applied = {
+                    index - AGGREGATE_ACTION_COUNT
+                    for index, reason in enumerate(e.reasons)
+                    if index >= AGGREGATE_ACTION_COUNT
+                    and reason == 'ConditionalCheckFailed'}
+                if not applied:
+                    raise e
+                logger.info('反映済みの予約イベントを除外します: %s',
+                            [pending_events[index]['eventKey']
+                             for index in sorted(applied)])
+                pending_events = [
+                    ledger_event for index, ledger_event
+                    in enumerate(pending_events) if index not in applied]
+                continue
+            applied_count += len(pending_events)
+            break
+    return applied_count
+
+
+def check_seats(shop_id, reserved_day, ledger_events):
+    """
+    予約イベントを反映した30分枠の予約人数が席数を超えていないか確認する
+    ※予約の受付時は集計済みの予約状況で空席を確認するため、
+    集計が遅れている間に受け付けた予約で席数を超える場合がある
+
+    Parameters
+    ----------
+    shop_id : int
+        店舗ID
+    reserved_day : str
+        予約日
+    ledger_events : list of dict
+        反映した予約イベント
+
+    Returns
+    -------
+    over_start_times : list of str
+        席数を超えている30分枠の開始時刻
+    """
+    start_times = sorted({start_time for ledger_event in ledger_events
+                          for start_time in ledger_event['reservedStartTimes']})
+    seats_number = min(int(ledger_event['seatsNumber'])
+                       for ledger_event in ledger_events)
+    reserved_day_info = shop_reservation_table_controller.get_item(
+        shop_id, reserved_day,
+        attributes=get_reserved_info_attributes(start_times))
+    day_slots = reserved_day_info.get('reservedSlots') \
+        or slot_array.new_slots()
+    over_start_times = [
+        start_time for start_time in start_times
+        if day_slots[slot_array.slot_index(start_time)] > seats_number]
+    if over_start_times:
+        logger.warning('席数を超える予約があります。shopId: %s, %s %s',
+                       shop_id, reserved_day, ', '.join(over_start_times))
+    return over_start_times
+
+
+def get_year_months(from_year_month, months):
+    """
+    開始年月から指定した月数の年月を取得する
+
+    Parameters
+    ----------
+    from_year_month : str
+        開始年月(YYYY-MM)
+    months : int
+        月数
+
+    Returns
+    -------
+    year_months : list of str
+        年月(YYYY-MM)のリスト
+    """
+    year, month = map(int, from_year_month.split('-'))
+    month_index = year * 12 + month - 1
+    return ['%04d-%02d' % (index // 12, index % 12 + 1)
+            for index in range(month_index, month_index + months)]
+
+
+def replay_shop_month(shop_id, year_month):
+    """
+    予約台帳の反映済みの予約イベントから、店舗の1か月分の予約状況と
+    月間カレンダーの集計を作り直す
+    ※作り直している間に反映された予約イベントが失われないよう、
+    ストリームの集計を停止してから実行すること。
+    未反映の予約イベントは集計の再開後に反映される
+    ※予約状況は日ごとにシャード0の項目を置き換え、
+    月間カレンダーの集計は全シャードを予約状況から作り直す
+    ※台帳以外で登録された予約(台帳モードへの切り替え前に予約状況へ直接登録された
+    予約、他のシャードの予約)を含む日は、予約状況の予約合計数が台帳から集計した
+    人数(ledgerReservedNumber)と一致しないため作り直さずに残す
+
+    Parameters
+    ----------
+    shop_id : int
+        店舗ID
+    year_month : str
+        年月(YYYY-MM)
+
+    Returns
+    -------
+    days : list of dict
+        作り直した日の予約状況
+    """
+    day_slots = {}
+    for ledger_event in reservation_ledger_table_controller.iter_events(
+            shop_id, year_month + '-01', year_month + '-31'):
+        if 'appliedTime' not in ledger_event:
+            continue
+        reserved_day = ledger_event['reservedDay']
+        slots = day_slots.setdefault(reserved_day, slot_array.new_slots())
+        for start_time in ledger_event['reservedStartTimes']:
+            slots[slot_array.slot_index(start_time)] += \
+                int(ledger_event['reservationPeopleNumber'])
+
+    shop_model = shop_master_table_controller.get_model(shop_id)
+    reserved_days = {
+        reserved_day_info['reservedDay']: reserved_day_info
+        for reserved_day_info in shop_reservation_table_controller.iter_days(
+            shop_id, year_month + '-01', year_month + '-31',
+            attributes=REPLAY_CHECK_ATTRIBUTES)}
+    days = []
+    for reserved_day, slots in sorted(day_slots.items()):
+        reserved_day_info = reserved_days.get(reserved_day, {})
+        if reserved_day_info.get('totalReservedNumber', 0) \
+                != reserved_day_info.get(LEDGER_TOTAL_ATTRIBUTE, 0):
+            logger.warning('台帳以外の予約を含むため作り直しません。'
+                           'shopId: %s, reservedDay: %s', shop_id,
+                           reserved_day)
+            continue
+        total_reserved_number = sum(slots)
+        shop_reservation_table_controller.put_item(
+            shop_id, reserved_day, year_month,
+            slot_array.to_reserved_info(slots), total_reserved_number,
+            get_vacancy_flg(
+                total_reserved_number / shop_model.max_reservable_number)
+            if shop_model.max_reservable_number else 0,
+            ledger_reserved_number=total_reserved_number)
+        days.append({'reservedDay': reserved_day,
+                     'totalReservedNumber': total_reserved_number,
+                     'maxReservableNumber': shop_model.max_reservable_number})
+    shop_reservation_table_controller.rebuild_summary(
+        shop_id, year_month, shop_model.max_reservable_number,
+        shop_model.shard_count)
+    return days
+
+
+def lambda_handler(event, context):
+    """
+    予約台帳のストリームの予約イベントを、店舗の予約状況と月間カレンダーの集計に
+    まとめて反映する
+    ※店舗・予約日ごとに1回のトランザクションで反映し、
+    失敗した店舗・予約日がある場合は、その最初のレコードをbatchItemFailuresで返却する。
+    ストリームのチェックポイントはそのレコードの前まで進み、以降のレコードは
+    再送される(反映済みのイベントは除外される)
+
+    Parameters
+    ----------
+    event : dict
+        DynamoDBストリームのレコード
+    context : __main__.LambdaContext
+        Lambdaランタイムや関数名等のメタ情報
+
+    Returns
+    -------
+    response: dict
+        batchItemFailures: 反映に失敗したレコードのシーケンス番号
+    """
+    day_events = group_stream_events(event.get('Records', []))
+    failures = []
+    for (shop_id, reserved_day), sequenced_events in day_events.items():
+        ledger_events = [ledger_event for _, ledger_event in sequenced_events]
+        try:
+            applied_count = apply_day_events(
+                shop_id, reserved_day, ledger_events)
+            if applied_count:
+                check_seats(shop_id, reserved_day, ledger_events)
+        except Exception as e:
+            logger.exception('予約イベントの反映でエラーが発生しました。'
+                             'shopId: %s, reservedDay: %s', shop_id,
+                             reserved_day)
+            logger.exception('Error details: %s', e)
+            failures.append(min(
+                sequence_number for sequence_number, _ in sequenced_events))
+            continue
+        logger.info('shopId: %s, reservedDay: %s 予約イベント%d件を反映',
+                    shop_id, reserved_day, applied_count)
+
+    return {'batchItemFailures': [
+        {'itemIdentifier': str(sequence_number)}
+        for sequence_number in sorted(failures)]}
+
+
+def replay_handler(event, context):
+    """
+    予約台帳から店舗の予約状況と月間カレンダーの集計を作り直す
+    台帳モード(RESERVATION_WRITE_MODE=ledger)への移行手順:
+    1. 予約台帳テーブルと、そのストリームを集計するreservation_ledger_applyを
+       デプロイする
+    2. reservation_putをRESERVATION_WRITE_MODE=ledgerに切り替える
+       (切り替え前に登録された予約は予約状況に残り、台帳の予約はそこに加算される)
+    3. 再集計は予約状況の修復が必要な場合のみ、ストリームの集計を停止して実行する
+       (台帳以外の予約を含む日は作り直さずに残す。replay_shop_monthを参照)
+
+    Parameters
+    ----------
+    event : dict
+        shopIds : list of int, optional
+            対象の店舗ID, 指定しない場合は全店舗
+        fromYearMonth : str, optional
+            開始年月(YYYY-MM), 指定しない場合は当月
+        months : int, optional
+            月数, 指定しない場合はDEFAULT_REPLAY_MONTHS
+    context : __main__.LambdaContext
+        Lambdaランタイムや関数名等のメタ情報
+    """
+    event = event or {}
+    from_year_month = event.get('fromYearMonth') or datetime.datetime.now(
+        gettz('Asia/Tokyo')).strftime('%Y-%m')
+    year_months = get_year_months(
+        from_year_month, int(event.get('months', DEFAULT_REPLAY_MONTHS)))
+
+    shop_ids = event.get('shopIds')
+    if not shop_ids:
+        shop_ids = [int(shop['shopId']) for shop
+                    in shop_master_table_controller.scan(attributes=['shopId'])]
+
+    for shop_id in shop_ids:
+        # 途中でエラーが発生しても後続の店舗は処理する
+        try:
+            for year_month in year_months:
+                replay_shop_month(int(shop_id), year_month)
+        except Exception as e:
+            logger.exception('予約台帳の再集計でエラーが発生しました。'
+                             'shopId: %s', shop_id)
+            logger.exception('Error details: %s', e)
+            continue
+        logger.info('shopId: %s 再集計完了 (%s - %s)',
+                    shop_id, year_months[0], year_months[-1])
@@ -2,15 +2,20 @@ import logging
 import json
 import os
 import datetime
+import uuid
 
-import flex_message_builder
-from common import (common_const, line, utils)
+from aws.dynamodb import transaction
+from common import (common_const, flex_message_builder, line, utils)
 from validation.restaurant_param_check import RestaurantParamCheck
 # DynamoDB操作クラスのインポート
 from common.channel_access_token import ChannelAccessToken
 from common.remind_message import RemindMessage
+from restaurant import slot_array
+from restaurant.reservation_ledger import ReservationLedger
 from restaurant.restaurant_reservation_info import RestaurantReservationInfo
-from restaurant.restaurant_shop_reservation import RestaurantShopReservation
+from restaurant.restaurant_shop_reservation import (
+    get_reserved_info_attributes, RestaurantShopReservation,
+    SlotCapacityExceededError)
 from restaurant.restaurant_shop_master import RestaurantShopMaster
 
 
@@ -18,6 +23,11 @@ from restaurant.restaurant_shop_master import RestaurantShopMaster
 REMIND_DATE_DIFFERENCE = int(os.getenv('REMIND_DATE_DIFFERENCE'))
 CHANNEL_ID = os.getenv('OA_CHANNEL_ID')
 LIFF_CHANNEL_ID = os.getenv('LIFF_CHANNEL_ID')
+# 店舗の予約状況の更新方法
+# inline: 予約のトランザクションで予約状況を更新する(既定値)
+# ledger: 予約台帳に予約イベントを追記し、予約状況は台帳のストリームから非同期に集計する
+# (移行手順はreservation_ledger_apply.replay_handlerを参照)
+RESERVATION_WRITE_MODE = os.getenv('RESERVATION_WRITE_MODE', 'inline')
 
 # ログ出力の設定
 LOGGER_LEVEL = os.environ.get("LOGGER_LEVEL")
@@ -28,240 +38,268 @@ else:
     logger.setLevel(logging.INFO)
 
 # 定数の宣言
-THIRTY_MINUTES = datetime.timedelta(minutes=30)
 ONE_WEEK = datetime.timedelta(days=7)
 JST_UTC_TIMEDELTA = datetime.timedelta(hours=9)
-VACANCY_FLG_MAP = {'AVAILABLE_NOTHING': 0,
-                   'AVAILABLE_MUCH': 1, 'AVAILABLE_FEW': 2}
-RESERVED_PROPORTION_MAP = {'RESERVED_MUCH': 0.8, 'RESERVED_FULL': 1}
 ON_DAY_REMIND_DATE_DIFFERENCE = 0
+# トランザクション内の店舗予約状況の更新アクションの位置
+SHOP_RESERVATION_ACTION_INDEX = 0
 
 # テーブル操作クラスの初期化
 shop_master_table_controller = RestaurantShopMaster()
 reservation_info_table_controller = RestaurantReservationInfo()
 shop_reservation_table_controller = RestaurantShopReservation()
+reservation_ledger_table_controller = ReservationLedger() \
+    if RESERVATION_WRITE_MODE == 'ledger' else None
 channel_access_token_table_controller = ChannelAccessToken()
 message_table_controller = RemindMessage()
 
 
-def put_customer_reservation_info(body, shop_info):
+def commit_reservation(body, shop_model):
     """
-    顧客予約情報テーブルに予約情報の登録を行う。
+    店舗の予約状況、月間カレンダーの集計、顧客予約情報、リマインドメッセージ2件を
+    1回のトランザクションでまとめて登録する。
+    いずれかの登録に失敗した場合は全て登録されない。
+    他の予約と競合した場合は一定回数まで再実行し、
+    席数を超える時間帯がある場合は再実行せずに満席エラーとする。
+    店舗の予約状況がシャードに分割されている場合、予約IDのハッシュで選んだ
+    シャードに登録し、そのシャードの席数を超える場合は次のシャードで再度登録する。
+    (全シャードで席数を超える場合に満席エラーとする)
+    以前の形式(reservedInfo)の予約状況が残っているシャードは、
+    条件チェックで失敗した時点で予約人数のカウンターに移行し、同じシャードで再度登録する。
 
     Parameters
     ----------
     body : dict
         ユーザーが選択した予約情報
-    shop_info: dict
-        予約する店舗の情報
+    shop_model: restaurant.shop_model.ShopModel
+        予約する店舗の予約モデル
 
     Returns
     -------
     reservation_id: str
         予約情報を一意に判別するID
-    """
-
-    customer_reservation_item = {
-        "shop_id": body['shopId'],
-        "shop_name": body['shopName'],
-        "user_id": body['userId'],
-        "user_name": body['userName'],
-        "course_id": body['courseId'],
-        "course_name": body['courseName'],
-        "reservation_people_number": body['reservationPeopleNumber'],
-        "reservation_date": body['reservationDate'],
-        "reservation_starttime": body['reservationStarttime'],
-        "reservation_endtime": body['reservationEndtime'],
-        "amount": get_course_price(shop_info, body['courseId']),
-    }
-    reservation_id = reservation_info_table_controller.put_item(
-        **customer_reservation_item)
-    return reservation_id
 
-
-def get_course_price(shop_info, course_id):
+    Raises
+    ------
+    SlotCapacityExceededError
+        予約する時間帯に空席がない場合
+    """
+    reservation_id, customer_reservation_action = \
+        create_customer_reservation_action(body, shop_model)
+    other_actions = [customer_reservation_action]
+    other_actions.extend(
+        create_push_message_actions(body, REMIND_DATE_DIFFERENCE))
+
+    for shard in shop_model.shard_order(reservation_id):
+        try:
+            actions = [
+                create_shop_reservation_action(body, shop_model, shard),
+                create_calendar_summary_action(body, shop_model, shard),
+            ] + other_actions
+        except SlotCapacityExceededError:
+            # 予約人数がシャードの席数を超えている
+            continue
+
+        # 予約IDとシャードから作成したIDを冪等性トークンとし、
+        # リトライ時の二重登録を防ぐ
+        client_request_token = str(
+            uuid.uuid5(uuid.UUID(reservation_id), str(shard)))
+        migrated = False
+        while True:
+            try:
+                transaction.transact_write_items(
+                    actions, client_request_token=client_request_token)
+            except transaction.TransactionCanceledError as e:
+                if e.reasons[SHOP_RESERVATION_ACTION_INDEX] != 'ConditionalCheckFailed':  # noqa:E501
+                    raise e
+                # 以前の形式の予約状況を移行した場合は同じシャードで再度登録する
+                if not migrated and \
+                        shop_reservation_table_controller.migrate_legacy_slots(
+                            body['shopId'], body['reservationDate'],
+                            e.items[SHOP_RESERVATION_ACTION_INDEX], shard):
+                    migrated = True
+                    continue
+                break
+            return reservation_id
+
+    raise SlotCapacityExceededError(
+        body['shopId'], body['reservationDate'],
+        [body['reservationStarttime']])
+
+
+def commit_reservation_to_ledger(body, shop_model):
     """
-    店舗情報のテーブルから、コースの値段を取得する。
+    予約台帳への予約イベントの追記、顧客予約情報、リマインドメッセージ2件を
+    1回のトランザクションでまとめて登録する。(RESERVATION_WRITE_MODE=ledger)
+    店舗の予約状況は更新せず、予約ごとに新しい項目を追記するだけのため、
+    同じ日の予約同士で競合しない。
+    空席は集計済みの予約状況で確認する(集計前の予約は含まれない)。
 
     Parameters
     ----------
-    shop_info: dict
-        shop_idを指定した取得した店舗の情報
-    course_id : int
-        予約するコースのID
+    body : dict
+        ユーザーが選択した予約情報
+    shop_model: restaurant.shop_model.ShopModel
+        予約する店舗の予約モデル
 
     Returns
     -------
-    course_price: int
-        コースの値段
-    """
-    course_price = [course_list['price']
-                    for course_list in shop_info['course']
-                    if course_list['courseId'] == course_id]
+    reservation_id: str
+        予約情報を一意に判別するID
 
-    if not course_price:
-        return 0
-    return course_price[0]
+    Raises
+    ------
+    SlotCapacityExceededError
+        予約する時間帯に空席がない場合
+    """
+    reserved_start_times = shop_model.slot_start_times(
+        body['reservationStarttime'], body['reservationEndtime'])
+    reserved_day = shop_reservation_table_controller.get_item(
+        body['shopId'], body['reservationDate'],
+        attributes=get_reserved_info_attributes(reserved_start_times))
+    day_slots = reserved_day.get('reservedSlots') or slot_array.new_slots()
+    if any(day_slots[slot_array.slot_index(start_time)]
+           + body['reservationPeopleNumber'] > shop_model.seats_number
+           for start_time in reserved_start_times):
+        raise SlotCapacityExceededError(
+            body['shopId'], body['reservationDate'],
+            [body['reservationStarttime']])
+
+    reservation_id, customer_reservation_action = \
+        create_customer_reservation_action(body, shop_model)
+    actions = [
+        reservation_ledger_table_controller.create_append_action(
+            shop_id=body['shopId'],
+            reservation_id=reservation_id,
+            reserved_day=body['reservationDate'],
+            reserved_start_times=reserved_start_times,
+            reservation_people_number=body['reservationPeopleNumber'],
+            max_reservable_number=shop_model.max_reservable_number,
+            seats_number=shop_model.seats_number,
+        ),
+        customer_reservation_action,
+    ]
+    actions.extend(
+        create_push_message_actions(body, REMIND_DATE_DIFFERENCE))
+
+    # 予約IDを冪等性トークンとし、リトライ時の二重登録を防ぐ
+    transaction.transact_write_items(
+        actions, client_request_token=reservation_id)
+    return reservation_id
 
 
-def put_shop_reservation_info(body, shop_info):
+def create_customer_reservation_action(body, shop_model):
     """
-    カレンダーに予約情報を登録する。
-    既に指定した月日に予約情報がある場合、Updateを行い、
-    予約情報がない場合、Insertを行う。
+    顧客予約情報テーブルに予約情報を登録するアクションを作成する。
 
     Parameters
     ----------
     body : dict
         ユーザーが選択した予約情報
-    shop_info: dict
-        shop_idを指定した取得した店舗の情報
+    shop_model: restaurant.shop_model.ShopModel
+        予約する店舗の予約モデル
+
+    Returns
+    -------
+    reservation_id: str
+        予約情報を一意に判別するID
+    action: dict
+        トランザクションで実行するPutアクション
     """
-    # shopIdと予約日でそのデータがあるか検索する
-    reservation_item = shop_reservation_table_controller.get_item(
-        body['shopId'], body['reservationDate'])
 
-    new_reservation_list, new_total_reserved_number = divide_thirty_minutes(
-        body['reservationStarttime'], body['reservationEndtime'],
-        body['reservationPeopleNumber']
-    )
+    customer_reservation_item = {
+        "shop_id": body['shopId'],
+        "shop_name": body['shopName'],
+        "user_id": body['userId'],
+        "user_name": body['userName'],
+        "course_id": body['courseId'],
+        "course_name": body['courseName'],
+        "reservation_people_number": body['reservationPeopleNumber'],
+        "reservation_date": body['reservationDate'],
+        "reservation_starttime": body['reservationStarttime'],
+        "reservation_endtime": body['reservationEndtime'],
+        "amount": shop_model.course_price(body['courseId']),
+    }
+    return reservation_info_table_controller.create_put_item_action(
+        **customer_reservation_item)
+
 
-    # 店舗の1日の予約可能人数を算出する 計算:席数*営業時間の30分区切り
-    openTime = datetime.datetime.strptime(
-        shop_info['shop']['openTime'], "%H:%M")
-    closeTime = datetime.datetime.strptime(
-        shop_info['shop']['closeTime'], "%H:%M")
-    restaurant_open_term = int((closeTime - openTime) / THIRTY_MINUTES)
-    max_reservable_number = int(
-        shop_info['shop']['seatsNumber']) * restaurant_open_term
-
-    # if->指定した予約日に予約情報がある場合：更新
-    # else->指定した予約日に予約情報がない場合：新規作成
-    if reservation_item:
-        # 新規データと元データを統合するため、重複している時間の検索用に
-        # 予約開始時刻をkeyとして予約情報をvalueに持ったデータを作成する。
-        start_time_index = {}
-        for reserved_time_info in reservation_item['reservedInfo']:
-            start_time_index[reserved_time_info['reservedStartTime']
-                             ] = reserved_time_info
-
-        # if->予約がある時間帯：予約人数を足す
-        # else->予約が無い時間帯：その時間を新たに追加する
-        for new_reservation_info in new_reservation_list:
-            reservation_start_time = new_reservation_info['reservedStartTime']
-            if reservation_start_time in start_time_index:
-                start_time_index[reservation_start_time]['reservedNumber'] +=\
-                    new_reservation_info['reservedNumber']
-            else:
-                start_time_index[reservation_start_time] = new_reservation_info
-
-        # 一日の予約合計数と席数に対する予約合計数の比率を算出する(カレンダーの空き状況出力時に使用)
-        sum_total_reserved_number = reservation_item['totalReservedNumber'] + \
-            new_total_reserved_number
-        reserved_proportion = sum_total_reserved_number / max_reservable_number
-
-        key = {
-            'shop_id': body['shopId'],
-            'reserved_day': body['reservationDate']
-        }
-        update_value = {
-            'reserved_info': list(start_time_index.values()),
-            'total_reserved_number': sum_total_reserved_number,
-            'vacancy_flg': get_vacancy_flg(reserved_proportion)
-        }
-        shop_reservation_table_controller.update_item(**key, **update_value)
-    else:
-        # 席数に対する予約合計数の比率を算出する(カレンダーの空き状況出力時に使用)
-        reserved_proportion = new_total_reserved_number / max_reservable_number
-        new_reservation_item = {
-            'shop_id': body['shopId'],
-            'reserved_day': body['reservationDate'],
-            'reserved_year_month': utils.format_date(body['reservationDate'],
-                                                     '%Y-%m-%d', '%Y-%m'),
-            'reserved_info': new_reservation_list,
-            'total_reserved_number': new_total_reserved_number,
-            'vacancy_flg': get_vacancy_flg(reserved_proportion),
-        }
-        shop_reservation_table_controller.put_item(**new_reservation_item)
-
-
-def divide_thirty_minutes(reservation_start_time, reservation_end_time,
-                          reservation_people_number):
+def create_shop_reservation_action(body, shop_model, shard=0):
     """
-    数時間単位の予約情報を、30分単位の予約情報に分割し、listで返却する。
-    データ:予約開始時間,予約終了時間,予約人数
+    カレンダーに予約情報を登録するアクションを作成する。
+    30分毎の予約人数と予約合計数はADDで加算するため、
+    既存の予約情報の読み込みは行わない。
+    （指定した月日に予約情報がない場合は新規作成される）
+    30分毎の予約人数がシャードの席数を超える場合、アクションの条件チェックで失敗する。
 
     Parameters
     ----------
-    reservation_start_time : str
-        予約の希望開始時間
-    reservation_end_time : str
-        予約の希望終了時間
-    reservation_people_number : int
-        予約人数
+    body : dict
+        ユーザーが選択した予約情報
+    shop_model: restaurant.shop_model.ShopModel
+        予約する店舗の予約モデル
+    shard : int, optional
+        予約を登録するシャード, by default 0
 
     Returns
     -------
-    reservation_info_list: list
-        30分単位に分割された予約情報。
-        すべての時間帯で、予約人数は同じになる。
-    total_people_number: int
-        30分ごとの予約人数の合計
+    action: dict
+        トランザクションで実行するUpdateアクション
+
+    Raises
+    ------
+    SlotCapacityExceededError
+        予約人数がシャードの席数を超えている場合
     """
+    # カレンダーの空き状況は予約合計数と1日の予約可能人数から算出する
+    # (1日の予約可能人数は店舗全体の値を全シャードに登録する)
+    return shop_reservation_table_controller.create_add_reservation_action(
+        shop_id=body['shopId'],
+        reserved_day=body['reservationDate'],
+        reserved_start_times=shop_model.slot_start_times(
+            body['reservationStarttime'], body['reservationEndtime']),
+        reservation_people_number=body['reservationPeopleNumber'],
+        max_reservable_number=shop_model.max_reservable_number,
+        seats_number=shop_model.shard_seats_number(shard),
+        shard=shard,
+    )
+
 
-    start_time = datetime.datetime.strptime(
-        reservation_start_time, "%H:%M")
-    end_time = datetime.datetime.strptime(
-        reservation_end_time, "%H:%M")
-    thirty_minutes = datetime.timedelta(minutes=30)
-
-    # 時間のデータを30分毎の時間に分割してリストを作成する。
-    reservation_info_list = []
-    tmp_start_time = start_time
-    tmp_end_time = start_time + thirty_minutes
-    total_people_number = 0
-    while tmp_end_time <= end_time:
-        reservation_info = {
-            'reservedStartTime': tmp_start_time.strftime('%H:%M'),
-            'reservedEndTime': tmp_end_time.strftime('%H:%M'),
-            'reservedNumber': reservation_people_number
-        }
-        reservation_info_list.append(reservation_info)
-
-        total_people_number += reservation_people_number
-        tmp_start_time += thirty_minutes
-        tmp_end_time += thirty_minutes
-
-    return reservation_info_list, total_people_number
-
-
-def get_vacancy_flg(reserved_proportion):
+def create_calendar_summary_action(body, shop_model, shard=0):
     """
-    予約割合から判断し、空き状況のフラグを取得する。
+    店舗の月間カレンダーの集計に予約人数を加算するアクションを作成する。
+    (カレンダーの空き状況は予約日の予約合計数と1日の予約可能人数から算出する)
 
     Parameters
     ----------
-    reserved_proportion : float
-        予約数/席数で計算した予約済み率
+    body : dict
+        ユーザーが選択した予約情報
+    shop_model: restaurant.shop_model.ShopModel
+        予約する店舗の予約モデル
+    shard : int, optional
+        予約を登録するシャード, by default 0
 
     Returns
     -------
-    vacancy_flg: int
-        空き状況フラグ
+    action: dict
+        トランザクションで実行するUpdateアクション
     """
-    if(reserved_proportion < RESERVED_PROPORTION_MAP['RESERVED_MUCH']):
-        vacancy_flg = VACANCY_FLG_MAP['AVAILABLE_MUCH']
-    elif(reserved_proportion >= RESERVED_PROPORTION_MAP['RESERVED_MUCH'] and
-         reserved_proportion < RESERVED_PROPORTION_MAP['RESERVED_FULL']):
-        vacancy_flg = VACANCY_FLG_MAP['AVAILABLE_FEW']
-    else:
-        vacancy_flg = VACANCY_FLG_MAP['AVAILABLE_NOTHING']
-    return vacancy_flg
+    reserved_start_times = shop_model.slot_start_times(
+        body['reservationStarttime'], body['reservationEndtime'])
+    return shop_reservation_table_controller.create_add_summary_action(
+        shop_id=body['shopId'],
+        reserved_day=body['reservationDate'],
+        total_reserved_number=body['reservationPeopleNumber'] * len(
+            reserved_start_times),
+        max_reservable_number=shop_model.max_reservable_number,
+        shard=shard,
+    )
 
 
-def create_flex_message(body, remind_date_difference):
+def create_template_params(body, remind_date_difference):
     """
-    LINEメッセージで送信するフレックスメッセージを作成する
+    LINEメッセージで送信するフレックスメッセージのテンプレートの引数を作成する
+    ※メッセージはリマインドの送信時にテンプレートから作成する
 
     Parameters
     ----------
@@ -272,8 +310,8 @@ def create_flex_message(body, remind_date_difference):
 
     Returns
     -------
-    flex_message : str
-        フレックスメッセージの形式に整形したjson型データ
+    template_params : list
+        リマインド通知のテンプレート(REMIND_TEMPLATE_ID)の引数
     """
     reservation_datetime = body['reservationDate'] + ' ' + \
         body['reservationStarttime'] + '-' + body['reservationEndtime']
@@ -284,14 +322,16 @@ def create_flex_message(body, remind_date_difference):
                 'number_of_people': str(body['reservationPeopleNumber']),
                 'remind_date_difference': remind_date_difference
                 }
-    flex_message = flex_message_builder.create_restaurant_remind(**flex_prm)
+    template_params = flex_message_builder.create_template_params(
+        flex_message_builder.REMIND_TEMPLATE_ID, **flex_prm)
 
-    return flex_message
+    return template_params
 
 
 def get_channel_access_token(channel_id):
     """
     短期チャネルアクセストークンをチャネル情報のテーブルから取得する
+    ※期限日までウォームスタート間でキャッシュしたトークンを使用する
 
     Parameters
     ----------
@@ -304,14 +344,14 @@ def get_channel_access_token(channel_id):
     channelAccessToken : str
         access_token:短期のチャネルアクセストークン
     """
-    item = channel_access_token_table_controller.get_item(channel_id)
-    return item['channelAccessToken']
+    return channel_access_token_table_controller.get_channel_access_token(
+        channel_id)
 
 
-def put_push_messages_to_dynamo(body, remind_date_difference):
+def create_push_message_actions(body, remind_date_difference):
     """
-    プッシュメッセージのメッセージ情報を作成し、DynamoDBに登録する。
-    DynamoDBへの登録処理自体は共通処理にて行っている。
+    プッシュメッセージのメッセージ情報を作成し、
+    DynamoDBに登録するアクションを作成する。
 
     Parameters
     ----------
@@ -320,22 +360,41 @@ def put_push_messages_to_dynamo(body, remind_date_difference):
     remind_date_difference : int
         当日以前のリマインド行う日付の差分
         予約日以降のメッセージ送信を考慮し、マイナス値を許可（ex:3日前→-3）
+
+    Returns
+    -------
+    actions: list of dict
+        当日分と指定日分のメッセージを登録するPutアクション
     """
     remind_date_on_day = body['reservationDate']
 
-    # 当日のリマインドメッセージを登録
-    flex_message_on_day = create_flex_message(body, ON_DAY_REMIND_DATE_DIFFERENCE)  # noqa:E501
-    message_table_controller.put_push_message(
-        body['userId'], CHANNEL_ID, flex_message_on_day,
-        remind_date_on_day)
+    # 当日のリマインドメッセージ
+    template_params_on_day = create_template_params(body, ON_DAY_REMIND_DATE_DIFFERENCE)  # noqa:E501
+    push_message_on_day = {
+        'user_id': body['userId'],
+        'channel_id': CHANNEL_ID,
+        'template_id': flex_message_builder.REMIND_TEMPLATE_ID,
+        'template_params': template_params_on_day,
+        'remind_date': remind_date_on_day,
+    }
 
-    # 指定日のリマインドメッセージを登録
-    flex_message_day_before = create_flex_message(body, remind_date_difference)  # noqa:E501
+    # 指定日のリマインドメッセージ
+    template_params_day_before = create_template_params(body, remind_date_difference)  # noqa:E501
     remind_date_day_before = utils.calculate_date_str_difference(
         remind_date_on_day, remind_date_difference)
-    message_table_controller.put_push_message(
-        body['userId'], CHANNEL_ID, flex_message_day_before,
-        remind_date_day_before)
+    push_message_day_before = {
+        'user_id': body['userId'],
+        'channel_id': CHANNEL_ID,
+        'template_id': flex_message_builder.REMIND_TEMPLATE_ID,
+        'template_params': template_params_day_before,
+        'remind_date': remind_date_day_before,
+    }
+
+    return [
+        message_table_controller.create_put_template_message_action(
+            **push_message)
+        for push_message in [push_message_on_day, push_message_day_before]
+    ]
 
 
 def lambda_handler(event, context):
@@ -382,14 +441,26 @@ def lambda_handler(event, context):
         return utils.create_error_response(error_msg_disp, 400)
 
     try:
-        # 予約情報のデータ登録
-        shop_info = shop_master_table_controller.get_item(body['shopId'])
-        put_shop_reservation_info(body, shop_info)
-        reservation_id = put_customer_reservation_info(body, shop_info)
-
-        # pushメッセージをDynamoに保存
-        put_push_messages_to_dynamo(body, REMIND_DATE_DIFFERENCE)
+        shop_model = shop_master_table_controller.get_model(body['shopId'])
+        if shop_model is None:
+            raise Exception('Shop not found: %s' % body['shopId'])
+        # 営業時間内の30分枠に収まらない予約は受け付けない
+        if not shop_model.is_bookable(body['reservationStarttime'],
+                                      body['reservationEndtime']):
+            error_msg_disp = common_const.const.MSG_ERROR_OUT_OF_BUSINESS_HOURS
+            logger.error(error_msg_disp)
+            return utils.create_error_response(error_msg_disp, 400)
+
+        # 予約情報とpushメッセージのデータ登録
+        if RESERVATION_WRITE_MODE == 'ledger':
+            reservation_id = commit_reservation_to_ledger(body, shop_model)
+        else:
+            reservation_id = commit_reservation(body, shop_model)
 
+    except SlotCapacityExceededError as e:
+        logger.info('満席のため予約できません: %s', e)
+        error_msg_disp = common_const.const.MSG_ERROR_FULLY_BOOKED
+        return utils.create_error_response(error_msg_disp, 409)
     except Exception as e:
         logger.error('Occur Exception: %s', e)
         return utils.create_error_response('ERROR')
@@ -3,7 +3,9 @@ import json
 import os
 from common import (common_const, utils)
 from validation.restaurant_param_check import RestaurantParamCheck
-from restaurant.restaurant_shop_reservation import RestaurantShopReservation
+from restaurant.restaurant_shop_master import RestaurantShopMaster
+from restaurant.restaurant_shop_reservation import (
+    get_reserved_info_attributes, RestaurantShopReservation)
 
 # ログ出力の設定
 LOGGER_LEVEL = os.environ.get("LOGGER_LEVEL")
@@ -14,9 +16,52 @@ else:
     logger.setLevel(logging.INFO)
 
 # テーブル操作クラスの初期化
+shop_master_table_controller = RestaurantShopMaster()
 shop_reservation_table_controller = RestaurantShopReservation()
 
 
+def get_shop_model(shop_id):
+    """
+    店舗の予約モデルを取得する
+
+    Parameters
+    ----------
+    shop_id : str
+        予約する店舗のID
+
+    Returns
+    -------
+    shop_model : restaurant.shop_model.ShopModel
+        店舗の予約モデル
+    """
+    shop_model = shop_master_table_controller.get_model(int(shop_id))
+    if shop_model is None:
+        raise Exception('Shop not found: %s' % shop_id)
+    return shop_model
+
+
+def get_day_reserved_info(shop_model, preferred_day):
+    """
+    指定日の予約情報を取得する(店舗の営業時間の30分枠のみ)
+
+    Parameters
+    ----------
+    shop_model : restaurant.shop_model.ShopModel
+        予約する店舗の予約モデル
+    preferred_day : str
+        予約する日付
+
+    Returns
+    -------
+    day_reserved_info: dict
+        指定日の予約情報(予約がない場合は空)
+    """
+    key = {'shop_id': shop_model.shop_id, 'reserved_day': preferred_day}
+    return shop_reservation_table_controller.get_item(
+        **key, attributes=get_reserved_info_attributes(
+            shop_model.slot_start_times()))
+
+
 def get_reservation_time(shop_id, preferred_day):
     """
     予約済み時間の情報を取得する
@@ -37,20 +82,63 @@ def get_reservation_time(shop_id, preferred_day):
     -------
     指定日に予約がない場合、空のリストを返す
     """
-    # 指定日の予約情報を取得
-    key = {'shop_id': int(shop_id), 'reserved_day': preferred_day}
-    day_reserved_info = shop_reservation_table_controller.get_item(**key)
+    day_reserved_info = get_day_reserved_info(
+        get_shop_model(shop_id), preferred_day)
+
+    # 指定日の予約がない場合(営業時間内の予約がない場合を含む)空のリストを返す
+    return day_reserved_info.get('reservedInfo', [])
+
+
+def get_available_start_times(shop_id, preferred_day, course_id,
+                              people_number):
+    """
+    コースと人数で予約できる開始時刻と、30分枠ごとの残席数を取得する
 
-    # 指定日の予約がない場合空のリストを返す
-    if not day_reserved_info:
-        return []
+    Parameters
+    ----------
+    shop_id : str
+        予約する店舗のID
+    preferred_day : str
+        予約する日付
+    course_id : str
+        予約するコースのID
+    people_number : str
+        予約人数
 
-    return day_reserved_info['reservedInfo']
+    Returns
+    -------
+    available_info: dict
+        startTimes: 予約できる開始・終了時刻のリスト
+        remainingSeats: 営業時間の30分枠ごとの残席数のリスト
+        (コースが存在しない場合はNone)
+    """
+    shop_model = get_shop_model(shop_id)
+    course_minutes = shop_model.course_minutes(course_id)
+    if course_minutes is None:
+        return None
+
+    day_reserved_info = get_day_reserved_info(shop_model, preferred_day)
+    day_slots = day_reserved_info.get('reservedSlots') \
+        if day_reserved_info else None
+    start_times = shop_model.feasible_start_times(
+        day_slots, course_id, int(people_number))
+    remaining_seats = [
+        {
+            'reservedStartTime': shop_model.slot_time(slot),
+            'reservedEndTime': shop_model.slot_time(slot + 1),
+            'remainingNumber': remaining_number,
+        }
+        for slot, remaining_number
+        in enumerate(shop_model.remaining_seats(day_slots))
+    ]
+    return {'courseMinutes': course_minutes, 'startTimes': start_times,
+            'remainingSeats': remaining_seats}
 
 
 def lambda_handler(event, context):
     """
     DynamoDBテーブルから日ごとの予約情報一覧を取得して返却する
+    コースIDと予約人数を指定した場合は、予約できる開始時刻と残席数を返却する
 
     Parameters
     ----------
@@ -80,12 +168,22 @@ def lambda_handler(event, context):
         return utils.create_error_response(error_msg_disp, status=400)  # noqa: E501
 
     try:
-        day_reserved_list = get_reservation_time(
-            req_param['shopId'], req_param['preferredDay'])
+        if 'courseId' in req_param:
+            # コースと人数を指定した場合は予約できる開始時刻のみ返却する
+            response_body = get_available_start_times(
+                req_param['shopId'], req_param['preferredDay'],
+                req_param['courseId'], req_param['reservationPeopleNumber'])
+            if response_body is None:
+                error_msg_disp = common_const.const.MSG_ERROR_NO_COURSE
+                logger.error(error_msg_disp)
+                return utils.create_error_response(error_msg_disp, 400)
+        else:
+            response_body = get_reservation_time(
+                req_param['shopId'], req_param['preferredDay'])
     except Exception as e:
         logger.exception('Occur Exception: %s', e)
         return utils.create_error_response('ERROR')
 
     return utils.create_success_response(json.dumps(
-        day_reserved_list, default=utils.decimal_to_int,
+        response_body, default=utils.decimal_to_int,
         ensure_ascii=False))
@@ -15,6 +15,10 @@ if LOGGER_LEVEL == 'DEBUG':
 else:
     logger.setLevel(logging.INFO)
 
+# 空き状況の算出に使用する属性
+CALENDAR_ATTRIBUTES = ['reservedDay', 'vacancyFlg',
+                       'totalReservedNumber', 'maxReservableNumber']
+
 # テーブル操作クラスの初期化
 shop_reservation_table_controller = RestaurantShopReservation()
 
@@ -22,7 +26,9 @@ shop_reservation_table_controller = RestaurantShopReservation()
 def get_shop_calendar(shop_id, preferred_year_month):
     """
     店舗の予約情報カレンダーを取得する。
-
+    月間カレンダーの集計(シャードを含む)を1回のqueryで取得し、
+    集計がない(日ごとの予約情報から再作成されていない)月のみ
+    日ごとの予約情報から作成する。
 
     Parameters
     ----------
@@ -38,31 +44,178 @@ def get_shop_calendar(shop_id, preferred_year_month):
         予約情報が存在する日の空き状況
 
     """
-    shop_calendar = shop_reservation_table_controller.query_index_shop_id_reserved_year_month(  # noqa:E501
-        int(shop_id), preferred_year_month
-    )
+    vacancy_flgs = shop_reservation_table_controller.get_summary(
+        int(shop_id), preferred_year_month)
+    if vacancy_flgs is None:
+        return get_shop_calendars_from_days(
+            shop_id, preferred_year_month,
+            preferred_year_month)[preferred_year_month]
+
+    return create_calendar(preferred_year_month, vacancy_flgs)
+
+
+def get_shop_calendars(shop_id, from_year_month, to_year_month):
+    """
+    複数月の店舗の予約情報カレンダーを取得する。
+    月間カレンダーの集計(シャードを含む)を1回の範囲指定のqueryで取得し、
+    集計がない(日ごとの予約情報から再作成されていない)月のみ
+    日ごとの予約情報から1回のqueryで作成する。
+
+    Parameters
+    ----------
+    shop_id : str
+        店舗ID
+    from_year_month : str
+        カレンダーの開始年月
+        YYYY-MM の形式
+    to_year_month : str
+        カレンダーの終了年月
+        YYYY-MM の形式
+
+    Returns
+    -------
+    result_calendars: dict
+        年月をキーとした、予約情報が存在する日の空き状況
+        (予約情報がない月も空の空き状況を含む)
+
+    """
+    year_months = get_year_months(from_year_month, to_year_month)
+    summaries = shop_reservation_table_controller.get_summaries(
+        int(shop_id), year_months)
+
+    result_calendars = {}
+    missing_year_months = []
+    for year_month in year_months:
+        if year_month in summaries:
+            result_calendars[year_month] = create_calendar(
+                year_month, summaries[year_month])
+        else:
+            missing_year_months.append(year_month)
+
+    if missing_year_months:
+        calendars = get_shop_calendars_from_days(
+            shop_id, missing_year_months[0], missing_year_months[-1])
+        for year_month in missing_year_months:
+            result_calendars[year_month] = calendars[year_month]
+
+    return {year_month: result_calendars[year_month]
+            for year_month in year_months}
+
+
+def create_calendar(year_month, vacancy_flgs):
+    """
+    月間カレンダーの集計から予約情報カレンダーを作成する。
+
+    Parameters
+    ----------
+    year_month : str
+        年月(YYYY-MM)
+    vacancy_flgs : list of int
+        日ごとの空き状況(予約がない日はNone)
+
+    Returns
+    -------
+    result_calendar: dict
+        予約情報が存在する日の空き状況
 
-    result_calendar = {
-        'reservedYearMonth': preferred_year_month, 'reservedDays': []
+    """
+    return {
+        'reservedYearMonth': year_month,
+        'reservedDays': [
+            {'day': day, 'vacancyFlg': vacancy_flg}
+            for day, vacancy_flg in enumerate(vacancy_flgs, start=1)
+            if vacancy_flg is not None
+        ],
     }
 
-    if not shop_calendar:
-        return result_calendar
 
+def get_shop_calendars_from_days(shop_id, from_year_month, to_year_month):
+    """
+    日ごとの予約情報から、複数月の店舗の予約情報カレンダーを
+    1回のqueryで作成する。
+
+    Parameters
+    ----------
+    Same as get_shop_calendars
+
+    Returns
+    -------
+    result_calendars: dict
+        年月をキーとした、予約情報が存在する日の空き状況
+        (予約情報がない月も空の空き状況を含む)
+
+    """
+    result_calendars = {
+        year_month: {'reservedYearMonth': year_month, 'reservedDays': []}
+        for year_month in get_year_months(from_year_month, to_year_month)
+    }
+
+    shop_calendar = shop_reservation_table_controller.query_index_shop_id_reserved_year_month_range(  # noqa:E501
+        int(shop_id), from_year_month, to_year_month,
+        attributes=CALENDAR_ATTRIBUTES + ['reservedYearMonth']
+    )
     for one_day_info in shop_calendar:
         # 日付を数値のみの形式に加工
         reservedDay = datetime.datetime.strptime(
             one_day_info['reservedDay'], '%Y-%m-%d').day
         # フロントに返却する名称に変更
-        result_calendar['reservedDays'].append(
+        result_calendars[one_day_info['reservedYearMonth']][
+            'reservedDays'].append(
             {'day': reservedDay, 'vacancyFlg': one_day_info['vacancyFlg']})
 
-    return result_calendar
+    return result_calendars
+
+
+def get_year_months(from_year_month, to_year_month):
+    """
+    開始年月から終了年月までの年月を取得する。
+
+    Parameters
+    ----------
+    from_year_month : str
+        開始年月(YYYY-MM)
+    to_year_month : str
+        終了年月(YYYY-MM)
+
+    Returns
+    -------
+    year_months: list of str
+        年月(YYYY-MM)のリスト
+    """
+    year, month = map(int, from_year_month.split('-'))
+    # 0年1月からの月数で数える
+    month_index = year * 12 + month - 1
+    year_months = []
+    year_month = from_year_month
+    while year_month <= to_year_month:
+        year_months.append(year_month)
+        month_index += 1
+        year_month = '%04d-%02d' % (month_index // 12, month_index % 12 + 1)
+    return year_months
+
+
+def normalize_year_month(year_month):
+    """
+    年月をYYYY-MMの形式にする。
+
+    Parameters
+    ----------
+    year_month : str
+        年月(YYYY-MM、YYYY/MM、YYYYMMのいずれかの形式)
+
+    Returns
+    -------
+    year_month: str
+        年月(YYYY-MM)
+    """
+    return utils.format_date(
+        year_month.replace('-', '').replace('/', ''), '%Y%m', '%Y-%m')
 
 
 def lambda_handler(event, context):
     """
     DynamoDBテーブルから指定年月の予約情報を取得して返却する。
+    終了年月を指定した場合は、開始年月から終了年月までの予約情報を返却する。
 
     Parameters
     ----------
@@ -93,8 +246,17 @@ def lambda_handler(event, context):
         return utils.create_error_response(error_msg_disp, status=400)  # noqa: E501
 
     try:
-        shop_reserved_calendar = get_shop_calendar(
-            req_param['shopId'], req_param['preferredYearMonth'])
+        # 年月はYYYY/MM、YYYYMMの形式も受け付けるため、YYYY-MMに揃える
+        preferred_year_month = normalize_year_month(
+            req_param['preferredYearMonth'])
+        if 'preferredEndYearMonth' in req_param:
+            # 終了年月を指定した場合は年月をキーとして複数月分を返却する
+            shop_reserved_calendar = get_shop_calendars(
+                req_param['shopId'], preferred_year_month,
+                normalize_year_month(req_param['preferredEndYearMonth']))
+        else:
+            shop_reserved_calendar = get_shop_calendar(
+                req_param['shopId'], preferred_year_month)
 
     except Exception as e:
         logger.exception('Occur Exception: %s', e)
@@ -13,6 +13,9 @@ if LOGGER_LEVEL == 'DEBUG':
 else:
     logger.setLevel(logging.INFO)
 
+# 店舗一覧で使用する属性(コース情報は取得しない)
+SHOP_LIST_ATTRIBUTES = ['areaId', 'areaName', 'shop']
+
 # テーブル操作クラスの初期化
 shop_master_table_controller = RestaurantShopMaster()
 
@@ -27,7 +30,8 @@ def get_shop_list():
         地域毎の店舗情報のリスト
     """
 
-    shop_list = shop_master_table_controller.scan()
+    shop_list = shop_master_table_controller.scan(
+        attributes=SHOP_LIST_ATTRIBUTES)
 
     # フロントに返却する形式にデータ加工
     area_shop_dict = {}
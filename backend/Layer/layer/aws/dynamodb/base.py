@@ -2,15 +2,29 @@
 Base module for DynamoDB operations
 
 """
-import boto3
 from boto3.dynamodb.conditions import Key
 import logging
+import random
+import re
+import time
 from datetime import (datetime, timedelta)
 
+from aws.dynamodb import connection
+
 # ログ出力の設定
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Limits of a single BatchGetItem / BatchWriteItem request
+BATCH_GET_ITEM_LIMIT = 100
+BATCH_WRITE_ITEM_LIMIT = 25
+# Resubmission of unprocessed keys/items
+BATCH_MAX_RETRIES = 8
+BATCH_BACKOFF_BASE_SECONDS = 0.05
+BATCH_BACKOFF_MAX_SECONDS = 2
+# Element of an attribute path: a name followed by optional list indexes
+ATTRIBUTE_PATH_ELEMENT = re.compile(r'([^.\[\]]+)((?:\[\d+\])*)')
+
 
 class DynamoDB:
     """Base class for DynamoDB operations"""
@@ -19,7 +33,8 @@ class DynamoDB:
     def __init__(self, table_name):
         """Initialization method"""
         self._table_name = table_name
-        self._db = boto3.resource('dynamodb')
+        # Shared across all table controllers in the process
+        self._db = connection.get_resource()
 
     def _put_item(self, item):
         """
@@ -44,6 +59,45 @@ class DynamoDB:
 
         return response
 
+    def _put_item_optional(self, item, condition_expression,
+                           expression_attribute_names=None,
+                           expression_value=None):
+        """
+        Register an item on condition
+        * Fails with ConditionalCheckFailedException if the condition on the
+          item being replaced does not hold
+
+        Parameters
+        ----------
+        item : dict
+            Item to be registered
+        condition_expression : str
+            Registration condition
+        expression_attribute_names: dict, optional
+            Placeholders (for reserved words), by default None
+        expression_value : dict, optional
+            Variable declarations, by default None
+
+        Returns
+        -------
+        response : dict
+            Response information
+
+        """
+        request = {'Item': self._replace_data_for_dynamodb(item),
+                   'ConditionExpression': condition_expression}
+        if expression_attribute_names:
+            request['ExpressionAttributeNames'] = expression_attribute_names
+        if expression_value:
+            request['ExpressionAttributeValues'] = \
+                self._replace_data_for_dynamodb(expression_value)
+        try:
+            response = self._table.put_item(**request)
+        except Exception as e:
+            raise e
+
+        return response
+
     def _update_item(self, key, expression, expression_value, return_value):
         """
         Update an item
@@ -120,6 +174,103 @@ class DynamoDB:
 
         return response
 
+    def _transact_put(self, item, condition_expression=None,
+                      expression_attribute_names=None,
+                      expression_value=None):
+        """
+        Create a Put action for aws.dynamodb.transaction
+
+        Parameters
+        ----------
+        item : dict
+            Item to be registered
+        condition_expression : str, optional
+            Registration condition, by default None
+        expression_attribute_names: dict, optional
+            Placeholders (for reserved words), by default None
+        expression_value : dict, optional
+            Variable declarations, by default None
+
+        Returns
+        -------
+        action : dict
+            Put action
+
+        """
+        request = {
+            'TableName': self._table_name,
+            'Item': self._replace_data_for_dynamodb(item),
+        }
+        self._add_condition(request, condition_expression,
+                            expression_attribute_names, expression_value)
+        return {'Put': request}
+
+    def _transact_update(self, key, update_expression,
+                         condition_expression=None,
+                         expression_attribute_names=None,
+                         expression_value=None,
+                         return_values_on_condition_check_failure=False):
+        """
+        Create an Update action for aws.dynamodb.transaction
+
+        Parameters
+        ----------
+        key : dict
+            Key of the item to be updated
+        update_expression : str
+            Update expression
+        condition_expression : str, optional
+            Update condition, by default None
+        expression_attribute_names: dict, optional
+            Placeholders (for reserved words), by default None
+        expression_value : dict, optional
+            Variable declarations, by default None
+        return_values_on_condition_check_failure : bool, optional
+            Whether to return the item when the condition fails
+            (TransactionCanceledError.items), by default False
+
+        Returns
+        -------
+        action : dict
+            Update action
+
+        """
+        request = {
+            'TableName': self._table_name,
+            'Key': key,
+            'UpdateExpression': update_expression,
+        }
+        self._add_condition(request, condition_expression,
+                            expression_attribute_names, expression_value)
+        if return_values_on_condition_check_failure:
+            request['ReturnValuesOnConditionCheckFailure'] = 'ALL_OLD'
+        return {'Update': request}
+
+    def _add_condition(self, request, condition_expression,
+                       expression_attribute_names, expression_value):
+        """
+        Add the optional expression parameters to a transaction action
+
+        Parameters
+        ----------
+        request : dict
+            Request of the action (updated in place)
+        condition_expression : str
+            Condition
+        expression_attribute_names: dict
+            Placeholders (for reserved words)
+        expression_value : dict
+            Variable declarations
+
+        """
+        if condition_expression:
+            request['ConditionExpression'] = condition_expression
+        if expression_attribute_names:
+            request['ExpressionAttributeNames'] = expression_attribute_names
+        if expression_value:
+            request['ExpressionAttributeValues'] = \
+                self._replace_data_for_dynamodb(expression_value)
+
     def _delete_item(self, key):
         """
         Delete an item
@@ -142,7 +293,7 @@ class DynamoDB:
 
         return response
 
-    def _get_item(self, key):
+    def _get_item(self, key, attributes=None):
         """
         Retrieve an item
 
@@ -150,6 +301,9 @@ class DynamoDB:
         ----------
         key : dict
             Key of the item to be retrieved
+        attributes : list of str, optional
+            Attribute paths to be retrieved (e.g. 'shop.openTime'),
+            by default None (all attributes)
 
         Returns
         -------
@@ -158,20 +312,26 @@ class DynamoDB:
 
         """
         try:
-            response = self._table.get_item(Key=key)
+            response = self._table.get_item(
+                Key=key, **self._create_projection(attributes))
         except Exception as e:
             raise e
 
         return response.get('Item', {})
 
-    def _query(self, key, value):
+    def _query(self, key, value, page_size=None, attributes=None):
         """
         Use the query method to retrieve items
+        * All pages are read, following LastEvaluatedKey
 
         Parameters
         ----------
         key : dict
             Key of the item to be retrieved
+        page_size : int, optional
+            Maximum number of items per request, by default None
+        attributes : list of str, optional
+            Attribute paths to be retrieved, by default None (all attributes)
 
         Returns
         -------
@@ -179,18 +339,81 @@ class DynamoDB:
             List of target items
 
         """
-        try:
-            response = self._table.query(
-                KeyConditionExpression=Key(key).eq(value)
-            )
-        except Exception as e:
-            raise e
+        return list(self._iter_query(key, value, page_size, attributes))
+
+    def _iter_query(self, key, value, page_size=None, attributes=None):
+        """
+        Use the query method to retrieve items page by page
+
+        Parameters
+        ----------
+        key : dict
+            Key of the item to be retrieved
+        page_size : int, optional
+            Maximum number of items per request, by default None
+        attributes : list of str, optional
+            Attribute paths to be retrieved, by default None (all attributes)
+
+        Yields
+        ------
+        item : dict
+            Target item
 
-        return response['Items']
+        """
+        query_kwargs = {
+            'KeyConditionExpression': Key(key).eq(value),
+            **self._create_projection(attributes),
+        }
+        yield from self._iter_pages(self._table.query, query_kwargs,
+                                    page_size)
+
+    def _iter_query_range(self, key, value, range_key, low, high,
+                          page_size=None, attributes=None,
+                          consistent_read=False):
+        """
+        Use the query method to retrieve the items of a partition whose sort
+        key is between low and high (inclusive) page by page
+        * Items are yielded in ascending order of the sort key
+
+        Parameters
+        ----------
+        key : str
+            Partition key name
+        value : object
+            Partition key value
+        range_key : str
+            Sort key name
+        low : object
+            Lower bound of the sort key
+        high : object
+            Upper bound of the sort key
+        page_size : int, optional
+            Maximum number of items per request, by default None
+        attributes : list of str, optional
+            Attribute paths to be retrieved, by default None (all attributes)
+        consistent_read : bool, optional
+            Whether to use strongly consistent reads, by default False
+
+        Yields
+        ------
+        item : dict
+            Target item
 
-    def _query_index(self, index, expression, expression_value):
+        """
+        query_kwargs = {
+            'KeyConditionExpression':
+                Key(key).eq(value) & Key(range_key).between(low, high),
+            'ConsistentRead': consistent_read,
+            **self._create_projection(attributes),
+        }
+        yield from self._iter_pages(self._table.query, query_kwargs,
+                                    page_size)
+
+    def _query_index(self, index, expression, expression_value,
+                     page_size=None, attributes=None):
         """
         Retrieve items from an index
+        * All pages are read, following LastEvaluatedKey
 
         Parameters
         ----------
@@ -200,6 +423,10 @@ class DynamoDB:
             Expression of the target search
         expression_value : dict
             Variable names and values used in the expression
+        page_size : int, optional
+            Maximum number of items per request, by default None
+        attributes : list of str, optional
+            Attribute paths to be retrieved, by default None (all attributes)
 
         Returns
         -------
@@ -207,21 +434,99 @@ class DynamoDB:
             Search results
 
         """
+        return list(self._iter_query_index(index, expression,
+                                           expression_value, page_size,
+                                           attributes))
+
+    def _iter_query_index(self, index, expression, expression_value,
+                          page_size=None, attributes=None):
+        """
+        Retrieve items from an index page by page
+
+        Parameters
+        ----------
+        index : str
+            Index name
+        expression : str
+            Expression of the target search
+        expression_value : dict
+            Variable names and values used in the expression
+        page_size : int, optional
+            Maximum number of items per request, by default None
+        attributes : list of str, optional
+            Attribute paths to be retrieved, by default None (all attributes)
+
+        Yields
+        ------
+        item : dict
+            Search result
+
+        """
+        query_kwargs = {
+            'IndexName': index,
+            'KeyConditionExpression': expression,
+            'ExpressionAttributeValues': self._replace_data_for_dynamodb(
+                expression_value),
+            **self._create_projection(attributes),
+        }
+        yield from self._iter_pages(self._table.query, query_kwargs,
+                                    page_size)
+
+    def _query_index_page(self, index, expression, expression_value,
+                          page_size=None, exclusive_start_key=None,
+                          attributes=None):
+        """
+        Retrieve one page of items from an index
+        * For callers that stop partway and resume later from the returned
+          key (e.g. in another invocation)
+
+        Parameters
+        ----------
+        index : str
+            Index name
+        expression : str
+            Expression of the target search
+        expression_value : dict
+            Variable names and values used in the expression
+        page_size : int, optional
+            Maximum number of items per request, by default None
+        exclusive_start_key : dict, optional
+            LastEvaluatedKey of the previous page, by default None (first page)
+        attributes : list of str, optional
+            Attribute paths to be retrieved, by default None (all attributes)
+
+        Returns
+        -------
+        items : list
+            Items of the page
+        last_evaluated_key : dict
+            Key to pass as exclusive_start_key for the next page,
+            None on the last page
+
+        """
+        query_kwargs = {
+            'IndexName': index,
+            'KeyConditionExpression': expression,
+            'ExpressionAttributeValues': self._replace_data_for_dynamodb(
+                expression_value),
+            **self._create_projection(attributes),
+        }
+        if page_size:
+            query_kwargs['Limit'] = page_size
+        if exclusive_start_key:
+            query_kwargs['ExclusiveStartKey'] = exclusive_start_key
+
         try:
-            response = self._table.query(
-                IndexName=index,
-                KeyConditionExpression=expression,
-                ExpressionAttributeValues=self._replace_data_for_dynamodb(
-                    expression_value),
-            )
+            response = self._table.query(**query_kwargs)
         except Exception as e:
             raise e
+        return (response.get('Items', []),
+                response.get('LastEvaluatedKey') or None)
 
-        return response['Items']
-
-    def _scan(self, key, value=None):
+    def _scan(self, key, value=None, page_size=None, attributes=None):
         """
         Use the scan method to retrieve data
+        * All pages are read, following LastEvaluatedKey
 
         Parameters
         ----------
@@ -229,6 +534,10 @@ class DynamoDB:
             Key name
         value : object, optional
             Value to search for, by default None
+        page_size : int, optional
+            Maximum number of items per request, by default None
+        attributes : list of str, optional
+            Attribute paths to be retrieved, by default None (all attributes)
 
         Returns
         -------
@@ -236,16 +545,236 @@ class DynamoDB:
             List of target items
 
         """
-        scan_kwargs = {}
+        return list(self._iter_scan(key, value, page_size, attributes))
+
+    def _iter_scan(self, key, value=None, page_size=None, attributes=None):
+        """
+        Use the scan method to retrieve data page by page
+
+        Parameters
+        ----------
+        key : str
+            Key name
+        value : object, optional
+            Value to search for, by default None
+        page_size : int, optional
+            Maximum number of items per request, by default None
+        attributes : list of str, optional
+            Attribute paths to be retrieved, by default None (all attributes)
+
+        Yields
+        ------
+        item : dict
+            Target item
+
+        """
+        scan_kwargs = self._create_projection(attributes)
         if value:
             scan_kwargs['FilterExpression'] = Key(key).eq(value)
 
-        try:
-            response = self._table.scan(**scan_kwargs)
-        except Exception as e:
-            raise e
+        yield from self._iter_pages(self._table.scan, scan_kwargs, page_size)
+
+    def _iter_pages(self, operation, request_kwargs, page_size=None):
+        """
+        Call a query/scan operation repeatedly until LastEvaluatedKey is gone
+        * Only one page is held in memory at a time
+
+        Parameters
+        ----------
+        operation : callable
+            Table.query or Table.scan
+        request_kwargs : dict
+            Arguments passed to the operation
+        page_size : int, optional
+            Maximum number of items per request, by default None
+
+        Yields
+        ------
+        item : dict
+            Item contained in each page
+
+        """
+        request_kwargs = dict(request_kwargs)
+        if page_size:
+            request_kwargs['Limit'] = page_size
+
+        while True:
+            try:
+                response = operation(**request_kwargs)
+            except Exception as e:
+                raise e
+
+            yield from response.get('Items', [])
 
-        return response['Items']
+            last_evaluated_key = response.get('LastEvaluatedKey')
+            if not last_evaluated_key:
+                break
+            request_kwargs['ExclusiveStartKey'] = last_evaluated_key
+
+    def _batch_get_items(self, keys, attributes=None):
+        """
+        Retrieve multiple items with BatchGetItem
+        * Keys are split into requests of up to 100 and UnprocessedKeys are
+          resubmitted with jittered exponential backoff
+
+        Parameters
+        ----------
+        keys : list of dict
+            Keys of the items to be retrieved
+        attributes : list of str, optional
+            Attribute paths to be retrieved, by default None (all attributes)
+
+        Returns
+        -------
+        items : list
+            Retrieved items (in no particular order)
+        round_trips : int
+            Number of requests sent to DynamoDB
+
+        """
+        items = []
+        round_trips = 0
+        for chunk in self._chunk(keys, BATCH_GET_ITEM_LIMIT):
+            request_items = {self._table_name: {
+                'Keys': chunk, **self._create_projection(attributes)}}
+            for attempt in range(BATCH_MAX_RETRIES + 1):
+                try:
+                    response = self._db.batch_get_item(
+                        RequestItems=request_items)
+                except Exception as e:
+                    raise e
+                round_trips += 1
+
+                items.extend(
+                    response['Responses'].get(self._table_name, []))
+                request_items = response.get('UnprocessedKeys')
+                if not request_items:
+                    break
+                self._sleep_before_retry(attempt)
+            else:
+                raise Exception(
+                    'UnprocessedKeys remained after %d retries: %s'
+                    % (BATCH_MAX_RETRIES, self._table_name))
+
+        logger.debug('batch_get_item %s: %d items, %d round trips',
+                     self._table_name, len(items), round_trips)
+        return items, round_trips
+
+    def _batch_put_items(self, items):
+        """
+        Register multiple items with BatchWriteItem
+        * Items are split into requests of up to 25 and UnprocessedItems are
+          resubmitted with jittered exponential backoff
+
+        Parameters
+        ----------
+        items : list of dict
+            Items to be registered
+
+        Returns
+        -------
+        round_trips : int
+            Number of requests sent to DynamoDB
+
+        """
+        round_trips = 0
+        for chunk in self._chunk(items, BATCH_WRITE_ITEM_LIMIT):
+            request_items = {self._table_name: [
+                {'PutRequest': {'Item': self._replace_data_for_dynamodb(item)}}
+                for item in chunk
+            ]}
+            for attempt in range(BATCH_MAX_RETRIES + 1):
+                try:
+                    response = self._db.batch_write_item(
+                        RequestItems=request_items)
+                except Exception as e:
+                    raise e
+                round_trips += 1
+
+                request_items = response.get('UnprocessedItems')
+                if not request_items:
+                    break
+                self._sleep_before_retry(attempt)
+            else:
+                raise Exception(
+                    'UnprocessedItems remained after %d retries: %s'
+                    % (BATCH_MAX_RETRIES, self._table_name))
+
+        logger.debug('batch_write_item %s: %d items, %d round trips',
+                     self._table_name, len(items), round_trips)
+        return round_trips
+
+    def _chunk(self, values, size):
+        """
+        Split a list into lists of at most the specified size
+
+        Parameters
+        ----------
+        values : list
+            List to be split
+        size : int
+            Maximum length of each chunk
+
+        Returns
+        -------
+        chunks : list of list
+            Split lists
+
+        """
+        return [values[i:i + size] for i in range(0, len(values), size)]
+
+    def _sleep_before_retry(self, attempt):
+        """
+        Wait before resubmitting unprocessed requests
+        * Full jitter: a random time up to the exponential backoff ceiling
+
+        Parameters
+        ----------
+        attempt : int
+            Number of the attempt that has just finished (0 origin)
+
+        """
+        ceiling = min(BATCH_BACKOFF_MAX_SECONDS,
+                      BATCH_BACKOFF_BASE_SECONDS * (2 ** attempt))
+        time.sleep(random.uniform(0, ceiling))
+
+    def _create_projection(self, attributes):
+        """
+        Create the projection parameters of a read request
+        * Every name in the paths is replaced by a placeholder, so reserved
+          words (e.g. 'comment', 'name') can be projected as they are
+
+        Parameters
+        ----------
+        attributes : list of str
+            Attribute paths such as 'course' or 'shop.openTime'
+            (list elements as 'course[0]')
+
+        Returns
+        -------
+        params : dict
+            ProjectionExpression and ExpressionAttributeNames
+            (empty when attributes is empty)
+
+        """
+        if not attributes:
+            return {}
+
+        placeholders = {}
+        paths = []
+        for attribute in attributes:
+            elements = []
+            for name, indexes in ATTRIBUTE_PATH_ELEMENT.findall(attribute):
+                if name not in placeholders:
+                    placeholders[name] = '#p%d' % len(placeholders)
+                elements.append(placeholders[name] + indexes)
+            paths.append('.'.join(elements))
+        return {
+            'ProjectionExpression': ', '.join(paths),
+            'ExpressionAttributeNames': {
+                placeholder: name for name, placeholder
+                in placeholders.items()},
+        }
 
     def _get_table_size(self):
         """
@@ -0,0 +1,157 @@
+"""
+Process-wide boto3 session, resource and client for DynamoDB operations
+
+Every table controller shares one session, one service resource (and the
+client behind it) and therefore one HTTP connection pool.
+They are created on first use and reused across warm Lambda invocations.
+
+DYNAMODB_BACKEND selects the storage behind them:
+"dynamodb" (default) uses boto3, "memory" uses the in-memory stand-in
+aws.dynamodb.memory, set up as described in aws.dynamodb.memory_setup.
+
+"""
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+BACKEND = os.environ.get('DYNAMODB_BACKEND', 'dynamodb')
+# Connection settings shared by every table controller
+MAX_POOL_CONNECTIONS = int(os.environ.get('DYNAMODB_MAX_POOL_CONNECTIONS', 10))
+CONNECT_TIMEOUT = float(os.environ.get('DYNAMODB_CONNECT_TIMEOUT', 1))
+READ_TIMEOUT = float(os.environ.get('DYNAMODB_READ_TIMEOUT', 2))
+MAX_ATTEMPTS = int(os.environ.get('DYNAMODB_MAX_ATTEMPTS', 3))
+
+BOTO_CONFIG = Config(
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    connect_timeout=CONNECT_TIMEOUT,
+    read_timeout=READ_TIMEOUT,
+    tcp_keepalive=True,
+    retries={'max_attempts': MAX_ATTEMPTS, 'mode': 'standard'},
+)
+
+_lock = threading.Lock()
+_session = None
+_resource = None
+_tables = {}
+
+
+def get_session():
+    """
+    Retrieve the shared boto3 session
+
+    Returns
+    -------
+    session : boto3.session.Session
+        Session created on first use
+
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.session.Session()
+    return _session
+
+
+def get_resource():
+    """
+    Retrieve the shared DynamoDB service resource
+
+    Returns
+    -------
+    resource : boto3.resources.base.ServiceResource
+        DynamoDB resource created on first use with BOTO_CONFIG
+        (a MemoryResource when DYNAMODB_BACKEND is "memory")
+
+    """
+    global _resource
+    if _resource is None:
+        if BACKEND == 'memory':
+            from aws.dynamodb import memory_setup
+            create_resource = memory_setup.create_resource_from_environ
+        else:
+            session = get_session()
+
+            def create_resource():
+                return session.resource('dynamodb', config=BOTO_CONFIG)
+        with _lock:
+            if _resource is None:
+                _resource = create_resource()
+    return _resource
+
+
+def get_client():
+    """
+    Retrieve the low-level DynamoDB client
+    * The client behind the shared resource, so the connection pool is shared
+    * Like the resource, it takes and returns plain Python values
+      (the resource registers the AttributeValue conversion on it)
+
+    Returns
+    -------
+    client : botocore.client.DynamoDB
+        DynamoDB client
+
+    """
+    return get_resource().meta.client
+
+
+def get_table(table_name):
+    """
+    Retrieve a Table object from the cache
+
+    Parameters
+    ----------
+    table_name : str
+        Table name
+
+    Returns
+    -------
+    table : boto3.resources.factory.dynamodb.Table
+        Table object bound to the shared resource
+
+    """
+    table = _tables.get(table_name)
+    if table is None:
+        resource = get_resource()
+        with _lock:
+            table = _tables.get(table_name)
+            if table is None:
+                table = resource.Table(table_name)
+                _tables[table_name] = table
+    return table
+
+
+def use_resource(resource):
+    """
+    Replace the shared resource
+    * Used to run the controllers against a stand-in such as
+      aws.dynamodb.memory.MemoryResource
+    * Controllers keep the resource they were created with, so call this
+      before importing the handlers
+
+    Parameters
+    ----------
+    resource : object
+        Object implementing the boto3 DynamoDB service resource interface
+
+    """
+    global _resource
+    with _lock:
+        _resource = resource
+        _tables.clear()
+
+
+def reset():
+    """
+    Discard the shared session, resource and cached tables
+    * The next call creates them again (e.g. after changing settings)
+
+    """
+    global _session, _resource
+    with _lock:
+        _session = None
+        _resource = None
+        _tables.clear()
@@ -0,0 +1,1410 @@
+"""
+In-memory stand-in for the DynamoDB API used by the table controllers
+
+Implements the part of the boto3 service resource / Table / client interface
+that aws.dynamodb.base relies on (item operations, query/scan on the table
+and its secondary indexes with pagination, batch and transaction requests,
+TTL), so handlers and batch jobs can be run and benchmarked without AWS.
+Latency and throttling can be injected deterministically.
+Tables created with a StreamSpecification record their writes in a
+MemoryStream, which feeds them to a stream consumer in Lambda's event format.
+Select it with DYNAMODB_BACKEND=memory (see aws.dynamodb.memory_setup) or
+install it with connection.use_resource(MemoryResource()).
+
+Values are kept as the boto3 resource returns them (Decimal, str, set, ...)
+and every request goes through TypeSerializer, so invalid values (e.g. float)
+are rejected just like the real service.
+
+"""
+import bisect
+import copy
+import random
+import re
+import threading
+import time
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import (ConditionBase,
+                                       ConditionExpressionBuilder)
+from boto3.dynamodb.types import (Binary, TypeSerializer, TypeDeserializer)
+from botocore.exceptions import ClientError
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+# Marker for an attribute that does not exist
+_MISSING = object()
+# A query/scan response holds at most this many bytes of items
+PAGE_SIZE_LIMIT = 1024 * 1024
+
+
+def _normalize(value):
+    """Copy a value, converting it the same way a round trip to DynamoDB does"""
+    return _deserializer.deserialize(_serializer.serialize(value))
+
+
+def _serialize_item(item):
+    """Convert an item into the low-level (AttributeValue) format"""
+    return {name: _serializer.serialize(value) for name, value in item.items()}
+
+
+def _client_error(code, message, operation, **extra):
+    """Create the error botocore raises for a failed request"""
+    response = {'Error': {'Code': code, 'Message': message}}
+    response.update(extra)
+    return ClientError(response, operation)
+
+
+def _build_expression(expression, names, values, is_key_condition):
+    """
+    Return an expression string
+    * boto3 condition objects (Key/Attr) are converted the way the boto3
+      resource converts them, adding their placeholders to names/values
+    """
+    if not isinstance(expression, ConditionBase):
+        return expression
+    built = ConditionExpressionBuilder().build_expression(
+        expression, is_key_condition=is_key_condition)
+    names.update(built.attribute_name_placeholders)
+    values.update(built.attribute_value_placeholders)
+    return built.condition_expression
+
+
+def _item_size(value):
+    """Approximate size in bytes of an item or attribute value"""
+    if isinstance(value, dict):
+        return sum(len(name) + _item_size(element)
+                   for name, element in value.items()) + 3
+    if isinstance(value, (list, set)):
+        return sum(_item_size(element) for element in value) + 3
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, Binary):
+        return len(bytes(value))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, Decimal):
+        return len(value.as_tuple().digits) // 2 + 2
+    return 1
+
+
+class ExpressionError(ValueError):
+    """Raised for an expression the stand-in cannot parse"""
+
+
+_TOKEN_RE = re.compile(
+    r'\s*(?:(?P<op><>|<=|>=|[=<>()\[\],.+-])'
+    r'|(?P<name>#[A-Za-z0-9_]+)'
+    r'|(?P<value>:[A-Za-z0-9_]+)'
+    r'|(?P<number>[0-9]+)'
+    r'|(?P<word>[A-Za-z_][A-Za-z0-9_]*))')
+_COMPARATORS = ('=', '<>', '<', '<=', '>', '>=')
+
+
+class _Parser:
+    """Recursive descent parser for condition/update/projection expressions"""
+
+    def __init__(self, expression, names, values):
+        self._names = names or {}
+        self._values = values or {}
+        self._tokens = []
+        position = 0
+        expression = expression.rstrip()
+        while position < len(expression):
+            match = _TOKEN_RE.match(expression, position)
+            if not match or match.end() == position:
+                raise ExpressionError(
+                    'Invalid expression near: %s' % expression[position:])
+            kind = match.lastgroup
+            self._tokens.append((kind, match.group(kind)))
+            position = match.end()
+        self._position = 0
+
+    # ---- token helpers ----
+    def _peek(self, offset=0):
+        index = self._position + offset
+        if index < len(self._tokens):
+            return self._tokens[index]
+        return (None, None)
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            raise ExpressionError('Unexpected end of expression')
+        self._position += 1
+        return token
+
+    def _accept(self, text):
+        kind, value = self._peek()
+        if kind in ('op', 'word') and value.upper() == text:
+            self._position += 1
+            return True
+        return False
+
+    def _expect(self, text):
+        if not self._accept(text):
+            raise ExpressionError('Expected %s but got %s'
+                                  % (text, self._peek()[1]))
+
+    def at_end(self):
+        return self._position >= len(self._tokens)
+
+    # ---- operands ----
+    def path(self):
+        """path := name ('.' name | '[' number ']')*"""
+        elements = [self._attribute_name()]
+        while True:
+            if self._accept('.'):
+                elements.append(self._attribute_name())
+            elif self._accept('['):
+                kind, number = self._next()
+                if kind != 'number':
+                    raise ExpressionError('List index must be a number')
+                elements.append(int(number))
+                self._expect(']')
+            else:
+                return tuple(elements)
+
+    def _attribute_name(self):
+        kind, token = self._next()
+        if kind == 'name':
+            if token not in self._names:
+                raise ExpressionError('Undefined attribute name: %s' % token)
+            return self._names[token]
+        if kind == 'word':
+            return token
+        raise ExpressionError('Expected attribute name but got %s' % token)
+
+    def operand(self):
+        """Return a function evaluating the operand against an item"""
+        kind, token = self._peek()
+        if kind == 'value':
+            self._next()
+            if token not in self._values:
+                raise ExpressionError('Undefined attribute value: %s' % token)
+            value = self._values[token]
+            return lambda item: value
+        if kind == 'word' and self._peek(1)[1] == '(':
+            function = token.lower()
+            self._next()
+            self._expect('(')
+            if function == 'size':
+                path = self.path()
+                self._expect(')')
+                return lambda item: _size(_get_path(item, path))
+            if function == 'if_not_exists':
+                path = self.path()
+                self._expect(',')
+                default = self.operand()
+                self._expect(')')
+
+                def if_not_exists(item):
+                    current = _get_path(item, path)
+                    return default(item) if current is _MISSING else current
+                return if_not_exists
+            if function == 'list_append':
+                first = self.operand()
+                self._expect(',')
+                second = self.operand()
+                self._expect(')')
+                return lambda item: _list_append(first(item), second(item))
+            raise ExpressionError('Unsupported function: %s' % token)
+        path = self.path()
+        return lambda item: _get_path(item, path)
+
+    # ---- conditions ----
+    def condition(self):
+        """condition := and_condition (OR and_condition)*"""
+        terms = [self._and_condition()]
+        while self._accept('OR'):
+            terms.append(self._and_condition())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda item: any(term(item) for term in terms)
+
+    def key_condition(self):
+        """
+        key_condition := key_term (AND key_term)*
+        Returns the condition function and the values of the attributes
+        compared with '=' (used to find the partition)
+        """
+        terms = []
+        equalities = {}
+        self._key_terms(terms, equalities)
+        if not self.at_end():
+            raise ExpressionError('Invalid KeyConditionExpression near: %s'
+                                  % self._peek()[1])
+        return (lambda item: all(term(item) for term in terms)), equalities
+
+    def _key_terms(self, terms, equalities):
+        while True:
+            kind, _ = self._peek()
+            if self._accept('('):
+                self._key_terms(terms, equalities)
+                self._expect(')')
+            elif kind in ('name', 'word') and self._peek(1) == ('op', '=') \
+                    and self._peek(2)[0] == 'value':
+                name = self._attribute_name()
+                self._next()
+                value = self.operand()({})
+                equalities[name] = value
+                terms.append(lambda item, name=name, value=value: _compare(
+                    item.get(name, _MISSING), '=', value))
+            else:
+                terms.append(self._primary_condition())
+            if not self._accept('AND'):
+                return
+
+    def _and_condition(self):
+        terms = [self._not_condition()]
+        while self._accept('AND'):
+            terms.append(self._not_condition())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda item: all(term(item) for term in terms)
+
+    def _not_condition(self):
+        if self._accept('NOT'):
+            term = self._not_condition()
+            return lambda item: not term(item)
+        return self._primary_condition()
+
+    def _primary_condition(self):
+        if self._accept('('):
+            term = self.condition()
+            self._expect(')')
+            return term
+
+        kind, token = self._peek()
+        if kind == 'word' and self._peek(1)[1] == '(' \
+                and token.lower() != 'size':
+            return self._function_condition(token.lower())
+
+        left = self.operand()
+        if self._accept('BETWEEN'):
+            lower = self.operand()
+            self._expect('AND')
+            upper = self.operand()
+            return lambda item: (
+                _compare(left(item), '>=', lower(item))
+                and _compare(left(item), '<=', upper(item)))
+        if self._accept('IN'):
+            self._expect('(')
+            candidates = [self.operand()]
+            while self._accept(','):
+                candidates.append(self.operand())
+            self._expect(')')
+            return lambda item: any(
+                _compare(left(item), '=', candidate(item))
+                for candidate in candidates)
+
+        kind, comparator = self._next()
+        if comparator not in _COMPARATORS:
+            raise ExpressionError('Expected comparator but got %s'
+                                  % comparator)
+        right = self.operand()
+        return lambda item: _compare(left(item), comparator, right(item))
+
+    def _function_condition(self, function):
+        self._next()
+        self._expect('(')
+        path = self.path()
+        if function == 'attribute_exists':
+            self._expect(')')
+            return lambda item: _get_path(item, path) is not _MISSING
+        if function == 'attribute_not_exists':
+            self._expect(')')
+            return lambda item: _get_path(item, path) is _MISSING
+        self._expect(',')
+        argument = self.operand()
+        self._expect(')')
+        if function == 'begins_with':
+            return lambda item: _begins_with(_get_path(item, path),
+                                             argument(item))
+        if function == 'contains':
+            return lambda item: _contains(_get_path(item, path),
+                                          argument(item))
+        if function == 'attribute_type':
+            return lambda item: _attribute_type(_get_path(item, path)) \
+                == argument(item)
+        raise ExpressionError('Unsupported function: %s' % function)
+
+    # ---- update expression ----
+    def update_actions(self):
+        """Return a list of (action, path, value function) tuples"""
+        actions = []
+        while not self.at_end():
+            kind, clause = self._next()
+            clause = clause.upper()
+            if clause not in ('SET', 'REMOVE', 'ADD', 'DELETE'):
+                raise ExpressionError('Unknown update clause: %s' % clause)
+            while True:
+                path = self.path()
+                if clause == 'SET':
+                    self._expect('=')
+                    value = self._set_value()
+                elif clause == 'REMOVE':
+                    value = None
+                else:
+                    value = self.operand()
+                actions.append((clause, path, value))
+                if not self._accept(','):
+                    break
+        return actions
+
+    def _set_value(self):
+        left = self.operand()
+        if self._accept('+'):
+            right = self.operand()
+            return lambda item: _arithmetic(left(item), right(item), 1)
+        if self._accept('-'):
+            right = self.operand()
+            return lambda item: _arithmetic(left(item), right(item), -1)
+        return left
+
+    # ---- projection expression ----
+    def projection(self):
+        paths = [self.path()]
+        while self._accept(','):
+            paths.append(self.path())
+        return paths
+
+
+def _get_path(item, path):
+    current = item
+    for element in path:
+        if isinstance(element, int):
+            if not isinstance(current, list) or element >= len(current):
+                return _MISSING
+        elif not isinstance(current, dict) or element not in current:
+            return _MISSING
+        current = current[element]
+    return current
+
+
+def _set_path(item, path, value):
+    parent = _get_path(item, path[:-1])
+    last = path[-1]
+    if isinstance(last, int):
+        if not isinstance(parent, list):
+            raise ExpressionError('The document path provided in the update '
+                                  'expression is invalid for update')
+        if last < len(parent):
+            parent[last] = value
+        else:
+            parent.append(value)
+    else:
+        if not isinstance(parent, dict):
+            raise ExpressionError('The document path provided in the update '
+                                  'expression is invalid for update')
+        parent[last] = value
+
+
+def _remove_path(item, path):
+    parent = _get_path(item, path[:-1])
+    last = path[-1]
+    if isinstance(last, int):
+        if isinstance(parent, list) and last < len(parent):
+            del parent[last]
+    elif isinstance(parent, dict):
+        parent.pop(last, None)
+
+
+def _type_rank(value):
+    if isinstance(value, bool):
+        return 'BOOL'
+    if isinstance(value, Decimal):
+        return 'N'
+    if isinstance(value, str):
+        return 'S'
+    if isinstance(value, (bytes, bytearray, Binary)):
+        return 'B'
+    return None
+
+
+def _compare(left, comparator, right):
+    if left is _MISSING or right is _MISSING:
+        return False
+    if comparator == '=':
+        return left == right
+    if comparator == '<>':
+        return left != right
+    rank = _type_rank(left)
+    if rank is None or rank == 'BOOL' or rank != _type_rank(right):
+        return False
+    if rank == 'B':
+        left, right = bytes(left), bytes(right)
+    return {'<': left < right, '<=': left <= right,
+            '>': left > right, '>=': left >= right}[comparator]
+
+
+def _size(value):
+    if isinstance(value, (str, bytes, list, dict, set)):
+        return Decimal(len(value))
+    if isinstance(value, Binary):
+        return Decimal(len(bytes(value)))
+    return _MISSING
+
+
+def _begins_with(value, prefix):
+    if isinstance(value, str) and isinstance(prefix, str):
+        return value.startswith(prefix)
+    return False
+
+
+def _contains(value, operand):
+    if isinstance(value, str) and isinstance(operand, str):
+        return operand in value
+    if isinstance(value, (set, list)):
+        return operand in value
+    return False
+
+
+def _attribute_type(value):
+    if value is _MISSING:
+        return None
+    if value is None:
+        return 'NULL'
+    if isinstance(value, dict):
+        return 'M'
+    if isinstance(value, list):
+        return 'L'
+    if isinstance(value, set):
+        element = next(iter(value))
+        return {'N': 'NS', 'S': 'SS', 'B': 'BS'}[_type_rank(element)]
+    return _type_rank(value)
+
+
+def _arithmetic(left, right, sign):
+    if _type_rank(left) != 'N' or _type_rank(right) != 'N':
+        raise ExpressionError('An operand in the update expression has an '
+                              'incorrect data type')
+    return left + right * sign
+
+
+def _list_append(first, second):
+    if not isinstance(first, list) or not isinstance(second, list):
+        raise ExpressionError('An operand in the update expression has an '
+                              'incorrect data type')
+    return first + second
+
+
+def _projected(item, expression, names):
+    """Keep only the attributes named in a projection expression"""
+    if not expression:
+        return item
+    result = {}
+    for path in _Parser(expression, names, None).projection():
+        value = _get_path(item, path)
+        if value is _MISSING:
+            continue
+        # Rebuild the enclosing maps/lists with only the projected element
+        target = result
+        for element, following in zip(path, path[1:]):
+            container = [] if isinstance(following, int) else {}
+            if isinstance(target, list):
+                target.append(container)
+                target = container
+            else:
+                target = target.setdefault(element, container)
+        if isinstance(target, list):
+            target.append(value)
+        else:
+            target[path[-1]] = value
+    return result
+
+
+class _Meta:
+    """Stand-in for resource.meta"""
+
+    def __init__(self, client):
+        self.client = client
+
+
+class _Index:
+    """Key schema and projection of a table or of one of its indexes"""
+
+    def __init__(self, name, key_schema, projection=None):
+        self.name = name
+        self.hash_key = next(key['AttributeName'] for key in key_schema
+                             if key['KeyType'] == 'HASH')
+        self.range_key = next((key['AttributeName'] for key in key_schema
+                               if key['KeyType'] == 'RANGE'), None)
+        projection = projection or {'ProjectionType': 'ALL'}
+        self.projection_type = projection['ProjectionType']
+        self.non_key_attributes = set(projection.get('NonKeyAttributes', []))
+
+    def key_attributes(self):
+        return [self.hash_key] + ([self.range_key] if self.range_key else [])
+
+    def covers(self, item):
+        """Whether the item is in the index (secondary indexes are sparse)"""
+        return all(name in item for name in self.key_attributes())
+
+    def project(self, item, table_index):
+        """Keep the attributes the index projects"""
+        if self.projection_type == 'ALL':
+            return item
+        names = set(self.key_attributes()) | set(table_index.key_attributes())
+        if self.projection_type == 'INCLUDE':
+            names |= self.non_key_attributes
+        return {name: value for name, value in item.items() if name in names}
+
+
+class _ItemStore(dict):
+    """
+    Items of a table keyed by their key tuple
+    * Keeps the keys of every partition of the table and of its indexes up
+      to date, so a query reads only its partition
+    """
+
+    def __init__(self, indexes):
+        super().__init__()
+        self._indexes = indexes
+        self.partitions = {index.name: {} for index in indexes}
+        self.version = 0
+        # MemoryStream the writes are recorded in (None: stream disabled)
+        self.stream = None
+
+    def __setitem__(self, key, item):
+        old_item = self.get(key)
+        if old_item is not None:
+            self._unlink(key, old_item)
+        super().__setitem__(key, item)
+        self._link(key, item)
+        if self.stream is not None:
+            self.stream.append(old_item, item)
+
+    def __delitem__(self, key):
+        old_item = self[key]
+        self._unlink(key, old_item)
+        super().__delitem__(key)
+        if self.stream is not None:
+            self.stream.append(old_item, None)
+
+    def pop(self, key, *default):
+        if key in self:
+            item = self[key]
+            del self[key]
+            return item
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def _link(self, key, item):
+        self.version += 1
+        for index in self._indexes:
+            if index.covers(item):
+                self.partitions[index.name].setdefault(
+                    item[index.hash_key], {})[key] = None
+
+    def _unlink(self, key, item):
+        self.version += 1
+        for index in self._indexes:
+            if index.covers(item):
+                partitions = self.partitions[index.name]
+                partition = partitions.get(item[index.hash_key], {})
+                partition.pop(key, None)
+                if not partition:
+                    partitions.pop(item[index.hash_key], None)
+
+
+class MemoryTable:
+    """In-memory stand-in for boto3's dynamodb.Table"""
+
+    def __init__(self, resource, name, key_schema, indexes=()):
+        self._resource = resource
+        self.name = name
+        self.table_name = name
+        self.key_schema = key_schema
+        self.primary = _Index(None, key_schema)
+        self.hash_key = self.primary.hash_key
+        self.range_key = self.primary.range_key
+        self.indexes = {index['IndexName']: _Index(
+            index['IndexName'], index['KeySchema'], index.get('Projection'))
+            for index in indexes}
+        self.items = _ItemStore([self.primary] + list(self.indexes.values()))
+        self.ttl_attribute = None
+        self.stream = None
+        self._scan_orders = {}
+
+    # ---- helpers used by the resource/client ----
+    def key_of(self, item, operation):
+        """Return the dict key for an item or a Key argument"""
+        if self.hash_key not in item or (
+                self.range_key and self.range_key not in item):
+            raise _client_error(
+                'ValidationException',
+                'The provided key element does not match the schema',
+                operation)
+        if self.range_key:
+            return (item[self.hash_key], item[self.range_key])
+        return (item[self.hash_key],)
+
+    def check_not_in_transaction(self, key, operation):
+        """Reject a write to an item an in-flight transaction is writing"""
+        if (self.name, key) in self._resource.in_flight:
+            raise _client_error(
+                'TransactionConflictException',
+                'Transaction is ongoing for the item', operation)
+
+    def check_condition(self, current, condition_expression, names, values,
+                        operation):
+        """Evaluate a ConditionExpression against the stored item"""
+        if not condition_expression:
+            return True
+        try:
+            parser = _Parser(condition_expression, names, values)
+            condition = parser.condition()
+        except ExpressionError as e:
+            raise _client_error('ValidationException', str(e), operation)
+        return condition(current if current is not None else {})
+
+    def apply_update(self, key, current, update_expression, names, values,
+                     operation):
+        """Return (new item, names of updated top-level attributes)"""
+        item = copy.deepcopy(current) if current is not None else dict(key)
+        updated = set()
+        try:
+            parser = _Parser(update_expression, names, values)
+            actions = parser.update_actions()
+            # Right-hand sides are evaluated against the item before update
+            before = copy.deepcopy(item)
+            for clause, path, value in actions:
+                if path[0] in key:
+                    raise ExpressionError(
+                        'Cannot update attribute %s. '
+                        'This attribute is part of the key' % path[0])
+                updated.add(path[0])
+                if clause == 'SET':
+                    _set_path(item, path, copy.deepcopy(value(before)))
+                elif clause == 'REMOVE':
+                    _remove_path(item, path)
+                elif clause == 'ADD':
+                    operand = value(before)
+                    current_value = _get_path(item, path)
+                    if isinstance(operand, set):
+                        new_value = (current_value if current_value
+                                     is not _MISSING else set()) | operand
+                    elif current_value is _MISSING:
+                        new_value = operand
+                    else:
+                        new_value = _arithmetic(current_value, operand, 1)
+                    _set_path(item, path, new_value)
+                elif clause == 'DELETE':
+                    current_value = _get_path(item, path)
+                    if current_value is not _MISSING:
+                        remaining = current_value - value(before)
+                        if remaining:
+                            _set_path(item, path, remaining)
+                        else:
+                            _remove_path(item, path)
+        except ExpressionError as e:
+            raise _client_error('ValidationException', str(e), operation)
+        return item, updated
+
+    def _failed_condition(self, operation, current, return_values):
+        extra = {}
+        if return_values == 'ALL_OLD' and current is not None:
+            extra['Item'] = _serialize_item(current)
+        return _client_error('ConditionalCheckFailedException',
+                             'The conditional request failed', operation,
+                             **extra)
+
+    # ---- Table API ----
+    def put_item(self, Item, ConditionExpression=None,
+                 ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None, ReturnValues='NONE',
+                 ReturnValuesOnConditionCheckFailure='NONE'):
+        self._resource.simulate_request('PutItem')
+        item = _normalize(Item)
+        values = _normalize(ExpressionAttributeValues or {})
+        with self._resource.lock:
+            key = self.key_of(item, 'PutItem')
+            self.check_not_in_transaction(key, 'PutItem')
+            current = self.items.get(key)
+            if not self.check_condition(current, ConditionExpression,
+                                        ExpressionAttributeNames, values,
+                                        'PutItem'):
+                raise self._failed_condition(
+                    'PutItem', current, ReturnValuesOnConditionCheckFailure)
+            self.items[key] = item
+        response = {}
+        if ReturnValues == 'ALL_OLD' and current is not None:
+            response['Attributes'] = copy.deepcopy(current)
+        return response
+
+    def get_item(self, Key, ProjectionExpression=None,
+                 ExpressionAttributeNames=None, ConsistentRead=False):
+        self._resource.simulate_request('GetItem')
+        with self._resource.lock:
+            current = self.items.get(self.key_of(_normalize(Key), 'GetItem'))
+            current = copy.deepcopy(current)
+        if current is None:
+            return {}
+        return {'Item': _projected(current, ProjectionExpression,
+                                   ExpressionAttributeNames)}
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression=None,
+                    ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues='NONE',
+                    ReturnValuesOnConditionCheckFailure='NONE'):
+        self._resource.simulate_request('UpdateItem')
+        key_item = _normalize(Key)
+        values = _normalize(ExpressionAttributeValues or {})
+        with self._resource.lock:
+            key = self.key_of(key_item, 'UpdateItem')
+            self.check_not_in_transaction(key, 'UpdateItem')
+            current = self.items.get(key)
+            if not self.check_condition(current, ConditionExpression,
+                                        ExpressionAttributeNames, values,
+                                        'UpdateItem'):
+                raise self._failed_condition(
+                    'UpdateItem', current, ReturnValuesOnConditionCheckFailure)
+            new_item, updated = self.apply_update(
+                key_item, current, UpdateExpression,
+                ExpressionAttributeNames, values, 'UpdateItem')
+            self.items[key] = new_item
+        return {'Attributes': _return_values(ReturnValues, current, new_item,
+                                             updated)}
+
+    def delete_item(self, Key, ConditionExpression=None,
+                    ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues='NONE'):
+        self._resource.simulate_request('DeleteItem')
+        values = _normalize(ExpressionAttributeValues or {})
+        with self._resource.lock:
+            key = self.key_of(_normalize(Key), 'DeleteItem')
+            self.check_not_in_transaction(key, 'DeleteItem')
+            current = self.items.get(key)
+            if not self.check_condition(current, ConditionExpression,
+                                        ExpressionAttributeNames, values,
+                                        'DeleteItem'):
+                raise self._failed_condition('DeleteItem', current, 'NONE')
+            self.items.pop(key, None)
+        response = {}
+        if ReturnValues == 'ALL_OLD' and current is not None:
+            response['Attributes'] = current
+        return response
+
+    def query(self, KeyConditionExpression, IndexName=None,
+              FilterExpression=None, ProjectionExpression=None,
+              ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+              Limit=None, ExclusiveStartKey=None, ScanIndexForward=True,
+              Select=None, ConsistentRead=False):
+        self._resource.simulate_request('Query')
+        names = dict(ExpressionAttributeNames or {})
+        values = dict(ExpressionAttributeValues or {})
+        key_condition_expression = _build_expression(
+            KeyConditionExpression, names, values, True)
+        filter_expression = _build_expression(
+            FilterExpression, names, values, False)
+        values = _normalize(values)
+        index = self._index(IndexName, 'Query')
+        try:
+            condition, equalities = _Parser(
+                key_condition_expression, names, values).key_condition()
+        except ExpressionError as e:
+            raise _client_error('ValidationException', str(e), 'Query')
+        if index.hash_key not in equalities:
+            raise _client_error(
+                'ValidationException',
+                'Query condition missed key schema element: %s'
+                % index.hash_key, 'Query')
+
+        with self._resource.lock:
+            keys = self.items.partitions[index.name].get(
+                equalities[index.hash_key], {})
+            candidates = sorted(
+                ((self._position(index, self.items[key], False),
+                  self.items[key]) for key in keys),
+                key=lambda candidate: candidate[0],
+                reverse=not ScanIndexForward)
+            candidates = [candidate for candidate in candidates
+                          if condition(candidate[1])]
+            if ExclusiveStartKey:
+                start = self._position(index, _normalize(ExclusiveStartKey),
+                                       False)
+                candidates = [
+                    candidate for candidate in candidates
+                    if (candidate[0] > start if ScanIndexForward
+                        else candidate[0] < start)]
+            return self._read_page(
+                'Query', index, candidates, filter_expression,
+                ProjectionExpression, names, values, Limit, Select)
+
+    def scan(self, IndexName=None, FilterExpression=None,
+             ProjectionExpression=None, ExpressionAttributeNames=None,
+             ExpressionAttributeValues=None, Limit=None,
+             ExclusiveStartKey=None, Select=None, ConsistentRead=False):
+        self._resource.simulate_request('Scan')
+        names = dict(ExpressionAttributeNames or {})
+        values = dict(ExpressionAttributeValues or {})
+        filter_expression = _build_expression(
+            FilterExpression, names, values, False)
+        values = _normalize(values)
+        index = self._index(IndexName, 'Scan')
+
+        with self._resource.lock:
+            positions, keys = self._scan_order(index)
+            begin = 0
+            if ExclusiveStartKey:
+                begin = bisect.bisect_right(positions, self._position(
+                    index, _normalize(ExclusiveStartKey), True))
+            candidates = ((positions[number], self.items[keys[number]])
+                          for number in range(begin, len(keys)))
+            return self._read_page(
+                'Scan', index, candidates, filter_expression,
+                ProjectionExpression, names, values, Limit, Select)
+
+    @property
+    def item_count(self):
+        return len(self.items)
+
+    def _index(self, index_name, operation):
+        if index_name is None:
+            return self.primary
+        if index_name not in self.indexes:
+            raise _client_error(
+                'ValidationException',
+                'The table does not have the specified index: %s'
+                % index_name, operation)
+        return self.indexes[index_name]
+
+    def _position(self, index, item, scan):
+        """Sort key of an item in query (or scan) order"""
+        try:
+            position = (item[index.range_key] if index.range_key else None,
+                        self.key_of(item, 'Query'))
+            if scan:
+                position = (item[index.hash_key],) + position
+        except KeyError:
+            raise _client_error('ValidationException',
+                                'The provided starting key is invalid',
+                                'Scan' if scan else 'Query')
+        return position
+
+    def _scan_order(self, index):
+        """Positions and keys of the items of an index in scan order"""
+        version, positions, keys = self._scan_orders.get(
+            index.name, (None, None, None))
+        if version != self.items.version:
+            ordered = sorted(
+                (self._position(index, item, True), key)
+                for key, item in self.items.items() if index.covers(item))
+            positions = [position for position, _ in ordered]
+            keys = [key for _, key in ordered]
+            self._scan_orders[index.name] = (self.items.version, positions,
+                                             keys)
+        return positions, keys
+
+    def _read_page(self, operation, index, candidates, filter_expression,
+                   projection_expression, names, values, limit, select):
+        """
+        Read one page of a query/scan
+        * Limit counts the evaluated items (before the filter) and a page
+          stops at PAGE_SIZE_LIMIT bytes, as on DynamoDB
+        """
+        try:
+            condition = _Parser(filter_expression, names, values).condition() \
+                if filter_expression else None
+        except ExpressionError as e:
+            raise _client_error('ValidationException', str(e), operation)
+
+        items = []
+        scanned = 0
+        size = 0
+        last_evaluated_key = None
+        candidates = iter(candidates)
+        for _, item in candidates:
+            item = index.project(item, self.primary)
+            scanned += 1
+            size += _item_size(item)
+            if condition is None or condition(item):
+                items.append(copy.deepcopy(item))
+            if (limit and scanned >= limit) or size >= PAGE_SIZE_LIMIT:
+                if (limit and scanned >= limit) \
+                        or next(candidates, None) is not None:
+                    last_evaluated_key = {
+                        name: item[name] for name
+                        in self.primary.key_attributes()
+                        + index.key_attributes()}
+                break
+
+        response = {'Count': len(items), 'ScannedCount': scanned}
+        if select != 'COUNT':
+            response['Items'] = [_projected(item, projection_expression,
+                                            names) for item in items]
+        if last_evaluated_key:
+            response['LastEvaluatedKey'] = copy.deepcopy(last_evaluated_key)
+        return response
+
+    def expire_items(self, now):
+        """Delete the items whose TTL attribute is earlier than now"""
+        if not self.ttl_attribute:
+            return 0
+        with self._resource.lock:
+            expired = [key for key, item in self.items.items()
+                       if _type_rank(item.get(self.ttl_attribute)) == 'N'
+                       and item[self.ttl_attribute] < now]
+            for key in expired:
+                del self.items[key]
+        return len(expired)
+
+
+class MemoryStream:
+    """
+    In-memory stand-in for the DynamoDB stream of a table and for the Lambda
+    event source mapping reading it
+
+    * Every write of the table is recorded in order as a stream record in the
+      format Lambda receives (eventName INSERT / MODIFY / REMOVE, images in
+      the low-level AttributeValue format, increasing SequenceNumber)
+    * deliver() passes the records after the checkpoint to a handler in
+      batches and moves the checkpoint like an event source mapping with
+      ReportBatchItemFailures: up to the record before the first failure
+      the handler reports, or to the end of the batch
+
+    Parameters
+    ----------
+    table : MemoryTable
+        Table whose writes are recorded
+    view_type : str
+        StreamViewType (KEYS_ONLY / NEW_IMAGE / OLD_IMAGE /
+        NEW_AND_OLD_IMAGES)
+
+    """
+
+    def __init__(self, table, view_type):
+        self._table = table
+        self.view_type = view_type
+        self.records = []
+        # SequenceNumber of the last record the consumer has processed
+        self.checkpoint = 0
+        self._sequence_number = 0
+
+    def append(self, old_item, new_item):
+        """Record a write (old_item / new_item is None if absent)"""
+        if old_item is None and new_item is None:
+            return
+        self._sequence_number += 1
+        image = new_item if new_item is not None else old_item
+        record = {
+            'Keys': _serialize_item({
+                name: image[name]
+                for name in self._table.primary.key_attributes()}),
+            'SequenceNumber': str(self._sequence_number),
+            'StreamViewType': self.view_type,
+        }
+        if new_item is not None and self.view_type in (
+                'NEW_IMAGE', 'NEW_AND_OLD_IMAGES'):
+            record['NewImage'] = _serialize_item(new_item)
+        if old_item is not None and self.view_type in (
+                'OLD_IMAGE', 'NEW_AND_OLD_IMAGES'):
+            record['OldImage'] = _serialize_item(old_item)
+        self.records.append({
+            'eventID': '%s-%d' % (self._table.name, self._sequence_number),
+            'eventName': 'INSERT' if old_item is None
+            else 'REMOVE' if new_item is None else 'MODIFY',
+            'eventSource': 'aws:dynamodb',
+            'eventSourceARN': 'memory:table/%s/stream' % self._table.name,
+            'dynamodb': record,
+        })
+
+    def pending(self):
+        """Number of records after the checkpoint"""
+        return self._sequence_number - self.checkpoint
+
+    def deliver(self, handler, batch_size=100, max_batches=None):
+        """
+        Pass the records after the checkpoint to a handler in batches
+
+        Parameters
+        ----------
+        handler : callable
+            Lambda handler called as handler(event, None)
+        batch_size : int, optional
+            Maximum number of records per event, by default 100
+        max_batches : int, optional
+            Maximum number of events, by default None (until the stream is
+            drained or the handler reports a failure)
+
+        Returns
+        -------
+        processed : int
+            Number of records the checkpoint moved past
+        """
+        processed = 0
+        batches = 0
+        while self.pending() and (max_batches is None
+                                  or batches < max_batches):
+            with self._table._resource.lock:
+                start = self.checkpoint
+                batch = self.records[start:start + batch_size]
+            response = handler({'Records': batch}, None) or {}
+            batches += 1
+            failures = [int(failure['itemIdentifier']) for failure
+                        in response.get('batchItemFailures', [])]
+            last = int(batch[-1]['dynamodb']['SequenceNumber'])
+            if failures:
+                last = min(failures) - 1
+            processed += last - self.checkpoint
+            self.checkpoint = last
+            if failures:
+                break
+        return processed
+
+
+def _return_values(return_values, old_item, new_item, updated):
+    old_item = old_item or {}
+    if return_values == 'ALL_OLD':
+        return copy.deepcopy(old_item)
+    if return_values == 'ALL_NEW':
+        return copy.deepcopy(new_item)
+    if return_values == 'UPDATED_OLD':
+        return {name: copy.deepcopy(old_item[name]) for name in updated
+                if name in old_item}
+    if return_values == 'UPDATED_NEW':
+        return {name: copy.deepcopy(new_item[name]) for name in updated
+                if name in new_item}
+    return {}
+
+
+class MemoryClient:
+    """
+    In-memory stand-in for resource.meta.client
+    * Takes plain Python values, like the client behind a boto3 resource
+    """
+
+    def __init__(self, resource):
+        self._resource = resource
+        self._client_request_tokens = set()
+
+    def transact_write_items(self, TransactItems, ClientRequestToken=None):
+        """
+        All-or-nothing write of up to 100 Put/Update/Delete/ConditionCheck
+        * The items are held for the request latency, like the real service
+          holds them while a transaction is in flight: a concurrent
+          transaction writing one of them is cancelled with
+          TransactionConflict and a single-item write raises
+          TransactionConflictException
+        """
+        self._resource.simulate_request('TransactWriteItems', wait=False)
+        if len(TransactItems) > 100:
+            raise _client_error(
+                'ValidationException',
+                'Member must have length less than or equal to 100',
+                'TransactWriteItems')
+
+        with self._resource.lock:
+            if ClientRequestToken \
+                    and ClientRequestToken in self._client_request_tokens:
+                # Idempotent retry of a request that already succeeded
+                return {}
+            requests = self._prepare(TransactItems)
+            touched = [(table.name, key) for _, table, key, _, _ in requests]
+            conflicts = [name_key in self._resource.in_flight
+                         for name_key in touched]
+            if any(conflicts):
+                reasons = [{'Code': 'TransactionConflict',
+                            'Message': 'Transaction is ongoing for the item'}
+                           if conflict else {'Code': 'None'}
+                           for conflict in conflicts]
+                raise self._canceled(reasons)
+            self._resource.in_flight.update(touched)
+
+        try:
+            if self._resource.latency:
+                time.sleep(self._resource.latency)
+            with self._resource.lock:
+                self._commit(requests)
+                if ClientRequestToken:
+                    self._client_request_tokens.add(ClientRequestToken)
+        finally:
+            with self._resource.lock:
+                self._resource.in_flight.difference_update(touched)
+        return {}
+
+    def _prepare(self, transact_items):
+        """Resolve the table and key of every action"""
+        requests = []
+        touched = set()
+        for transact_item in transact_items:
+            (action, request), = transact_item.items()
+            table = self._resource.get_memory_table(
+                request['TableName'], 'TransactWriteItems')
+            if action == 'Put':
+                key_item = _normalize(request['Item'])
+            else:
+                key_item = _normalize(request['Key'])
+            key = table.key_of(key_item, 'TransactWriteItems')
+            if (table.name, key) in touched:
+                raise _client_error(
+                    'ValidationException',
+                    'Transaction request cannot include multiple '
+                    'operations on one item', 'TransactWriteItems')
+            touched.add((table.name, key))
+            requests.append((action, table, key, key_item, request))
+        return requests
+
+    def _commit(self, requests):
+        """Check every condition, then apply every write (or none)"""
+        reasons = []
+        writes = []
+        for action, table, key, key_item, request in requests:
+            names = request.get('ExpressionAttributeNames')
+            values = _normalize(request.get('ExpressionAttributeValues', {}))
+            current = table.items.get(key)
+            if not table.check_condition(
+                    current, request.get('ConditionExpression'), names,
+                    values, 'TransactWriteItems'):
+                reason = {'Code': 'ConditionalCheckFailed',
+                          'Message': 'The conditional request failed'}
+                if request.get('ReturnValuesOnConditionCheckFailure') \
+                        == 'ALL_OLD' and current is not None:
+                    reason['Item'] = _serialize_item(current)
+                reasons.append(reason)
+                continue
+            reasons.append({'Code': 'None'})
+
+            if action == 'Put':
+                writes.append((table, key, key_item))
+            elif action == 'Update':
+                new_item, _ = table.apply_update(
+                    key_item, current, request['UpdateExpression'],
+                    names, values, 'TransactWriteItems')
+                writes.append((table, key, new_item))
+            elif action == 'Delete':
+                writes.append((table, key, None))
+
+        if any(reason['Code'] != 'None' for reason in reasons):
+            raise self._canceled(reasons)
+
+        for table, key, item in writes:
+            if item is None:
+                table.items.pop(key, None)
+            else:
+                table.items[key] = item
+
+    def update_time_to_live(self, TableName, TimeToLiveSpecification):
+        """Enable/disable TTL (items are removed by MemoryResource.expire_items)"""
+        table = self._resource.get_memory_table(TableName, 'UpdateTimeToLive')
+        table.ttl_attribute = TimeToLiveSpecification['AttributeName'] \
+            if TimeToLiveSpecification['Enabled'] else None
+        return {'TimeToLiveSpecification': TimeToLiveSpecification}
+
+    def describe_time_to_live(self, TableName):
+        table = self._resource.get_memory_table(TableName,
+                                                'DescribeTimeToLive')
+        if not table.ttl_attribute:
+            return {'TimeToLiveDescription': {'TimeToLiveStatus': 'DISABLED'}}
+        return {'TimeToLiveDescription': {
+            'TimeToLiveStatus': 'ENABLED',
+            'AttributeName': table.ttl_attribute}}
+
+    def _canceled(self, reasons):
+        return _client_error(
+            'TransactionCanceledException',
+            'Transaction cancelled, please refer cancellation '
+            'reasons for specific reasons [%s]'
+            % ', '.join(reason['Code'] for reason in reasons),
+            'TransactWriteItems', CancellationReasons=reasons)
+
+
+class MemoryResource:
+    """
+    In-memory stand-in for boto3.resource('dynamodb')
+
+    Parameters
+    ----------
+    latency : float, optional
+        Seconds slept before every request to imitate a network round trip,
+        by default 0
+    throttle_rate : float, optional
+        Probability (0-1) that a request is throttled, by default 0
+        Throttled requests raise ProvisionedThroughputExceededException;
+        batch requests return the throttled keys as unprocessed instead
+    seed : int, optional
+        Seed of the throttling random numbers, by default None
+        Fix it to make a benchmark with throttling reproducible
+
+    """
+
+    def __init__(self, latency=0, throttle_rate=0, seed=None):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.lock = threading.RLock()
+        self.request_counts = {}
+        self.throttled_counts = {}
+        # (table name, key) of the items held by in-flight transactions
+        self.in_flight = set()
+        self._random = random.Random(seed)
+        self._tables = {}
+        self.meta = _Meta(MemoryClient(self))
+
+    def simulate_request(self, operation, wait=True, throttle=True):
+        """Count a request, wait for the configured latency and throttle"""
+        with self.lock:
+            self.request_counts[operation] = \
+                self.request_counts.get(operation, 0) + 1
+        if wait and self.latency:
+            time.sleep(self.latency)
+        if throttle and self.throttled(operation):
+            raise _client_error(
+                'ProvisionedThroughputExceededException',
+                'The level of configured provisioned throughput for the '
+                'table was exceeded', operation)
+
+    def throttled(self, operation):
+        """Draw whether one request (or one key of a batch) is throttled"""
+        if not self.throttle_rate:
+            return False
+        with self.lock:
+            throttled = self._random.random() < self.throttle_rate
+            if throttled:
+                self.throttled_counts[operation] = \
+                    self.throttled_counts.get(operation, 0) + 1
+        return throttled
+
+    def create_table(self, TableName, KeySchema, GlobalSecondaryIndexes=(),
+                     LocalSecondaryIndexes=(), StreamSpecification=None,
+                     **kwargs):
+        """
+        Create a table
+        * Attribute definitions, capacity settings, etc. are ignored
+        * With StreamSpecification (StreamEnabled true), the writes are
+          recorded in table.stream (MemoryStream)
+        """
+        with self.lock:
+            if TableName in self._tables:
+                raise _client_error('ResourceInUseException',
+                                    'Table already exists: %s' % TableName,
+                                    'CreateTable')
+            table = MemoryTable(
+                self, TableName, KeySchema,
+                list(GlobalSecondaryIndexes) + list(LocalSecondaryIndexes))
+            if StreamSpecification and str(StreamSpecification.get(
+                    'StreamEnabled', True)).lower() == 'true':
+                table.stream = MemoryStream(
+                    table, StreamSpecification.get('StreamViewType',
+                                                   'NEW_AND_OLD_IMAGES'))
+                table.items.stream = table.stream
+            self._tables[TableName] = table
+        return self._tables[TableName]
+
+    def get_memory_table(self, table_name, operation):
+        table = self._tables.get(table_name)
+        if table is None:
+            raise _client_error('ResourceNotFoundException',
+                                'Requested resource not found: %s'
+                                % table_name, operation)
+        return table
+
+    def Table(self, name):
+        return self.get_memory_table(name, 'DescribeTable')
+
+    def seed(self, table_name, items):
+        """
+        Store items directly (not counted, no latency or throttling)
+
+        Parameters
+        ----------
+        table_name : str
+            Table name
+        items : iterable of dict
+            Items to be stored
+
+        Returns
+        -------
+        count : int
+            Number of stored items
+        """
+        table = self.get_memory_table(table_name, 'PutItem')
+        count = 0
+        with self.lock:
+            for item in items:
+                item = _normalize(item)
+                table.items[table.key_of(item, 'PutItem')] = item
+                count += 1
+        return count
+
+    def expire_items(self, now=None):
+        """
+        Delete the expired items of every table with TTL enabled
+        * Like DynamoDB, expired items are returned by reads until they are
+          deleted; call this to run the deletion at a chosen time
+
+        Parameters
+        ----------
+        now : int, optional
+            Current time (epoch seconds), by default the current time
+
+        Returns
+        -------
+        count : int
+            Number of deleted items
+        """
+        now = Decimal(int(time.time() if now is None else now))
+        return sum(table.expire_items(now)
+                   for table in list(self._tables.values()))
+
+    def batch_get_item(self, RequestItems):
+        self.simulate_request('BatchGetItem', throttle=False)
+        responses = {}
+        unprocessed = {}
+        requested = 0
+        with self.lock:
+            for table_name, request in RequestItems.items():
+                table = self.get_memory_table(table_name, 'BatchGetItem')
+                found = []
+                for key in request['Keys']:
+                    requested += 1
+                    if self.throttled('BatchGetItem'):
+                        unprocessed.setdefault(
+                            table_name, dict(request, Keys=[]))['Keys'] \
+                            .append(key)
+                        continue
+                    item = table.items.get(
+                        table.key_of(_normalize(key), 'BatchGetItem'))
+                    if item is not None:
+                        found.append(_projected(
+                            copy.deepcopy(item),
+                            request.get('ProjectionExpression'),
+                            request.get('ExpressionAttributeNames')))
+                responses[table_name] = found
+        if requested and sum(len(request['Keys'])
+                             for request in unprocessed.values()) \
+                == requested:
+            raise _client_error(
+                'ProvisionedThroughputExceededException',
+                'The level of configured provisioned throughput for the '
+                'table was exceeded', 'BatchGetItem')
+        return {'Responses': responses, 'UnprocessedKeys': unprocessed}
+
+    def batch_write_item(self, RequestItems):
+        self.simulate_request('BatchWriteItem', throttle=False)
+        unprocessed = {}
+        requested = 0
+        with self.lock:
+            for table_name, requests in RequestItems.items():
+                table = self.get_memory_table(table_name, 'BatchWriteItem')
+                for request in requests:
+                    requested += 1
+                    if self.throttled('BatchWriteItem'):
+                        unprocessed.setdefault(table_name, []).append(request)
+                        continue
+                    if 'PutRequest' in request:
+                        item = _normalize(request['PutRequest']['Item'])
+                        table.items[table.key_of(item, 'BatchWriteItem')] \
+                            = item
+                    else:
+                        key = _normalize(request['DeleteRequest']['Key'])
+                        table.items.pop(
+                            table.key_of(key, 'BatchWriteItem'), None)
+        if requested and sum(len(requests) for requests
+                             in unprocessed.values()) == requested:
+            raise _client_error(
+                'ProvisionedThroughputExceededException',
+                'The level of configured provisioned throughput for the '
+                'table was exceeded', 'BatchWriteItem')
+        return {'UnprocessedItems': unprocessed}
@@ -0,0 +1,229 @@
+"""
+Build an aws.dynamodb.memory.MemoryResource from the SAM templates
+
+Tables (key schema, secondary indexes, TTL) are created from the
+AWS::DynamoDB::Table resources of the templates and seeded from JSON files
+such as APP/dynamodb_data/*.json.
+connection.get_resource() calls create_resource_from_environ() when
+DYNAMODB_BACKEND=memory, configured by these environment variables:
+
+DYNAMODB_MEMORY_TEMPLATES
+    Template paths separated by os.pathsep
+DYNAMODB_MEMORY_ENVIRONMENT
+    Value of the Environment parameter of the templates (default: its Default)
+DYNAMODB_MEMORY_SEED
+    "TableName=glob" entries separated by os.pathsep
+DYNAMODB_MEMORY_LATENCY / DYNAMODB_MEMORY_THROTTLE_RATE /
+DYNAMODB_MEMORY_RANDOM_SEED
+    Arguments of MemoryResource
+
+PyYAML is needed only to read the templates.
+
+"""
+import glob
+import json
+import os
+from decimal import Decimal
+
+from aws.dynamodb.memory import MemoryResource
+
+TABLE_RESOURCE_TYPE = 'AWS::DynamoDB::Table'
+
+
+class _Tag:
+    """CloudFormation intrinsic function (!Ref, !FindInMap, ...)"""
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+def load_template(path):
+    """
+    Read a SAM/CloudFormation template
+
+    Parameters
+    ----------
+    path : str
+        Template path
+
+    Returns
+    -------
+    template : dict
+        Template with the intrinsic functions kept as _Tag objects
+    """
+    import yaml
+
+    class TemplateLoader(yaml.SafeLoader):
+        pass
+
+    def construct_tag(loader, suffix, node):
+        if isinstance(node, yaml.ScalarNode):
+            value = loader.construct_scalar(node)
+        elif isinstance(node, yaml.SequenceNode):
+            value = loader.construct_sequence(node, deep=True)
+        else:
+            value = loader.construct_mapping(node, deep=True)
+        return _Tag(suffix, value)
+
+    TemplateLoader.add_multi_constructor('!', construct_tag)
+    with open(path, encoding='utf-8') as template_file:
+        return yaml.load(template_file, Loader=TemplateLoader)
+
+
+def get_table_definitions(template, environment=None):
+    """
+    Retrieve the definitions of the tables in a template
+
+    Parameters
+    ----------
+    template : dict
+        Template read by load_template
+    environment : str, optional
+        Value of the Environment parameter, by default its Default
+
+    Returns
+    -------
+    definitions : list of dict
+        create_table arguments (with StreamSpecification if any), plus
+        TimeToLiveSpecification if any
+    """
+    parameters = {
+        name: parameter.get('Default')
+        for name, parameter in template.get('Parameters', {}).items()}
+    if environment is not None:
+        parameters['Environment'] = environment
+
+    def resolve(value):
+        if isinstance(value, _Tag):
+            if value.name == 'Ref':
+                return parameters.get(value.value, value.value)
+            if value.name == 'FindInMap':
+                mapping, first, second = [resolve(element)
+                                          for element in value.value]
+                return template['Mappings'][mapping][first][second]
+            if value.name == 'Sub':
+                resolved = value.value
+                for name, parameter in parameters.items():
+                    resolved = resolved.replace('${%s}' % name,
+                                                str(parameter))
+                return resolved
+            raise ValueError('Unsupported intrinsic function: !%s'
+                             % value.name)
+        if isinstance(value, list):
+            return [resolve(element) for element in value]
+        if isinstance(value, dict):
+            return {name: resolve(element) for name, element in value.items()}
+        return value
+
+    definitions = []
+    for logical_id, resource in template.get('Resources', {}).items():
+        if resource.get('Type') != TABLE_RESOURCE_TYPE:
+            continue
+        properties = resolve(resource['Properties'])
+        definition = {
+            'TableName': properties.get('TableName', logical_id),
+            'KeySchema': properties['KeySchema'],
+            'GlobalSecondaryIndexes':
+                properties.get('GlobalSecondaryIndexes', []),
+            'LocalSecondaryIndexes':
+                properties.get('LocalSecondaryIndexes', []),
+        }
+        if 'StreamSpecification' in properties:
+            definition['StreamSpecification'] = \
+                properties['StreamSpecification']
+        if 'TimeToLiveSpecification' in properties:
+            definition['TimeToLiveSpecification'] = \
+                properties['TimeToLiveSpecification']
+        definitions.append(definition)
+    return definitions
+
+
+def create_tables_from_template(resource, path, environment=None):
+    """
+    Create the tables of a template in a MemoryResource
+
+    Parameters
+    ----------
+    resource : aws.dynamodb.memory.MemoryResource
+        Resource the tables are created in
+    path : str
+        Template path
+    environment : str, optional
+        Value of the Environment parameter, by default its Default
+
+    Returns
+    -------
+    table_names : list of str
+        Names of the created tables
+    """
+    table_names = []
+    for definition in get_table_definitions(load_template(path), environment):
+        ttl = definition.pop('TimeToLiveSpecification', None)
+        resource.create_table(**definition)
+        if ttl:
+            resource.meta.client.update_time_to_live(
+                TableName=definition['TableName'],
+                TimeToLiveSpecification={
+                    'AttributeName': ttl['AttributeName'],
+                    'Enabled': str(ttl.get('Enabled')).lower() == 'true'})
+        table_names.append(definition['TableName'])
+    return table_names
+
+
+def seed_from_json(resource, table_name, pattern):
+    """
+    Store the items of JSON files (one item or a list of items per file)
+
+    Parameters
+    ----------
+    resource : aws.dynamodb.memory.MemoryResource
+        Resource the items are stored in
+    table_name : str
+        Table name
+    pattern : str
+        Glob pattern of the JSON files
+
+    Returns
+    -------
+    count : int
+        Number of stored items
+    """
+    count = 0
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding='utf-8') as json_file:
+            data = json.load(json_file, parse_float=Decimal)
+        count += resource.seed(
+            table_name, data if isinstance(data, list) else [data])
+    return count
+
+
+def create_resource_from_environ():
+    """
+    Create a MemoryResource configured by the DYNAMODB_MEMORY_* variables
+
+    Returns
+    -------
+    resource : aws.dynamodb.memory.MemoryResource
+        Resource with the tables created and seeded
+    """
+    random_seed = os.environ.get('DYNAMODB_MEMORY_RANDOM_SEED')
+    resource = MemoryResource(
+        latency=float(os.environ.get('DYNAMODB_MEMORY_LATENCY', 0)),
+        throttle_rate=float(
+            os.environ.get('DYNAMODB_MEMORY_THROTTLE_RATE', 0)),
+        seed=int(random_seed) if random_seed else None)
+
+    environment = os.environ.get('DYNAMODB_MEMORY_ENVIRONMENT')
+    for path in _split(os.environ.get('DYNAMODB_MEMORY_TEMPLATES')):
+        create_tables_from_template(resource, path, environment)
+    for entry in _split(os.environ.get('DYNAMODB_MEMORY_SEED')):
+        table_name, pattern = entry.split('=', 1)
+        seed_from_json(resource, table_name, pattern)
+    return resource
+
+
+def _split(value):
+    """Split a os.pathsep separated environment variable"""
+    return [element for element in (value or '').split(os.pathsep)
+            if element]
@@ -0,0 +1,163 @@
+"""
+Module for DynamoDB transactions
+
+Actions are created by the table controllers (DynamoDB._transact_put /
+_transact_update) with plain Python values and committed here in one
+TransactWriteItems request, so they succeed or fail together.
+
+"""
+import logging
+import os
+import random
+import time
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+from aws.dynamodb import connection
+
+# ログ出力の設定
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Maximum number of actions in one TransactWriteItems request
+TRANSACT_WRITE_ITEMS_LIMIT = 100
+# Bounded retry of transactions cancelled by contention or throttling
+TRANSACT_MAX_RETRIES = int(os.environ.get('TRANSACT_MAX_RETRIES', 5))
+TRANSACT_BACKOFF_BASE_SECONDS = 0.02
+TRANSACT_BACKOFF_MAX_SECONDS = 0.5
+RETRYABLE_CANCELLATION_REASONS = (
+    'TransactionConflict', 'ThrottlingError', 'ProvisionedThroughputExceeded')
+RETRYABLE_ERROR_CODES = (
+    'TransactionConflictException', 'TransactionInProgressException',
+    'ThrottlingException', 'ProvisionedThroughputExceededException')
+
+
+class TransactionCanceledError(Exception):
+    """
+    Raised when a transaction is cancelled
+
+    Attributes
+    ----------
+    reasons : list of str
+        Cancellation reason code of each action, in the order of the actions
+        ('None' for the actions that did not cause the cancellation)
+    items : list of dict
+        Item of each action as it was when its condition failed, for the
+        actions created with return_values_on_condition_check_failure
+        (None for the other actions)
+
+    """
+
+    def __init__(self, message, reasons, items=None):
+        super().__init__(message)
+        self.reasons = reasons
+        self.items = items or [None] * len(reasons)
+
+
+def transact_write_items(actions, client_request_token=None,
+                         max_retries=TRANSACT_MAX_RETRIES):
+    """
+    Commit write actions atomically
+    * Cancellations caused only by contention (TransactionConflict) or
+      throttling are retried up to max_retries times with jittered backoff
+    * Cancellations caused by a condition are not retried
+
+    Parameters
+    ----------
+    actions : list of dict
+        Actions created by the table controllers
+    client_request_token : str, optional
+        Idempotency token, by default None
+        Retrying with the same token does not apply the actions twice
+    max_retries : int, optional
+        Maximum number of retries, by default TRANSACT_MAX_RETRIES
+
+    Returns
+    -------
+    response : dict
+        Response information
+
+    Raises
+    ------
+    TransactionCanceledError
+        The transaction was cancelled (and not retried any further)
+
+    """
+    if len(actions) > TRANSACT_WRITE_ITEMS_LIMIT:
+        raise ValueError('Too many actions in one transaction: %d'
+                         % len(actions))
+
+    request = {'TransactItems': actions}
+    if client_request_token:
+        request['ClientRequestToken'] = client_request_token
+
+    for attempt in range(max_retries + 1):
+        try:
+            return connection.get_client().transact_write_items(**request)
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            reasons = [reason.get('Code', 'None') for reason
+                       in e.response.get('CancellationReasons', [])]
+            if code == 'TransactionCanceledException':
+                retryable = _is_retryable(reasons)
+            elif code in RETRYABLE_ERROR_CODES:
+                retryable = True
+            else:
+                raise e
+
+            if not retryable or attempt == max_retries:
+                if code == 'TransactionCanceledException':
+                    raise TransactionCanceledError(
+                        str(e), reasons, _get_cancelled_items(
+                            e.response['CancellationReasons'])) from e
+                raise e
+
+        logger.info('Transaction retry %d/%d: %s',
+                    attempt + 1, max_retries, reasons or code)
+        ceiling = min(TRANSACT_BACKOFF_MAX_SECONDS,
+                      TRANSACT_BACKOFF_BASE_SECONDS * (2 ** attempt))
+        time.sleep(random.uniform(0, ceiling))
+
+
+def _is_retryable(reasons):
+    """
+    Whether a cancellation was caused only by contention or throttling
+
+    Parameters
+    ----------
+    reasons : list of str
+        Cancellation reason code of each action
+
+    Returns
+    -------
+    retryable : bool
+        True if the same request may succeed when sent again
+
+    """
+    failed = [reason for reason in reasons if reason != 'None']
+    return bool(failed) and all(
+        reason in RETRYABLE_CANCELLATION_REASONS for reason in failed)
+
+
+def _get_cancelled_items(cancellation_reasons):
+    """
+    Items returned with the cancellation reasons
+
+    Parameters
+    ----------
+    cancellation_reasons : list of dict
+        CancellationReasons of the error response
+
+    Returns
+    -------
+    items : list of dict
+        Item of each action with plain Python values, None for the actions
+        without one
+
+    """
+    deserializer = TypeDeserializer()
+    return [{name: deserializer.deserialize(value)
+             for name, value in reason['Item'].items()}
+            if 'Item' in reason else None
+            for reason in cancellation_reasons]
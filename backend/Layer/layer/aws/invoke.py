@@ -0,0 +1,157 @@
+"""
+Asynchronous invocation of Lambda functions
+
+Used by functions that split their work into several invocations, passing
+the position to continue from in the payload.
+
+LAMBDA_BACKEND selects how an invocation is delivered:
+"lambda" (default) calls the Invoke API with InvocationType Event,
+"local" queues it on local_invoker, an in-process stand-in that runs the
+queued invocations with LocalInvoker.run (for local runs and benchmarks).
+
+"""
+import json
+import os
+import threading
+import time
+import uuid
+
+from botocore.config import Config
+
+from aws.dynamodb import connection
+
+BACKEND = os.environ.get('LAMBDA_BACKEND', 'lambda')
+
+BOTO_CONFIG = Config(
+    connect_timeout=float(os.environ.get('LAMBDA_CONNECT_TIMEOUT', 1)),
+    read_timeout=float(os.environ.get('LAMBDA_READ_TIMEOUT', 5)),
+    retries={'max_attempts': 3, 'mode': 'standard'},
+)
+
+_lock = threading.Lock()
+_client = None
+
+
+class LocalContext:
+    """
+    Stand-in of the Lambda context object
+
+    Parameters
+    ----------
+    function_name : str
+        Function name
+    timeout_millis : int
+        Time limit of the invocation
+    clock : callable, optional
+        Returns the current time in seconds, by default time.monotonic
+    """
+
+    def __init__(self, function_name, timeout_millis, clock=time.monotonic):
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self._clock = clock
+        self._deadline = clock() + timeout_millis / 1000
+
+    def get_remaining_time_in_millis(self):
+        """Milliseconds left before the time limit"""
+        return max(int((self._deadline - self._clock()) * 1000), 0)
+
+
+class LocalInvoker:
+    """
+    In-process stand-in of asynchronous invocations
+    * Invocations are queued and run one after another by run, each with a
+      LocalContext, so a function that re-invokes itself runs to the end
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def invoke(self, function_name, payload):
+        """Queue an invocation (the payload goes through JSON as on Lambda)"""
+        with self._lock:
+            self._pending.append((function_name, json.loads(json.dumps(
+                payload))))
+
+    def pending(self):
+        """Number of queued invocations"""
+        with self._lock:
+            return len(self._pending)
+
+    def clear(self):
+        """Discard the queued invocations"""
+        with self._lock:
+            self._pending.clear()
+
+    def run(self, handlers, timeout_millis, max_invocations=None):
+        """
+        Run the queued invocations, including the ones they queue
+
+        Parameters
+        ----------
+        handlers : dict
+            Handler of each function name
+        timeout_millis : int
+            Time limit of each invocation
+        max_invocations : int, optional
+            Stop after this many invocations, by default None (no limit)
+
+        Returns
+        -------
+        results : list
+            (function name, payload, return value) of each invocation
+        """
+        results = []
+        while max_invocations is None or len(results) < max_invocations:
+            with self._lock:
+                if not self._pending:
+                    break
+                function_name, payload = self._pending.pop(0)
+            context = LocalContext(function_name, timeout_millis)
+            results.append((function_name, payload,
+                            handlers[function_name](payload, context)))
+        return results
+
+
+local_invoker = LocalInvoker()
+
+
+def get_client():
+    """
+    Retrieve the shared Lambda client
+
+    Returns
+    -------
+    client : botocore.client.Lambda
+        Client created on first use from the shared boto3 session
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = connection.get_session().client(
+                    'lambda', config=BOTO_CONFIG)
+    return _client
+
+
+def invoke_async(function_name, payload):
+    """
+    Invoke a function asynchronously
+
+    Parameters
+    ----------
+    function_name : str
+        Function name (context.function_name to invoke the running function)
+    payload : dict
+        Event passed to the function (JSON serializable)
+    """
+    if BACKEND == 'local':
+        local_invoker.invoke(function_name, payload)
+        return
+    try:
+        get_client().invoke(FunctionName=function_name,
+                            InvocationType='Event',
+                            Payload=json.dumps(payload).encode())
+    except Exception as e:
+        raise e
@@ -2,11 +2,66 @@
 ChannelAccessTokenテーブル操作用モジュール
 
 """
+import logging
 import os
+import threading
+import time
+from collections import namedtuple
 from datetime import datetime
 from dateutil.tz import gettz
 
+from aws.dynamodb import connection
 from aws.dynamodb.base import DynamoDB
+from common.ttl_cache import TTLCache
+
+logger = logging.getLogger()
+
+# チャネルアクセストークンのキャッシュ設定(有効期限0秒でキャッシュしない)
+# ※期限日(limitDate)を過ぎたトークンはキャッシュの有効期限内でも使用しない
+CHANNEL_TOKEN_CACHE_TTL_SECONDS = float(
+    os.environ.get('CHANNEL_TOKEN_CACHE_TTL_SECONDS', 3600))
+CHANNEL_TOKEN_CACHE_MAX_SIZE = int(
+    os.environ.get('CHANNEL_TOKEN_CACHE_MAX_SIZE', 16))
+# キャッシュの有効期限の何秒前からテーブルを読み直すか
+# (読み直す間も他の呼び出しはキャッシュしたトークンを使用する)
+CHANNEL_TOKEN_REFRESH_SECONDS = float(
+    os.environ.get('CHANNEL_TOKEN_REFRESH_SECONDS', 60))
+# 期限日の書式
+LIMIT_DATE_FORMAT = '%Y-%m-%d %H:%M:%S%z'
+
+# キャッシュしたトークン(refresh_at: 読み直しを始める時刻(time.monotonic))
+CachedToken = namedtuple('CachedToken', ['channel_access_token', 'refresh_at'])
+
+# ウォームスタート間で共有するチャネルアクセストークンのキャッシュ
+channel_token_cache = TTLCache(CHANNEL_TOKEN_CACHE_MAX_SIZE,
+                               CHANNEL_TOKEN_CACHE_TTL_SECONDS,
+                               copy_values=False)
+# テーブルの読み直しを1回にまとめるための、チャネルIDごとのロック
+# (他のチャネルの読み直しを待たないよう、チャネルごとに分ける)
+_token_refresh_locks = {}
+# _token_refresh_locksにロックを追加する際のロック
+_token_refresh_locks_lock = threading.Lock()
+
+
+def _get_token_refresh_lock(channel_id):
+    """
+    チャネルのトークンの読み直し用のロックを取得する
+
+    Parameters
+    ----------
+    channel_id : str
+        チャネルID
+
+    Returns
+    -------
+    lock : threading.Lock
+        チャネルのロック(初回に作成する)
+    """
+    with _token_refresh_locks_lock:
+        lock = _token_refresh_locks.get(channel_id)
+        if lock is None:
+            lock = _token_refresh_locks[channel_id] = threading.Lock()
+    return lock
 
 
 class ChannelAccessToken(DynamoDB):
@@ -17,7 +72,7 @@ class ChannelAccessToken(DynamoDB):
         """初期化メソッド"""
         table_name = os.environ.get('CHANNEL_ACCESS_TOKEN_DB')
         super().__init__(table_name)
-        self._table = self._db.Table(table_name)
+        self._table = connection.get_table(table_name)
 
     def get_item(self, channel_id):
         """
@@ -42,6 +97,89 @@ class ChannelAccessToken(DynamoDB):
             raise e
         return item
 
+    def get_channel_access_token(self, channel_id):
+        """
+        短期チャネルアクセストークンを取得する
+        ※期限日(limitDate)まで、最長CHANNEL_TOKEN_CACHE_TTL_SECONDSキャッシュし、
+        同じチャネルのトークンの読み込みはウォームスタート間で1回にまとめる
+        ※キャッシュの有効期限のCHANNEL_TOKEN_REFRESH_SECONDS前
+        (有効期限が短い場合は期間の半分)になると、
+        1つの呼び出しのみがテーブルを読み直し、他の呼び出しは読み直しを待たずに
+        キャッシュしたトークンを使用する
+        ※読み直しはチャネルごとにまとめ、他のチャネルの読み直しは待たない
+
+        Parameters
+        ----------
+        channel_id : str
+            チャネルID
+
+        Returns
+        -------
+        channel_access_token : str
+            短期チャネルアクセストークン
+
+        """
+        cached = channel_token_cache.get(channel_id)
+        if cached is not None and cached.refresh_at > time.monotonic():
+            return cached.channel_access_token
+        token_refresh_lock = _get_token_refresh_lock(channel_id)
+        if cached is not None:
+            # 他の呼び出しが読み直している場合は、キャッシュしたトークンを使用する
+            if not token_refresh_lock.acquire(blocking=False):
+                return cached.channel_access_token
+        else:
+            token_refresh_lock.acquire()
+
+        try:
+            # ロックの取得を待つ間に読み直された場合は、そのトークンを使用する
+            latest = channel_token_cache.get(channel_id)
+            if latest is not None and latest is not cached \
+                    and latest.refresh_at > time.monotonic():
+                return latest.channel_access_token
+            try:
+                item = self.get_item(channel_id)
+            except Exception as e:
+                if cached is None:
+                    raise e
+                logger.warning('チャネルアクセストークンの読み直しに失敗したため、'
+                               'キャッシュしたトークンを使用します。'
+                               'channelId: %s, %s', channel_id, e)
+                return cached.channel_access_token
+            self._cache_channel_access_token(channel_id, item)
+        finally:
+            token_refresh_lock.release()
+        return item['channelAccessToken']
+
+    def _cache_channel_access_token(self, channel_id, item):
+        """
+        チャネルアクセストークンを期限日までキャッシュする
+        クラス内のみで使用。
+
+        Parameters
+        ----------
+        channel_id : str
+            チャネルID
+        item : dict
+            チャネルの情報
+        """
+        ttl = CHANNEL_TOKEN_CACHE_TTL_SECONDS
+        if item.get('limitDate'):
+            remaining = datetime.strptime(
+                item['limitDate'], LIMIT_DATE_FORMAT).timestamp() - time.time()
+            if remaining <= 0:
+                # 更新バッチがトークンを更新するまでは、テーブルのトークンを
+                # 使用しつつ読み直しの間隔だけキャッシュする
+                logger.warning('チャネルアクセストークンの期限日を過ぎています。'
+                               'channelId: %s, limitDate: %s',
+                               channel_id, item['limitDate'])
+                remaining = CHANNEL_TOKEN_REFRESH_SECONDS
+            ttl = min(ttl, remaining)
+        # 有効期限が短い場合も、半分の期間は読み直さずに使用する
+        refresh_in = ttl - min(CHANNEL_TOKEN_REFRESH_SECONDS, ttl / 2)
+        channel_token_cache.set(channel_id, CachedToken(
+            item['channelAccessToken'], time.monotonic() + refresh_in),
+            ttl=ttl)
+
     def update_item(self, channel_id, channel_access_token, limit_date):
         """
         短期チャネルアクセストークンと期限日を更新する
@@ -77,28 +215,33 @@ class ChannelAccessToken(DynamoDB):
                                          expression_value, return_value)
         except Exception as e:
             raise e
+        # 古いトークンを使用しないよう、キャッシュを破棄する
+        channel_token_cache.invalidate(lambda key: key == channel_id)
         return response
 
-    def scan(self, channel_id=''):
+    def scan(self, channel_id='', page_size=None):
         """
         scanメソッドを使用してデータ取得
+        ※ページ単位で読み込むため、1MBを超えるテーブルでも全件取得できる
 
         Parameters
         ----------
         channel_id : str
             LINE公式アカウント（Messageing API or MINIアプリ）のチャネルID
+        page_size : int, optional
+            1リクエストあたりの最大取得件数, by default None
 
         Returns
         -------
-        items : list
-            取得したアイテムのリスト
+        items : generator
+            取得したアイテムを1件ずつ返すジェネレータ
 
         """
 
         key = 'channelId'
 
         try:
-            items = self._scan(key, channel_id)
+            items = self._iter_scan(key, channel_id, page_size)
         except Exception as e:
             raise e
         return items
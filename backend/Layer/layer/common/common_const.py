@@ -11,13 +11,18 @@ from linebot.models import (
     QuickReplyButton, CameraAction, CameraRollAction, LocationAction
 )
 
-const.API_PROFILE_URL = 'https://api.line.me/v2/profile'
-const.API_NOTIFICATIONTOKEN_URL = 'https://api.line.me/message/v3/notifier/token'  # noqa: E501
-const.API_ACCESSTOKEN_URL = 'https://api.line.me/v2/oauth/accessToken'
-const.API_SENDSERVICEMESSAGE_URL = 'https://api.line.me/message/v3/notifier/send?target=service'  # noqa 501
-const.API_USER_ID_URL = 'https://api.line.me/oauth2/v2.1/verify'
+# Messaging APIのエンドポイント(ローカル実行・ベンチマークでは代替サーバーを指定する)
+const.API_ENDPOINT = os.getenv('LINE_API_ENDPOINT', 'https://api.line.me')
+const.API_PROFILE_URL = const.API_ENDPOINT + '/v2/profile'
+const.API_NOTIFICATIONTOKEN_URL = const.API_ENDPOINT + '/message/v3/notifier/token'  # noqa: E501
+const.API_ACCESSTOKEN_URL = const.API_ENDPOINT + '/v2/oauth/accessToken'
+const.API_SENDSERVICEMESSAGE_URL = const.API_ENDPOINT + '/message/v3/notifier/send?target=service'  # noqa 501
+const.API_USER_ID_URL = const.API_ENDPOINT + '/oauth2/v2.1/verify'
 
 const.MSG_ERROR_NOPARAM = 'パラメータ未設定エラー'
+const.MSG_ERROR_FULLY_BOOKED = '選択した時間帯は満席です'
+const.MSG_ERROR_OUT_OF_BUSINESS_HOURS = '選択した時間帯は営業時間外です'
+const.MSG_ERROR_NO_COURSE = '選択したコースは存在しません'
 const.DATA_LIMIT_TIME = 60 * 60 * 12
 const.ONE_WEEK = timedelta(days=7)
 const.JST_UTC_TIMEDELTA = timedelta(hours=9)
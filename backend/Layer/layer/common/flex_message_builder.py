@@ -0,0 +1,463 @@
+"""
+フレックスメッセージ作成用モジュール
+リマインドメッセージはテンプレートIDと引数のみを登録し、送信時に作成する
+送信するメッセージのJSONはインポート時に1回だけ変換し(FlexTemplate)、
+作成時は値のJSONのみを挟む(dictやSDKのオブジェクトを経由しない)
+"""
+import json
+import logging
+import os
+
+from common import common_const
+from common.ttl_cache import TTLCache
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# リマインド通知のテンプレートID
+REMIND_TEMPLATE_ID = 'restaurant_remind'
+# 作成したメッセージのキャッシュ設定
+# 同じ店舗・日時・コース・人数の予約は同じメッセージになるため、送信時に再利用する
+TEMPLATE_CACHE_TTL_SECONDS = float(
+    os.environ.get('FLEX_TEMPLATE_CACHE_TTL_SECONDS', 900))
+TEMPLATE_CACHE_MAX_SIZE = int(
+    os.environ.get('FLEX_TEMPLATE_CACHE_MAX_SIZE', 1024))
+# 作成したメッセージは変更せずに送信するため、コピーせずに保持する
+template_cache = TTLCache(TEMPLATE_CACHE_MAX_SIZE, TEMPLATE_CACHE_TTL_SECONDS,
+                          copy_values=False)
+
+
+class Slot:
+    """
+    テンプレートの骨組みで、値を差し込む箇所
+
+    Parameters
+    ----------
+    name : str
+        差し込む値の名前
+    """
+    __slots__ = ['name']
+
+    def __init__(self, name):
+        self.name = name
+
+
+class FlexTemplate:
+    """
+    JSONに変換済みのフレックスメッセージのテンプレート
+    ※作成時に骨組みをJSONに変換し、差し込み箇所(スロット)の前後を
+    UTF-8のバイト列として保持する。render_json()ではその間に値のJSONのみを挟む
+
+    Parameters
+    ----------
+    skeleton : dict
+        メッセージの骨組み。値がSlotの箇所に差し込む
+    slot_paths : dict, optional
+        スロット名ごとの差し込み箇所のパス(キー・インデックスのタプル)のリスト
+        Slotを置けない骨組み(common_const.const.FLEX)に使用し、
+        骨組みの値を既定値とする, by default None
+    """
+
+    def __init__(self, skeleton, slot_paths=None):
+        names = set()
+        marked = self._mark_slots(skeleton, names)
+        self.defaults = {}
+        for name, paths in (slot_paths or {}).items():
+            for path in paths:
+                node = marked
+                for key in path[:-1]:
+                    node = node[key]
+                self.defaults.setdefault(name, node[path[-1]])
+                node[path[-1]] = self._marker(name)
+                names.add(name)
+        text = json.dumps(marked, ensure_ascii=False, separators=(',', ':'))
+        self.names = frozenset(names)
+        self._json_parts = []
+        self._json_names = []
+        for part in text.split('"\\u0000'):
+            name, separator, rest = part.partition('\\u0000"')
+            if separator:
+                self._json_names.append(name)
+                self._json_parts.append(rest.encode())
+            else:
+                self._json_parts.append(part.encode())
+
+    @classmethod
+    def _mark_slots(cls, node, names):
+        """骨組みのSlotを、JSONで区切れる目印の文字列に置き換えたコピーを作成する"""
+        if isinstance(node, Slot):
+            names.add(node.name)
+            return cls._marker(node.name)
+        if isinstance(node, dict):
+            return {key: cls._mark_slots(child, names)
+                    for key, child in node.items()}
+        if isinstance(node, list):
+            return [cls._mark_slots(child, names) for child in node]
+        return node
+
+    @staticmethod
+    def _marker(name):
+        """スロットの目印の文字列(JSONでは\\u0000で囲まれる)"""
+        return '\0%s\0' % name
+
+    def _raise_mismatch(self, values):
+        """不足・不明な値をTypeErrorで通知する"""
+        raise TypeError('Template values mismatch, missing: %s, unknown: %s' % (
+            sorted(self.names - values.keys()),
+            sorted(values.keys() - self.names)))
+
+    def render_json(self, values):
+        """
+        値を差し込んだメッセージをJSON(UTF-8)で作成する
+        ※dictを経由せず、変換済みのバイト列に値のJSONのみを挟む
+
+        Parameters
+        ----------
+        values : dict
+            スロット名ごとの値(slot_pathsのスロットは省略時に既定値)
+
+        Returns
+        -------
+        result : bytes
+            FlexmessageのJSON
+        """
+        if self.defaults:
+            values = {**self.defaults, **values}
+        # 件数が一致すれば、不明な値がある場合は不足する値もある(下で確認する)
+        if len(values) != len(self.names):
+            self._raise_mismatch(values)
+        parts = [self._json_parts[0]]
+        try:
+            for name, part in zip(self._json_names, self._json_parts[1:]):
+                parts.append(json.dumps(values[name],
+                                        ensure_ascii=False).encode())
+                parts.append(part)
+        except KeyError:
+            self._raise_mismatch(values)
+        return b''.join(parts)
+
+
+# 予約日当日とそれ以外のメッセージの文言
+REMIND_HEADER_MESSAGE_ON_DAY = 'ご予約日の当日となりました'
+REMIND_HEADER_MESSAGE_DAYS_BEFORE = 'ご予約日の%d日前となりました'
+REMIND_LAST_MESSAGE_ON_DAY = "本日は、お会いできることを心よりお待ちしています。\nどうぞお気をつけてお越しください。\n\n※このメッセージは、Use Case 予約（レストラン）デモアプリが送信したリマインド通知です。"  # noqa: E501
+REMIND_LAST_MESSAGE_DAYS_BEFORE = "当日は、お会いできることを心よりお待ちしています。\n\n※このメッセージは、Use Case 予約（レストラン）デモアプリが送信したリマインド通知です。"  # noqa: E501
+
+
+def create_restaurant_remind(**kwargs):
+    """
+    Messaging APIに渡すリマインド通知用メッセージの取得
+
+    Parameters
+    ----------
+    shop_name
+        店名
+    reservation_date
+        予約日
+    course_name
+        コース名
+    remind_date_difference
+        リマインドを送信する日付と予約日の差分(0:当日、マイナス:前日以前)
+    number_of_people
+        予約人数
+    Returns
+    -------
+    result : dict
+        Flexmessageの元になる辞書型データ
+    """
+    return _create_remind_message(**_create_remind_values(**kwargs))
+
+
+def create_restaurant_remind_json(**kwargs):
+    """
+    リマインド通知用メッセージをJSON(UTF-8)で取得する
+
+    Parameters
+    ----------
+    create_restaurant_remindと同じ
+
+    Returns
+    -------
+    result : bytes
+        FlexmessageのJSON
+    """
+    return REMIND_TEMPLATE.render_json(_create_remind_values(**kwargs))
+
+
+def _create_remind_values(shop_name, reservation_date, course_name,
+                          number_of_people, remind_date_difference):
+    """リマインド通知のメッセージに差し込む値を作成する"""
+    # 予約日当日とそれ以外のメッセージで文言を変える
+    if remind_date_difference < 0:
+        header_message = REMIND_HEADER_MESSAGE_DAYS_BEFORE % abs(
+            remind_date_difference)
+        last_message = REMIND_LAST_MESSAGE_DAYS_BEFORE
+    else:
+        header_message = REMIND_HEADER_MESSAGE_ON_DAY
+        last_message = REMIND_LAST_MESSAGE_ON_DAY
+    return {
+        'header_message': header_message,
+        'shop_name': shop_name,
+        'reservation_date': reservation_date,
+        'course_name': course_name,
+        'number_of_people': number_of_people,
+        'last_message': last_message,
+    }
+
+
+def _create_remind_message(header_message, shop_name, reservation_date,
+                           course_name, number_of_people, last_message):
+    """リマインド通知のメッセージを作成する(REMIND_TEMPLATEの骨組みにも使用する)"""
+    flex_msg = {
+        "type": "flex",
+        "altText": header_message,
+        "contents": {
+            "type": "bubble",
+            "header": {
+                "type": "box",
+                "layout": "vertical",
+                "flex": 0,
+                "contents": [
+                    {
+                        "type": "text",
+                        "text": "リマインド通知",
+                        "size": "sm",
+                        "weight": "bold",
+                        "color": "#36DB34"
+                    },
+                    {
+                        "type": "text",
+                        "text": header_message,
+                        "size": "lg",
+                        "weight": "bold"
+                    }
+                ]
+            },
+            "hero": {
+                "type": "image",
+                "url": "https://media.istockphoto.com/photos/modern-room-with-tables-and-chairs-picture-id639067562",  # noqa: E501
+                "size": "full",
+                "aspectRatio": "2:1",
+                "aspectMode": "cover",
+                "action": {
+                    "type": "uri",
+                    "label": "Action",
+                    "uri": "https://line.me/ja/"
+                }
+            },
+            "body": {
+                "type": "box",
+                "layout": "vertical",
+                "spacing": "md",
+                "margin": "xs",
+                "contents": [
+                    {
+                        "type": "box",
+                        "layout": "vertical",
+                        "spacing": "sm",
+                        "margin": "lg",
+                        "contents": [
+                            {
+                                "type": "box",
+                                "layout": "baseline",
+                                "spacing": "sm",
+                                "contents": [
+                                    {
+                                        "type": "text",
+                                        "text": "店舗名:",
+                                        "flex": 1,
+                                        "size": "sm",
+                                        "align": "start",
+                                        "color": "#5B5B5B"
+                                    },
+                                    {
+                                        "type": "text",
+                                        "text": shop_name,
+                                        "flex": 2,
+                                        "size": "sm",
+                                        "align": "start",
+                                        "color": "#666666",
+                                        "wrap": True
+                                    }
+                                ]
+                            },
+                            {
+                                "type": "box",
+                                "layout": "baseline",
+                                "spacing": "sm",
+                                "contents": [
+                                    {
+                                        "type": "text",
+                                        "text": "日時:",
+                                        "flex": 1,
+                                        "size": "sm",
+                                        "color": "#5B5B5B"
+                                    },
+                                    {
+                                        "type": "text",
+                                        "text": reservation_date,
+                                        "flex": 2,
+                                        "size": "sm",
+                                        "align": "start",
+                                        "color": "#666666",
+                                        "wrap": True
+                                    }
+                                ]
+                            },
+                            {
+                                "type": "box",
+                                "layout": "baseline",
+                                "spacing": "sm",
+                                "contents": [
+                                    {
+                                        "type": "text",
+                                        "text": "コース:",
+                                        "flex": 1,
+                                        "size": "sm",
+                                        "color": "#5B5B5B"
+                                    },
+                                    {
+                                        "type": "text",
+                                        "text": course_name,
+                                        "flex": 2,
+                                        "size": "sm",
+                                        "align": "start",
+                                        "color": "#666666",
+                                        "wrap": True
+                                    }
+                                ]
+                            },
+                            {
+                                "type": "box",
+                                "layout": "baseline",
+                                "spacing": "sm",
+                                "contents": [
+                                    {
+                                        "type": "text",
+                                        "text": "人数:",
+                                        "flex": 1,
+                                        "size": "sm",
+                                        "color": "#5B5B5B"
+                                    },
+                                    {
+                                        "type": "text",
+                                        "text": number_of_people,
+                                        "flex": 2,
+                                        "size": "sm",
+                                        "align": "start",
+                                        "color": "#666666",
+                                        "wrap": True
+                                    }
+                                ]
+                            },
+                            {
+                                "type": "box",
+                                "layout": "vertical",
+                                "margin": "lg",
+                                "contents": [
+                                    {
+                                        "type": "text",
+                                        "text": last_message,
+                                        "size": "sm",
+                                        "color": "#4A4141",
+                                        "wrap": True
+                                    }
+                                ]
+                            }
+                        ]
+                    }
+                ]
+            }
+        }
+    }
+
+    return flex_msg
+
+
+# リマインド通知のJSONのテンプレート
+REMIND_TEMPLATE = FlexTemplate(_create_remind_message(
+    **{name: Slot(name) for name in (
+        'header_message', 'shop_name', 'reservation_date', 'course_name',
+        'number_of_people', 'last_message')}))
+
+# common_const.const.FLEXのJSONのテンプレート(骨組みの値が既定値)
+FLEX_CONTENTS_PATH = ('contents', 'body', 'contents')
+FLEX_TEMPLATE = FlexTemplate(common_const.const.FLEX, slot_paths={
+    'alt_text': [('altText',)],
+    'title': [FLEX_CONTENTS_PATH + (0, 'text')],
+    'rating': [FLEX_CONTENTS_PATH + (1, 'contents', 5, 'text')],
+    'place': [FLEX_CONTENTS_PATH + (2, 'contents', 0, 'contents', 1, 'text')],
+    'time': [FLEX_CONTENTS_PATH + (2, 'contents', 1, 'contents', 1, 'text')],
+})
+
+
+def create_flex_message_json(**kwargs):
+    """
+    common_const.const.FLEXのメッセージをJSON(UTF-8)で取得する
+
+    Parameters
+    ----------
+    alt_text, title, rating, place, time : str, optional
+        代替テキスト、店名、評価、場所、営業時間(省略時はconst.FLEXの値)
+
+    Returns
+    -------
+    result : bytes
+        FlexmessageのJSON
+    """
+    return FLEX_TEMPLATE.render_json(kwargs)
+
+
+# テンプレートIDごとのメッセージ作成関数(JSONを返却する)と、引数(登録する順)
+TEMPLATES = {
+    REMIND_TEMPLATE_ID: (create_restaurant_remind_json, (
+        'shop_name', 'reservation_date', 'course_name', 'number_of_people',
+        'remind_date_difference')),
+}
+
+
+def create_template_params(template_id, **kwargs):
+    """
+    テンプレートから作成するメッセージの引数を、登録用のリストにする
+
+    Parameters
+    ----------
+    template_id : str
+        テンプレートID
+    kwargs
+        テンプレートのメッセージ作成関数の引数
+
+    Returns
+    -------
+    template_params : list
+        引数の値(TEMPLATESの引数の順)
+    """
+    _, param_names = TEMPLATES[template_id]
+    return [kwargs[param_name] for param_name in param_names]
+
+
+def render_template(template_id, template_params):
+    """
+    テンプレートIDと引数からメッセージをJSON(UTF-8)で作成する
+    ※作成したメッセージはキャッシュし、同じ引数では同じオブジェクトを返却する
+    ※送信時にそのままリクエストに含める(common.line.send_push_message等)
+
+    Parameters
+    ----------
+    template_id : str
+        テンプレートID
+    template_params : list
+        引数の値(create_template_paramsの戻り値)
+
+    Returns
+    -------
+    result : bytes
+        FlexmessageのJSON
+    """
+    key = (template_id, tuple(template_params))
+    flex_msg = template_cache.get(key)
+    if flex_msg is None:
+        create_message, param_names = TEMPLATES[template_id]
+        flex_msg = create_message(**dict(zip(param_names, template_params)))
+        template_cache.set(key, flex_msg)
+    return flex_msg
@@ -1,43 +1,225 @@
 import logging
 import json
+import os
+import threading
+from http import HTTPStatus
 import requests
 import json
 from linebot import LineBotApi
+from linebot.http_client import (RequestsHttpClient, RequestsHttpResponse)
 from linebot.models import FlexSendMessage
 from linebot.exceptions import (
     LineBotApiError, InvalidSignatureError)
+from requests.adapters import HTTPAdapter
 from requests.models import Response
 
 from common import common_const
+from common.ttl_cache import TTLCache
 
 # ログ出力の設定
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# LINE APIへの接続設定
+# 接続先ホストごとに保持する接続数(並列で送信するスレッド数以上にする)
+HTTP_POOL_MAXSIZE = int(os.environ.get('LINE_HTTP_POOL_MAXSIZE', 32))
+# 接続を保持する接続先ホストの数
+HTTP_POOL_CONNECTIONS = int(os.environ.get('LINE_HTTP_POOL_CONNECTIONS', 4))
+# (接続のタイムアウト, 読み込みのタイムアウト)秒
+HTTP_TIMEOUT = (float(os.environ.get('LINE_HTTP_CONNECT_TIMEOUT', 3)),
+                float(os.environ.get('LINE_HTTP_READ_TIMEOUT', 10)))
+# 1回のマルチキャストで送信できるユーザー数の上限
+MULTICAST_MAX_RECIPIENTS = 500
+# チャネルアクセストークンごとのクライアントのキャッシュ設定
+LINE_CLIENT_CACHE_TTL_SECONDS = float(
+    os.environ.get('LINE_CLIENT_CACHE_TTL_SECONDS', 3600))
+LINE_CLIENT_CACHE_MAX_SIZE = int(
+    os.environ.get('LINE_CLIENT_CACHE_MAX_SIZE', 16))
 
-def send_push_message(channel_access_token, flex_obj, user_id):
+_session_lock = threading.Lock()
+_session = None
+# ウォームスタート間で共有する、チャネルアクセストークンごとのクライアント
+line_client_cache = TTLCache(LINE_CLIENT_CACHE_MAX_SIZE,
+                             LINE_CLIENT_CACHE_TTL_SECONDS, copy_values=False)
+
+
+def get_session():
+    """
+    LINE APIへのリクエストで共有するセッションを取得する
+    ※接続を保持(keep-alive)して再利用するため、リクエストごとの
+    TCP・TLSの接続処理を省ける。初回の呼び出し時に作成し、ウォームスタート間で共有する
+
+    Returns
+    -------
+    session : requests.Session
+        セッション
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # 失敗したリクエストは呼び出し元で扱うため、ここでは再送しない
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS,
+                                      pool_maxsize=HTTP_POOL_MAXSIZE,
+                                      max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+class SessionHttpClient(RequestsHttpClient):
+    """LineBotApiのリクエストを共有のセッションで送信するHTTPクライアント"""
+
+    def get(self, url, headers=None, params=None, stream=False,
+            timeout=None):
+        response = get_session().get(
+            url, headers=headers, params=params, stream=stream,
+            timeout=timeout or self.timeout)
+        return RequestsHttpResponse(response)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        response = get_session().post(
+            url, headers=headers, data=data, timeout=timeout or self.timeout)
+        return RequestsHttpResponse(response)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        response = get_session().delete(
+            url, headers=headers, data=data, timeout=timeout or self.timeout)
+        return RequestsHttpResponse(response)
+
+
+class SerializedMessage:
+    """
+    JSON(UTF-8)に変換済みのメッセージ
+    ※flex_message_builder.render_template等で作成したJSONを、
+    SDKのオブジェクトに変換せずにそのままリクエストに含める
+
+    Parameters
+    ----------
+    message_json : bytes
+        メッセージのJSON
+    """
+    __slots__ = ['message_json']
+
+    def __init__(self, message_json):
+        self.message_json = message_json
+
+
+def create_message(flex_obj):
+    """
+    送信するメッセージを作成する
+
+    Parameters
+    ----------
+    flex_obj : dict or bytes
+        メッセージ情報(辞書型データ、またはJSON(UTF-8))
+
+    Returns
+    -------
+    message : FlexSendMessage or SerializedMessage
+        メッセージ
+    """
+    if isinstance(flex_obj, bytes):
+        return SerializedMessage(flex_obj)
+    return FlexSendMessage.new_from_json_dict(flex_obj)
+
+
+class PooledLineBotApi(LineBotApi):
+    """
+    複数のスレッド・リクエストで共有するLineBotApi
+    ※LineBotApi.push_message・multicastはリトライキーをインスタンスのヘッダーに
+    設定し、以降のリクエストにも送信されるため、リクエストごとのヘッダーに設定する
+    ※SerializedMessageはJSONのまま、その他のメッセージはJSONに変換して送信する
+    """
+
+    def push_message(self, to, messages, retry_key=None,
+                     notification_disabled=False, timeout=None):
+        self._send_message('/v2/bot/message/push', to, messages, retry_key,
+                           notification_disabled, timeout)
+
+    def multicast(self, to, messages, retry_key=None,
+                  notification_disabled=False, timeout=None):
+        self._send_message('/v2/bot/message/multicast', to, messages,
+                           retry_key, notification_disabled, timeout)
+
+    def _send_message(self, path, to, messages, retry_key,
+                      notification_disabled, timeout):
+        if not isinstance(messages, (list, tuple)):
+            messages = [messages]
+        headers = {'Content-Type': 'application/json'}
+        if retry_key:
+            headers['X-Line-Retry-Key'] = retry_key
+        messages_json = [
+            message.message_json if isinstance(message, SerializedMessage)
+            else json.dumps(message.as_json_dict()).encode()
+            for message in messages]
+        data = b''.join([
+            b'{"to":', json.dumps(to).encode(),
+            b',"messages":[', b','.join(messages_json),
+            b'],"notificationDisabled":',
+            json.dumps(notification_disabled).encode(), b'}'])
+        self._post(path, data=data, headers=headers, timeout=timeout)
+
+
+def get_line_bot_api(channel_access_token):
+    """
+    チャネルアクセストークンのLineBotApiを取得する
+    ※トークンごとにキャッシュし、送信は共有のセッションで行う
+
+    Parameters
+    ----------
+    channel_access_token : str
+        短期チャネルアクセストークン
+
+    Returns
+    -------
+    line_bot_api : PooledLineBotApi
+        LineBotApi
+    """
+    line_bot_api = line_client_cache.get(channel_access_token)
+    if line_bot_api is None:
+        line_bot_api = PooledLineBotApi(
+            channel_access_token, endpoint=common_const.const.API_ENDPOINT,
+            timeout=HTTP_TIMEOUT, http_client=SessionHttpClient)
+        line_client_cache.set(channel_access_token, line_bot_api)
+    return line_bot_api
+
+
+def send_push_message(channel_access_token, flex_obj, user_id,
+                      retry_key=None):
     """
     プッシュメッセージ送信処理
     Parameters
     channel_access_token:str
         短期チャネルアクセストークン
-    flex_obj:dict
-        メッセージ情報
+    flex_obj:dict or bytes
+        メッセージ情報(辞書型データ、またはJSON(UTF-8))
     user_id:str
         送信先のユーザーI
+    retry_key:str
+        リトライキー(UUID)
+        同じリトライキーのリクエストは、LINEプラットフォームで1回のみ受け付けられる
     Returns
     -------
     response:dict
         レスポンス情報
+        同じリトライキーのリクエストが受け付け済みの場合はNone
     """
     try:
-        line_bot_api = LineBotApi(
-            channel_access_token)
-        # flexdictを生成する
-        flex_obj = FlexSendMessage.new_from_json_dict(flex_obj)
+        line_bot_api = get_line_bot_api(channel_access_token)
+        # flexdictを生成する(JSONの場合は変換しない)
+        flex_obj = create_message(flex_obj)
         user_id = user_id
-        response = line_bot_api.push_message(user_id, flex_obj)
+        response = line_bot_api.push_message(user_id, flex_obj,
+                                             retry_key=retry_key)
     except LineBotApiError as e:
+        # 同じリトライキーのリクエストが受け付け済み(送信済み)
+        if retry_key and e.status_code == HTTPStatus.CONFLICT:
+            logger.info('Push message already accepted. retry key: %s',
+                        retry_key)
+            return None
         logger.error(
             'Got exception from LINE Messaging API: %s\n' % e.message)
         for m in e.error.details:
@@ -49,7 +231,52 @@ def send_push_message(channel_access_token, flex_obj, user_id):
 
     return response
 
-    
+
+def send_multicast_message(channel_access_token, flex_obj, user_ids,
+                           retry_key=None):
+    """
+    マルチキャストメッセージ送信処理
+    同じメッセージを複数のユーザーに1回のリクエストで送信する
+    Parameters
+    channel_access_token:str
+        短期チャネルアクセストークン
+    flex_obj:dict or bytes
+        メッセージ情報(辞書型データ、またはJSON(UTF-8))
+    user_ids:list of str
+        送信先のユーザーID(最大MULTICAST_MAX_RECIPIENTS件)
+    retry_key:str
+        リトライキー(UUID)
+        同じリトライキーのリクエストは、LINEプラットフォームで1回のみ受け付けられる
+    Returns
+    -------
+    response:dict
+        レスポンス情報
+        同じリトライキーのリクエストが受け付け済みの場合はNone
+    """
+    try:
+        line_bot_api = get_line_bot_api(channel_access_token)
+        # flexdictを生成する(JSONの場合は変換しない)
+        flex_obj = create_message(flex_obj)
+        response = line_bot_api.multicast(user_ids, flex_obj,
+                                          retry_key=retry_key)
+    except LineBotApiError as e:
+        # 同じリトライキーのリクエストが受け付け済み(送信済み)
+        if retry_key and e.status_code == HTTPStatus.CONFLICT:
+            logger.info('Multicast message already accepted. retry key: %s',
+                        retry_key)
+            return None
+        logger.error(
+            'Got exception from LINE Messaging API: %s\n' % e.message)
+        for m in e.error.details:
+            logger.error('  %s: %s' % (m.property, m.message))
+        raise Exception
+    except InvalidSignatureError as e:
+        logger.error('Occur Exception: %s', e)
+        raise Exception
+
+    return response
+
+
 def get_profile(id_token, channel_id):
     """
     LINEユーザー情報取得処理
@@ -69,10 +296,42 @@ def get_profile(id_token, channel_id):
         'id_token': id_token,
         'client_id': channel_id
     }
-    response = requests.post(
+    response = get_session().post(
         common_const.const.API_USER_ID_URL,
         headers=headers,
-        data=body
+        data=body,
+        timeout=HTTP_TIMEOUT
+    )
+    res_body = json.loads(response.text)
+    return res_body
+
+
+def issue_channel_access_token(channel_id, channel_secret):
+    """
+    短期チャネルアクセストークン発行処理
+    Parameters
+    ----------
+    channel_id:str
+        チャネルID
+    channel_secret:str
+        チャネルシークレット
+    Returns
+    -------
+    res_body:dict
+        レスポンス情報
+        access_token:短期チャネルアクセストークン
+    """
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    body = {
+        'grant_type': 'client_credentials',
+        'client_id': channel_id,
+        'client_secret': channel_secret
+    }
+    response = get_session().post(
+        common_const.const.API_ACCESSTOKEN_URL,
+        headers=headers,
+        data=body,
+        timeout=HTTP_TIMEOUT
     )
     res_body = json.loads(response.text)
-    return res_body
\ No newline at end of file
+    return res_body
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+トークンバケット方式のレート制限
+複数スレッドから同じAPIを呼び出す場合に、1秒あたりのリクエスト数を上限以下に抑える
+"""
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    トークンバケット方式のレート制限(スレッドセーフ)
+    ※待ち時間はロックの外で待機するため、待機中も他のスレッドは順番を確保できる
+
+    Parameters
+    ----------
+    rate : float
+        1秒あたりのリクエスト数の上限。0以下の場合は制限しない
+    burst : int, optional
+        連続で許可するリクエスト数, by default None(1秒分)
+    clock : callable, optional
+        現在時刻(秒)を返す関数, by default time.monotonic
+    sleep : callable, optional
+        待機する関数, by default time.sleep
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.rate = rate
+        self.burst = max(int(burst if burst is not None else rate), 1)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        リクエスト1回分の許可を得る(上限を超える場合は待機する)
+
+        Returns
+        -------
+        waited : float
+            待機した秒数
+        """
+        if self.rate <= 0:
+            return 0
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # 不足分は前借りし、補充されるまでの時間だけ待機する
+            self._tokens -= 1
+            waited = -self._tokens / self.rate if self._tokens < 0 else 0
+        if waited:
+            self._sleep(waited)
+        return waited
+
+
+class KeyedRateLimiter:
+    """
+    キー(チャネルID等)ごとのレート制限
+
+    Parameters
+    ----------
+    rate : float
+        キーごとの1秒あたりのリクエスト数の上限
+    burst : int, optional
+        キーごとに連続で許可するリクエスト数, by default None(1秒分)
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """
+        キーのリクエスト1回分の許可を得る
+
+        Parameters
+        ----------
+        key : str
+            レート制限のキー
+
+        Returns
+        -------
+        waited : float
+            待機した秒数
+        """
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.setdefault(
+                    key, RateLimiter(self.rate, self.burst))
+        return limiter.acquire()
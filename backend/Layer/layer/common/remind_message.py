@@ -4,16 +4,25 @@ RemindMessage操作用モジュール
 """
 from datetime import (datetime, timedelta)
 from dateutil.tz import gettz
+from botocore.exceptions import ClientError
 import uuid
 import decimal
 import os
+import time
 
 from common import common_const
+from aws.dynamodb import connection
 from aws.dynamodb.base import DynamoDB
 
 ONE_WEEK = timedelta(days=7)
 JST_UTC_TIMEDELTA = timedelta(hours=9)
 
+# 送信状況(remindStatus)
+# 未送信のメッセージはremindStatusを持たない
+REMIND_STATUS_SENDING = 'sending'
+REMIND_STATUS_SENT = 'sent'
+REMIND_STATUS_FAILED = 'failed'
+
 
 class RemindMessage(DynamoDB):
     __slots__ = ['_table']
@@ -22,7 +31,7 @@ class RemindMessage(DynamoDB):
         """初期化メソッド"""
         table_name = os.environ.get("MESSAGE_DB")
         super().__init__(table_name)
-        self._table = self._db.Table(table_name)
+        self._table = connection.get_table(table_name)
 
     def put_push_message(self, user_id, channel_id, flex_message,
                          remind_date):
@@ -45,13 +54,127 @@ class RemindMessage(DynamoDB):
         response : dict
             レスポンス情報
         """
+        item = self._create_push_message_item(
+            user_id, channel_id, remind_date, flex_message=flex_message)
+
+        try:
+            response = self._put_item(item)
+        except Exception as e:
+            raise e
+        return response
+
+    def create_put_push_message_action(self, user_id, channel_id,
+                                       flex_message, remind_date):
+        """
+        トランザクションで登録するためのPutアクションを作成する
+
+        Parameters
+        ----------
+        put_push_messageと同じ
+
+        Returns
+        -------
+        action : dict
+            aws.dynamodb.transactionに渡すPutアクション
+        """
+        item = self._create_push_message_item(
+            user_id, channel_id, remind_date, flex_message=flex_message)
+        return self._transact_put(item)
+
+    def create_put_template_message_action(self, user_id, channel_id,
+                                           template_id, template_params,
+                                           remind_date):
+        """
+        テンプレートから送信時に作成するプッシュメッセージを、
+        トランザクションで登録するためのPutアクションを作成する
+        ※メッセージ本文の代わりにテンプレートIDと引数のみを登録するため、
+        アイテムのサイズ(書き込みキャパシティ)を抑えられる
+
+        Parameters
+        ----------
+        user_id : str
+            ユーザーID
+        channel_id : str
+            メッセージ送信するチャネルのID
+        template_id : str
+            テンプレートID(common.flex_message_builder.TEMPLATES)
+        template_params : list
+            テンプレートの引数
+        remind_date : str
+            リマインド日
+
+        Returns
+        -------
+        action : dict
+            aws.dynamodb.transactionに渡すPutアクション
+        """
+        item = self._create_push_message_item(
+            user_id, channel_id, remind_date, template_id=template_id,
+            template_params=template_params)
+        return self._transact_put(item)
+
+    def put_push_messages(self, push_messages):
+        """
+        複数のプッシュメッセージをBatchWriteItemでまとめて登録する
+
+        Parameters
+        ----------
+        push_messages : list of dict
+            user_id, channel_id, remind_dateと、flex_messageまたは
+            template_id, template_paramsをキーに持つプッシュメッセージ情報のリスト
+
+        Returns
+        -------
+        round_trips : int
+            DynamoDBへのリクエスト回数
+        """
+        items = [self._create_push_message_item(**push_message)
+                 for push_message in push_messages]
+
+        try:
+            round_trips = self._batch_put_items(items)
+        except Exception as e:
+            raise e
+        return round_trips
+
+    def _create_push_message_item(self, user_id, channel_id, remind_date,
+                                  flex_message=None, template_id=None,
+                                  template_params=None):
+        """
+        登録するプッシュメッセージのアイテムを作成する。
+        クラス内のみで使用。
+
+        Parameters
+        ----------
+        user_id : str
+            ユーザーID
+        channel_id : str
+            メッセージ送信するチャネルのID
+        remind_date : str
+            リマインド日
+        flex_message : str, optional
+            フレックスメッセージのjson形式文字列
+        template_id : str, optional
+            flex_messageの代わりに送信時に使用するテンプレートID
+        template_params : list, optional
+            テンプレートの引数
+
+        Returns
+        -------
+        item : dict
+            プッシュメッセージのアイテム
+        """
         message_id = str(uuid.uuid4())
         message_info = {
             'messageType': "push",
             'userId': user_id,
             'channelId': channel_id,
-            'messageBody': flex_message
         }
+        if template_id is None:
+            message_info['messageBody'] = flex_message
+        else:
+            message_info['templateId'] = template_id
+            message_info['templateParams'] = template_params
         item = {
             'id': message_id,
             'messageInfo': message_info,
@@ -62,13 +185,7 @@ class RemindMessage(DynamoDB):
             'updatedTime': datetime.now(
                 gettz('Asia/Tokyo')).strftime("%Y/%m/%d %H:%M:%S")
         }
-
-        try:
-            response = self._put_item(item)
-        except Exception as e:
-            raise e
-        return response
-
+        return item
 
     def get_item(self, id):
         """
@@ -93,19 +210,58 @@ class RemindMessage(DynamoDB):
             raise e
         return item
 
-    def query_index_remind_date(self, remind_date):
+    def query_index_remind_date(self, remind_date, page_size=None):
         """
         remindDateのindexからアイテムを取得する
+        ※ページ単位で読み込むため、1MBを超える件数でも全件取得できる
+
+        Parameters
+        ----------
+        remind_date : str
+            リマインド日
+        page_size : int, optional
+            1リクエストあたりの最大取得件数, by default None
+
+        Returns
+        -------
+        items : generator
+            リマインド日から取得したアイテムを1件ずつ返すジェネレータ
+
+        """
+        index = 'remindDate-index'
+        expression = 'remindDate = :remindDate'
+        expression_value = {
+            ':remindDate': remind_date,
+        }
+
+        try:
+            items = self._iter_query_index(index, expression,
+                                           expression_value, page_size)
+        except Exception as e:
+            raise e
+        return items
+
+    def query_index_remind_date_page(self, remind_date, page_size=None,
+                                     exclusive_start_key=None):
+        """
+        remindDateのindexからアイテムを1ページ分取得する
+        ※処理を中断した位置(last_evaluated_key)から、別の実行で再開するために使用する
 
         Parameters
         ----------
         remind_date : str
             リマインド日
+        page_size : int, optional
+            1リクエストあたりの最大取得件数, by default None
+        exclusive_start_key : dict, optional
+            前のページのlast_evaluated_key, by default None(最初のページ)
 
         Returns
         -------
         items : list
             リマインド日から取得したアイテム
+        last_evaluated_key : dict
+            次のページの開始位置、最後のページの場合はNone
 
         """
         index = 'remindDate-index'
@@ -115,10 +271,103 @@ class RemindMessage(DynamoDB):
         }
 
         try:
-            items = self._query_index(index, expression, expression_value)
+            page = self._query_index_page(index, expression, expression_value,
+                                          page_size, exclusive_start_key)
         except Exception as e:
             raise e
-        return items
+        return page
+
+    def start_sending(self, id, lease_seconds, retry_key):
+        """
+        メッセージの送信状況を送信中にする
+        ※未送信・送信失敗のメッセージ、または送信中のまま期限(lease_seconds)を
+        過ぎたメッセージ(送信中に実行が中断されたもの)のみ更新するため、
+        同じメッセージを並行して、または送信済みのメッセージを再度送信することはない
+        ※リトライキーは最初に送信中にした時のものを保持する。再送時に同じキーで
+        送信することで、送信済みのリクエストはLINEプラットフォームで受け付けられない
+
+        Parameters
+        ----------
+        id : str
+            メッセージのid
+        lease_seconds : int
+            送信中の状態を有効とする秒数
+        retry_key : str
+            送信するリクエストのリトライキー(UUID)
+
+        Returns
+        -------
+        retry_key : str
+            このメッセージを送信するリトライキー(以前に送信を試みている場合はその時のキー)
+            送信済み・他の実行が送信中の場合はNone
+
+        """
+        key = {'id': id}
+        now = int(time.time())
+        update_expression = 'SET #remindStatus = :sending, ' \
+            'sendingExpiration = :expiration, ' \
+            'retryKey = if_not_exists(retryKey, :retry_key), ' \
+            'updatedTime = :updated_time'
+        condition_expression = 'attribute_not_exists(#remindStatus) ' \
+            'OR #remindStatus = :failed ' \
+            'OR (#remindStatus = :sending AND sendingExpiration < :now)'
+        expression_value = {
+            ':sending': REMIND_STATUS_SENDING,
+            ':failed': REMIND_STATUS_FAILED,
+            ':expiration': now + lease_seconds,
+            ':now': now,
+            ':retry_key': retry_key,
+            ':updated_time': datetime.now(
+                gettz('Asia/Tokyo')).strftime("%Y/%m/%d %H:%M:%S")
+        }
+
+        try:
+            response = self._update_item_optional(
+                key, update_expression, condition_expression,
+                {'#remindStatus': 'remindStatus'}, expression_value,
+                'ALL_NEW')
+        except ClientError as e:
+            if e.response['Error']['Code'] == \
+                    'ConditionalCheckFailedException':
+                return None
+            raise e
+        return response['Attributes']['retryKey']
+
+    def finish_sending(self, id, remind_status):
+        """
+        送信中のメッセージの送信状況を送信済み・送信失敗にする
+
+        Parameters
+        ----------
+        id : str
+            メッセージのid
+        remind_status : str
+            REMIND_STATUS_SENTまたはREMIND_STATUS_FAILED
+
+        Returns
+        -------
+        response : dict
+            レスポンス情報
+
+        """
+        key = {'id': id}
+        update_expression = 'SET #remindStatus = :status, ' \
+            'updatedTime = :updated_time REMOVE sendingExpiration'
+        condition_expression = '#remindStatus = :sending'
+        expression_value = {
+            ':status': remind_status,
+            ':sending': REMIND_STATUS_SENDING,
+            ':updated_time': datetime.now(
+                gettz('Asia/Tokyo')).strftime("%Y/%m/%d %H:%M:%S")
+        }
+
+        try:
+            response = self._update_item_optional(
+                key, update_expression, condition_expression,
+                {'#remindStatus': 'remindStatus'}, expression_value, 'NONE')
+        except Exception as e:
+            raise e
+        return response
 
     def _get_timestamp_after_one_week(self, date):
         """
@@ -0,0 +1,136 @@
+"""
+有効期限付きLRUキャッシュ
+Lambdaのウォームスタート間で保持され、ほぼ変更されないデータの読み込みを減らす
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    件数上限と有効期限付きのLRUキャッシュ
+
+    Parameters
+    ----------
+    max_size : int
+        保持する最大件数。超えた場合は最も長く使われていないものを破棄する
+    ttl : float
+        有効期限(秒)。0以下の場合はキャッシュしない
+    clock : callable, optional
+        現在時刻(秒)を返す関数, by default time.monotonic
+    copy_values : bool, optional
+        値をコピーして保持・返却するか, by default True
+        変更しない値(読み取り専用のオブジェクト)のみFalseにできる
+    """
+
+    def __init__(self, max_size, ttl, clock=time.monotonic,
+                 copy_values=True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._copy_values = copy_values
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        キャッシュから値を取得する
+        ※呼び出し元で変更されても影響しないよう、コピーを返却する
+        (copy_valuesがFalseの場合は保持している値をそのまま返却する)
+
+        Parameters
+        ----------
+        key : hashable
+            キー
+        default : object, optional
+            キャッシュにない場合の戻り値, by default None
+
+        Returns
+        -------
+        value : object
+            キャッシュした値のコピー
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self._clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            value = entry[1]
+        return copy.deepcopy(value) if self._copy_values else value
+
+    def set(self, key, value, ttl=None):
+        """
+        値をキャッシュする
+
+        Parameters
+        ----------
+        key : hashable
+            キー
+        value : object
+            キャッシュする値(コピーして保持する)
+        ttl : float, optional
+            この値の有効期限(秒), by default None(キャッシュの有効期限)
+            キャッシュの有効期限より長い場合はキャッシュの有効期限を使用する
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        if self._copy_values:
+            value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate=None):
+        """
+        キャッシュを破棄する
+
+        Parameters
+        ----------
+        predicate : callable, optional
+            キーを受け取り、破棄する場合にTrueを返す関数
+            by default None(全件破棄)
+
+        Returns
+        -------
+        count : int
+            破棄した件数
+        """
+        with self._lock:
+            if predicate is None:
+                count = len(self._entries)
+                self._entries.clear()
+                return count
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def stats(self):
+        """
+        ヒット数等の統計情報を取得する
+
+        Returns
+        -------
+        stats : dict
+            hits, misses, evictions, size
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
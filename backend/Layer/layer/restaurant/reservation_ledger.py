@@ -0,0 +1,167 @@
+"""
+RestaurantReservationLedger操作用モジュール
+
+Append-only ledger of the reservations of the shops.
+One immutable event item is appended per booking, keyed by shopId and
+eventKey (YYYY-MM-DD#reservationId), so the events of a shop sort by day
+and a booking never updates an item another booking updates.
+The events are folded into the RestaurantShopReservation aggregates
+asynchronously from the table's stream; appliedTime is the only attribute
+set afterwards, by the consumer, to record that the event has been folded.
+
+"""
+import os
+from datetime import datetime
+from boto3.dynamodb.types import TypeDeserializer
+from dateutil.tz import gettz
+
+from aws.dynamodb import connection
+from aws.dynamodb.base import DynamoDB
+from common import utils
+
+EVENT_KEY_SEPARATOR = '#'
+# Sorts after every reservation ID, used as the upper bound of day ranges
+_EVENT_KEY_RANGE_END = EVENT_KEY_SEPARATOR + '~'
+
+_deserializer = TypeDeserializer()
+
+
+def event_from_stream_record(record):
+    """
+    Retrieve the appended event of a stream record
+
+    Parameters
+    ----------
+    record : dict
+        Record of the DynamoDB stream event Lambda receives
+
+    Returns
+    -------
+    event : dict
+        Event item, None unless the record is the INSERT of an event
+        (the updates setting appliedTime are MODIFY records)
+    """
+    if record.get('eventName') != 'INSERT':
+        return None
+    new_image = record['dynamodb'].get('NewImage')
+    if not new_image or 'reservedStartTimes' not in new_image:
+        return None
+    return {name: _deserializer.deserialize(value)
+            for name, value in new_image.items()}
+
+
+class ReservationLedger(DynamoDB):
+    """Class for RestaurantReservationLedger operations"""
+    __slots__ = ['_table']
+
+    def __init__(self):
+        """Initialization method"""
+        table_name = os.environ.get("RESERVATION_LEDGER_TABLE")
+        super().__init__(table_name)
+        self._table = connection.get_table(table_name)
+
+    def create_append_action(self, shop_id, reservation_id, reserved_day,
+                             reserved_start_times, reservation_people_number,
+                             max_reservable_number, seats_number):
+        """
+        Create a Put action that appends a reservation event
+        * The event carries everything needed to fold it into the day's
+          aggregate, so the consumer and a replay need no other read
+        * The condition rejects a second event of the same reservation
+
+        Parameters
+        ----------
+        shop_id : int
+            Shop ID
+        reservation_id : str
+            Reservation ID
+        reserved_day : str
+            Reservation day (YYYY-MM-DD)
+        reserved_start_times : list of str
+            Start times (HH:MM) of the reserved 30-minute slots
+        reservation_people_number : int
+            Number of people
+        max_reservable_number : int
+            Seats multiplied by the number of 30-minute slots of the day
+        seats_number : int
+            Seats of the shop (capacity of each 30-minute slot)
+
+        Returns
+        -------
+        action : dict
+            Put action for aws.dynamodb.transaction
+        """
+        now = datetime.now(gettz('Asia/Tokyo')).strftime("%Y/%m/%d %H:%M:%S")
+        item = {
+            'shopId': shop_id,
+            'eventKey': self._event_key(reserved_day, reservation_id),
+            'reservationId': reservation_id,
+            'reservedDay': reserved_day,
+            'reservedYearMonth': utils.format_date(
+                reserved_day, '%Y-%m-%d', '%Y-%m'),
+            'reservedStartTimes': reserved_start_times,
+            'reservationPeopleNumber': reservation_people_number,
+            'maxReservableNumber': max_reservable_number,
+            'seatsNumber': seats_number,
+            'expirationDate': utils.get_ttl_time(
+                datetime.strptime(reserved_day, '%Y-%m-%d')),
+            'createdTime': now,
+        }
+        return self._transact_put(
+            item, condition_expression='attribute_not_exists(eventKey)')
+
+    def create_mark_applied_action(self, shop_id, event_key):
+        """
+        Create an Update action that records that an event has been folded
+        into the aggregates, committed together with the aggregate update
+        * The condition fails for an event folded before, so a redelivered
+          event is never folded twice
+
+        Parameters
+        ----------
+        shop_id : int
+            Shop ID
+        event_key : str
+            eventKey of the event
+
+        Returns
+        -------
+        action : dict
+            Update action for aws.dynamodb.transaction
+        """
+        return self._transact_update(
+            {'shopId': shop_id, 'eventKey': event_key},
+            'SET appliedTime = :now',
+            condition_expression=('attribute_exists(eventKey) AND '
+                                  'attribute_not_exists(appliedTime)'),
+            expression_value={':now': datetime.now(
+                gettz('Asia/Tokyo')).strftime("%Y/%m/%d %H:%M:%S")})
+
+    def iter_events(self, shop_id, from_day, to_day, attributes=None):
+        """
+        Retrieve the events of the days from from_day to to_day with one
+        ranged query, in ascending order of the day
+
+        Parameters
+        ----------
+        shop_id : int
+            Shop ID
+        from_day : str
+            First day (YYYY-MM-DD)
+        to_day : str
+            Last day (YYYY-MM-DD)
+        attributes : list of str, optional
+            Attributes to be retrieved, by default None (all attributes)
+
+        Yields
+        ------
+        event : dict
+            Event item
+        """
+        yield from self._iter_query_range(
+            'shopId', shop_id, 'eventKey', from_day,
+            to_day + _EVENT_KEY_RANGE_END, attributes=attributes)
+
+    def _event_key(self, reserved_day, reservation_id):
+        """Sort key of an event (YYYY-MM-DD#reservationId)"""
+        return reserved_day + EVENT_KEY_SEPARATOR + reservation_id
@@ -7,6 +7,7 @@ from dateutil.tz import gettz
 import uuid
 import os
 
+from aws.dynamodb import connection
 from aws.dynamodb.base import DynamoDB
 from common import utils
 
@@ -19,7 +20,7 @@ class RestaurantReservationInfo(DynamoDB):
         """初期化メソッド"""
         table_name = os.environ.get("CUSTOMER_RESERVATION_TABLE")
         super().__init__(table_name)
-        self._table = self._db.Table(table_name)
+        self._table = connection.get_table(table_name)
 
     def put_item(self, shop_id, shop_name, user_id, user_name,
                  course_id, course_name, reservation_people_number,
@@ -59,6 +60,62 @@ class RestaurantReservationInfo(DynamoDB):
             予約ID
 
         """
+        item = self._create_item(shop_id, shop_name, user_id, user_name,
+                                 course_id, course_name,
+                                 reservation_people_number, reservation_date,
+                                 reservation_starttime, reservation_endtime,
+                                 amount)
+
+        try:
+            self._put_item(item)
+        except Exception as e:
+            raise e
+        return item['reservationId']
+
+    def create_put_item_action(self, shop_id, shop_name, user_id, user_name,
+                               course_id, course_name,
+                               reservation_people_number, reservation_date,
+                               reservation_starttime, reservation_endtime,
+                               amount):
+        """
+        トランザクションで登録するためのPutアクションを作成する
+
+        Parameters
+        ----------
+        put_itemと同じ
+
+        Returns
+        -------
+        reservation_id :str
+            予約ID
+        action : dict
+            aws.dynamodb.transactionに渡すPutアクション
+
+        """
+        item = self._create_item(shop_id, shop_name, user_id, user_name,
+                                 course_id, course_name,
+                                 reservation_people_number, reservation_date,
+                                 reservation_starttime, reservation_endtime,
+                                 amount)
+        return item['reservationId'], self._transact_put(item)
+
+    def _create_item(self, shop_id, shop_name, user_id, user_name,
+                     course_id, course_name, reservation_people_number,
+                     reservation_date, reservation_starttime,
+                     reservation_endtime, amount):
+        """
+        登録するアイテムを作成する。
+        クラス内のみで使用。
+
+        Parameters
+        ----------
+        put_itemと同じ
+
+        Returns
+        -------
+        item : dict
+            新しい予約IDを採番した予約情報
+        """
         reservation_id = str(uuid.uuid4())
         item = {
             "reservationId": reservation_id,
@@ -79,9 +136,4 @@ class RestaurantReservationInfo(DynamoDB):
             'updatedTime': datetime.now(
                 gettz('Asia/Tokyo')).strftime("%Y/%m/%d %H:%M:%S"),
         }
-
-        try:
-            self._put_item(item)
-        except Exception as e:
-            raise e
-        return reservation_id
+        return item
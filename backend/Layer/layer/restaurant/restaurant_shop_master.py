@@ -3,7 +3,23 @@ RestaurantShopMaster操作用モジュール
 
 """
 import os
+from aws.dynamodb import connection
 from aws.dynamodb.base import DynamoDB
+from common.ttl_cache import TTLCache
+from restaurant.shop_model import (SHOP_MODEL_ATTRIBUTES, ShopModel)
+
+# 店舗情報のキャッシュ設定(有効期限0秒でキャッシュしない)
+SHOP_CACHE_TTL_SECONDS = float(os.environ.get('SHOP_CACHE_TTL_SECONDS', 300))
+SHOP_CACHE_MAX_SIZE = int(os.environ.get('SHOP_CACHE_MAX_SIZE', 128))
+# キャッシュのキー種別(店舗単位・全店舗一覧)
+SHOP_CACHE_KEY_SHOP = 'shop'
+SHOP_CACHE_KEY_ALL = 'all'
+
+# ウォームスタート間で共有する店舗情報のキャッシュ
+shop_cache = TTLCache(SHOP_CACHE_MAX_SIZE, SHOP_CACHE_TTL_SECONDS)
+# 店舗情報から作成した予約モデルのキャッシュ(モデルは変更しないためコピーしない)
+shop_model_cache = TTLCache(SHOP_CACHE_MAX_SIZE, SHOP_CACHE_TTL_SECONDS,
+                            copy_values=False)
 
 
 class RestaurantShopMaster(DynamoDB):
@@ -14,16 +30,19 @@ class RestaurantShopMaster(DynamoDB):
         """初期化メソッド"""
         table_name = os.environ.get("SHOP_INFO_TABLE")
         super().__init__(table_name)
-        self._table = self._db.Table(table_name)
+        self._table = connection.get_table(table_name)
 
-    def get_item(self, shop_id):
+    def get_item(self, shop_id, attributes=None):
         """
         データ取得
+        ※取得結果は店舗ID・取得属性ごとにキャッシュする
 
         Parameters
         ----------
         shop_id : int
             店舗ID
+        attributes : list of str, optional
+            取得する属性のパス(例: 'shop.openTime'), by default None(全属性)
 
         Returns
         -------
@@ -31,33 +50,158 @@ class RestaurantShopMaster(DynamoDB):
             店舗情報
 
         """
+        cache_key = (SHOP_CACHE_KEY_SHOP, shop_id, tuple(attributes or ()))
+        item = shop_cache.get(cache_key)
+        if item is not None:
+            return item
+
         key = {'shopId': shop_id}
 
         try:
-            item = self._get_item(key)
+            item = self._get_item(key, attributes)
         except Exception as e:
             raise e
+        if item:
+            shop_cache.set(cache_key, item)
         return item
 
-    def scan(self, shop_id=None):
+    def scan(self, shop_id=None, page_size=None, attributes=None):
         """
         scanメソッドを使用してデータ取得
+        ※ページ単位で読み込むため、1MBを超えるテーブルでも全件取得できる
+        ※店舗IDを指定しない場合(全店舗一覧)は取得属性ごとにキャッシュする
 
         Parameters
         ----------
         shop_id : int, optional
             店舗ID, by default ''
+        page_size : int, optional
+            1リクエストあたりの最大取得件数, by default None
+        attributes : list of str, optional
+            取得する属性のパス, by default None(全属性)
 
         Returns
         -------
-        items : list
-            店舗情報のリスト
+        items : iterator
+            店舗情報を1件ずつ返すイテレータ
 
         """
         key = 'shop_id'
+        if shop_id:
+            try:
+                items = self._iter_scan(key, shop_id, page_size, attributes)
+            except Exception as e:
+                raise e
+            return items
 
-        try:
-            items = self._scan(key, shop_id)
-        except Exception as e:
-            raise e
-        return items
+        cache_key = (SHOP_CACHE_KEY_ALL, tuple(attributes or ()))
+        items = shop_cache.get(cache_key)
+        if items is None:
+            try:
+                items = list(self._iter_scan(key, None, page_size,
+                                             attributes))
+            except Exception as e:
+                raise e
+            shop_cache.set(cache_key, items)
+        return iter(items)
+
+    def get_model(self, shop_id):
+        """
+        店舗の予約モデルを取得する
+        ※店舗情報のキャッシュと同じ有効期限でキャッシュし、
+        店舗情報を再取得した時(キャッシュの破棄・期限切れ)のみ作成し直す
+
+        Parameters
+        ----------
+        shop_id : int
+            店舗ID
+
+        Returns
+        -------
+        model : restaurant.shop_model.ShopModel
+            店舗の予約モデル(店舗が存在しない場合はNone)
+
+        """
+        model = shop_model_cache.get(shop_id)
+        if model is not None:
+            return model
+
+        item = self.get_item(shop_id, SHOP_MODEL_ATTRIBUTES)
+        if not item:
+            return None
+        model = ShopModel(shop_id, item)
+        shop_model_cache.set(shop_id, model)
+        return model
+
+    def get_models(self, shop_ids):
+        """
+        複数店舗の予約モデルを取得する
+        ※キャッシュにない店舗はBatchGetItemでまとめて取得する
+
+        Parameters
+        ----------
+        shop_ids : list of int
+            店舗IDのリスト
+
+        Returns
+        -------
+        models : dict
+            店舗IDをキーとした予約モデル(存在しない店舗は含まない)
+
+        """
+        models = {}
+        missing_keys = []
+        for shop_id in shop_ids:
+            model = shop_model_cache.get(shop_id)
+            if model is None:
+                missing_keys.append({'shopId': shop_id})
+            else:
+                models[shop_id] = model
+
+        if missing_keys:
+            try:
+                items, _ = self._batch_get_items(
+                    missing_keys, ['shopId'] + SHOP_MODEL_ATTRIBUTES)
+            except Exception as e:
+                raise e
+            for item in items:
+                shop_id = int(item['shopId'])
+                model = ShopModel(shop_id, item)
+                shop_model_cache.set(shop_id, model)
+                models[shop_id] = model
+        return models
+
+    def invalidate_cache(self, shop_id=None):
+        """
+        店舗情報(と予約モデル)のキャッシュを破棄する
+        店舗情報を更新した場合に呼び出す
+
+        Parameters
+        ----------
+        shop_id : int, optional
+            更新した店舗ID, by default None(全件破棄)
+            指定した店舗と全店舗一覧のキャッシュを破棄する
+
+        Returns
+        -------
+        count : int
+            破棄した件数
+        """
+        if shop_id is None:
+            shop_model_cache.invalidate()
+            return shop_cache.invalidate()
+        shop_model_cache.invalidate(lambda cache_key: cache_key == shop_id)
+        return shop_cache.invalidate(
+            lambda cache_key: cache_key[0] == SHOP_CACHE_KEY_ALL
+            or cache_key[1] == shop_id)
+
+    def cache_stats(self):
+        """
+        店舗情報のキャッシュの統計情報を取得する
+
+        Returns
+        -------
+        stats : dict
+            hits, misses, evictions, size
+        """
+        return shop_cache.stats()
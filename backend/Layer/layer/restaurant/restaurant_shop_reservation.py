@@ -2,12 +2,169 @@
 RestaurantShopReservation操作用モジュール
 
 """
+import calendar
 import os
 from datetime import datetime
+from botocore.exceptions import ClientError
 from dateutil.tz import gettz
 
+from aws.dynamodb import connection
 from aws.dynamodb.base import DynamoDB
 from common import utils
+from restaurant import slot_array
+
+# Reserved numbers per 30-minute slot are kept as top-level numeric attributes
+# (e.g. reservedSlot1030) so that they can be incremented with ADD and
+# guarded with a condition; only the slots with reservations have one
+SLOT_ATTRIBUTE_PREFIX = 'reservedSlot'
+# The readers return the reserved numbers of the day as an array under this
+# key (see restaurant.slot_array); it is not an attribute of the table
+SLOTS_KEY = 'reservedSlots'
+# Part of totalReservedNumber folded from the reservation ledger (see
+# restaurant.reservation_ledger); a day whose total equals it holds only
+# ledger reservations and can be replayed from the ledger
+LEDGER_TOTAL_ATTRIBUTE = 'ledgerReservedNumber'
+# Attributes keeping the reserved numbers in the format of earlier versions
+LEGACY_SLOTS_ATTRIBUTES = ['reservedInfo']
+# Monthly calendar summary of a shop: one item per shop and month whose sort
+# key (summary-YYYY-MM) sorts after every day and which has no
+# reservedYearMonth, so it never shows up in day ranges or the index.
+# It keeps totalReservedNumber and maxReservableNumber of each day of the
+# month as numeric attributes (e.g. reservedTotal17 / maxReservable17) so
+# that they can be added to with ADD in the booking transaction
+# (maxReservableNumber is that of the whole shop, also on every shard)
+SUMMARY_DAY_PREFIX = 'summary-'
+SUMMARY_TOTAL_PREFIX = 'reservedTotal'
+SUMMARY_MAX_PREFIX = 'maxReservable'
+# Incremented by every update of a summary shard, so that rebuilding the
+# shard from the day items can replace it only if nothing was added meanwhile
+SUMMARY_VERSION_ATTRIBUTE = 'summaryVersion'
+# Set only when a summary shard is rebuilt from the day items. A shard
+# created by the ADD of a booking lacks the days booked before it existed,
+# so a month is read from its summary only if every shard has this
+SUMMARY_REBUILT_ATTRIBUTE = 'rebuiltTime'
+# Rebuilds of a summary shard retried after a concurrent booking
+SUMMARY_REBUILD_MAX_RETRIES = 8
+DAYS_PER_MONTH = 31
+# A shop-day (and its monthly summary) can be split into shards so that
+# concurrent bookings do not all update one item. Shard k > 0 is stored under
+# the sort key of shard 0 followed by SHARD_SEPARATOR and k
+# (2024-05-03#1, summary-2024-05#1), so the shards of a day sort next to it
+# and between that day and the next one; the readers merge them.
+# Each shard owns a fixed share of the seats of every slot
+# (see restaurant.shop_model.ShopModel.shard_seats_number)
+SHARD_SEPARATOR = '#'
+# Sorts after every shard suffix, used as the upper bound of ranged queries
+_SHARD_RANGE_END = SHARD_SEPARATOR + '~'
+# Index of the days by shop and month, projecting what the vacancy flag is
+# derived from (replaces shopId-reservedYearMonth-index, which only projects
+# vacancyFlg)
+RESERVED_YEAR_MONTH_INDEX = 'shopId-reservedYearMonth-vacancy-index'
+VACANCY_FLG_MAP = {'AVAILABLE_NOTHING': 0,
+                   'AVAILABLE_MUCH': 1, 'AVAILABLE_FEW': 2}
+RESERVED_PROPORTION_MAP = {'RESERVED_MUCH': 0.8, 'RESERVED_FULL': 1}
+
+
+def get_reserved_info_attributes(start_times):
+    """
+    Attributes reservedInfo is built from: the counters of the given 30-minute
+    slots and the reservedInfo list of items written before the counters
+
+    Parameters
+    ----------
+    start_times : list of str
+        Start times (HH:MM) of the 30-minute slots to be read
+
+    Returns
+    -------
+    attributes : list of str
+        Attributes to be passed to get_item
+    """
+    return LEGACY_SLOTS_ATTRIBUTES + [
+        SLOT_ATTRIBUTE_PREFIX + start_time.replace(':', '')
+        for start_time in start_times]
+
+
+# Attributes reservedInfo is built from for every 30-minute slot of a day
+RESERVED_INFO_ATTRIBUTES = get_reserved_info_attributes(
+    [slot_array.slot_start_time(index)
+     for index in range(slot_array.SLOTS_PER_DAY)])
+
+
+def shard_sort_key(reserved_day, shard=0):
+    """
+    Sort key (reservedDay) of a shard of a day or of a monthly summary
+
+    Parameters
+    ----------
+    reserved_day : str
+        Reservation day (YYYY-MM-DD) or summary sort key (summary-YYYY-MM)
+    shard : int, optional
+        Shard number, by default 0 (the item of the unsharded layout)
+
+    Returns
+    -------
+    sort_key : str
+        reserved_day for shard 0, reserved_day#shard otherwise
+    """
+    if not shard:
+        return reserved_day
+    return '%s%s%d' % (reserved_day, SHARD_SEPARATOR, shard)
+
+
+def split_shard_sort_key(sort_key):
+    """
+    Split a sort key (reservedDay) into the day and the shard number
+
+    Parameters
+    ----------
+    sort_key : str
+        Sort key of a shard (see shard_sort_key)
+
+    Returns
+    -------
+    reserved_day : str
+        Reservation day (or summary sort key) without the shard suffix
+    shard : int
+        Shard number
+    """
+    reserved_day, _, shard = sort_key.partition(SHARD_SEPARATOR)
+    return reserved_day, int(shard or 0)
+
+
+def get_vacancy_flg(reserved_proportion):
+    """
+    Determine the vacancy flag from the reserved proportion
+
+    Parameters
+    ----------
+    reserved_proportion : float
+        Reserved proportion calculated as reservations / seats
+
+    Returns
+    -------
+    vacancy_flg: int
+        Vacancy flag
+    """
+    if(reserved_proportion < RESERVED_PROPORTION_MAP['RESERVED_MUCH']):
+        vacancy_flg = VACANCY_FLG_MAP['AVAILABLE_MUCH']
+    elif(reserved_proportion >= RESERVED_PROPORTION_MAP['RESERVED_MUCH'] and
+         reserved_proportion < RESERVED_PROPORTION_MAP['RESERVED_FULL']):
+        vacancy_flg = VACANCY_FLG_MAP['AVAILABLE_FEW']
+    else:
+        vacancy_flg = VACANCY_FLG_MAP['AVAILABLE_NOTHING']
+    return vacancy_flg
+
+
+class SlotCapacityExceededError(Exception):
+    """Raised when a 30-minute slot does not have enough seats left"""
+
+    def __init__(self, shop_id, reserved_day, reserved_start_times):
+        super().__init__('No seats left: shopId=%s, %s %s' % (
+            shop_id, reserved_day, ', '.join(reserved_start_times)))
+        self.shop_id = shop_id
+        self.reserved_day = reserved_day
+        self.reserved_start_times = reserved_start_times
 
 
 class RestaurantShopReservation(DynamoDB):
@@ -18,10 +175,11 @@ class RestaurantShopReservation(DynamoDB):
         """Initialization method"""
         table_name = os.environ.get("SHOP_RESERVATION_TABLE")
         super().__init__(table_name)
-        self._table = self._db.Table(table_name)
+        self._table = connection.get_table(table_name)
 
     def put_item(self, shop_id, reserved_day, reserved_year_month,
-                 reserved_info, total_reserved_number, vacancy_flg):
+                 reserved_info, total_reserved_number, vacancy_flg,
+                 ledger_reserved_number=None):
         """
         Register data
 
@@ -39,17 +197,47 @@ class RestaurantShopReservation(DynamoDB):
             Total number of reservations for the specified day
         vacancy_flg : int
             Vacancy flag -> 0: No vacancy, 1: Vacancy, 2: Limited vacancy
+        ledger_reserved_number : int, optional
+            Part of total_reserved_number replayed from the reservation
+            ledger, by default None (not stored)
 
         Returns
         -------
         response : dict
             Response information
         """
+        item = self._create_item(shop_id, reserved_day, reserved_year_month,
+                                 reserved_info, total_reserved_number,
+                                 vacancy_flg, ledger_reserved_number)
+
+        try:
+            response = self._put_item(item)
+        except Exception as e:
+            raise e
+        return response
+
+    def _create_item(self, shop_id, reserved_day, reserved_year_month,
+                     reserved_info, total_reserved_number, vacancy_flg,
+                     ledger_reserved_number=None):
+        """
+        Create the item to be registered
+        * reserved_info is stored as the slot counters, so that bookings can
+          add to the item with the guarded ADD update
+
+        Parameters
+        ----------
+        Same as put_item
+
+        Returns
+        -------
+        item : dict
+            Reservation information for a specific day
+        """
         item = {
             'shopId': shop_id,
             'reservedDay': reserved_day,
             'reservedYearMonth': reserved_year_month,
-            'reservedInfo': reserved_info,
+            **self._create_slot_counters(reserved_info),
             'totalReservedNumber': total_reserved_number,
             'vacancyFlg': vacancy_flg,
             "expirationDate": utils.get_ttl_time(datetime.strptime(reserved_day, '%Y-%m-%d')),
@@ -58,12 +246,9 @@ class RestaurantShopReservation(DynamoDB):
             'updatedTime': datetime.now(
                 gettz('Asia/Tokyo')).strftime("%Y/%m/%d %H:%M:%S"),
         }
-
-        try:
-            response = self._put_item(item)
-        except Exception as e:
-            raise e
-        return response
+        if ledger_reserved_number is not None:
+            item[LEDGER_TOTAL_ATTRIBUTE] = ledger_reserved_number
+        return item
 
     def update_item(self, shop_id, reserved_day, reserved_info,
                     total_reserved_number, vacancy_flg):
@@ -88,30 +273,650 @@ class RestaurantShopReservation(DynamoDB):
         response : dict
             Response information
         """
-        key = {'shopId': shop_id, 'reservedDay': reserved_day}
-        expression = ('set reservedInfo=:reserved_info, '
-                      'totalReservedNumber=:total_reserved_number, '
-                      'vacancyFlg=:vacancy_flg, '
-                      'updatedTime=:updated_time')
+        key, expression, expression_value = self._create_update_params(
+            shop_id, reserved_day, reserved_info, total_reserved_number,
+            vacancy_flg)
+        return_value = "UPDATED_NEW"
+
+        try:
+            response = self._update_item(key, expression,
+                                         expression_value, return_value)
+        except Exception as e:
+            raise e
+        return response
+
+    def create_add_reservation_action(self, shop_id, reserved_day,
+                                      reserved_start_times,
+                                      reservation_people_number,
+                                      max_reservable_number, seats_number,
+                                      shard=0):
+        """
+        Create an Update action that adds a reservation to the day
+        * The slot counters and totalReservedNumber are incremented with ADD,
+          so no read is needed and concurrent bookings are not lost
+        * Each slot is guarded by a condition so that it never exceeds
+          seats_number; a full slot cancels the transaction with
+          ConditionalCheckFailed on this action
+        * The condition only reads the slot counters, so it also fails on an
+          item that still keeps reservations in the format of an earlier
+          version. The item is then returned in
+          TransactionCanceledError.items (no extra read is needed): move them
+          into the counters with migrate_legacy_slots and add the reservation
+          again
+        * The item is created if it does not exist yet
+        * vacancyFlg is derived from totalReservedNumber and
+          maxReservableNumber, which are written in the same update
+        * With a sharded layout, only the given shard is updated and
+          seats_number is the share of the shard; max_reservable_number is
+          that of the whole shop on every shard, so that a day is not shown
+          as full while only some of its shards exist
+
+        Parameters
+        ----------
+        shop_id : int
+            Shop ID
+        reserved_day : str
+            Reservation day
+        reserved_start_times : list of str
+            Start times (HH:MM) of the 30-minute slots to be reserved
+        reservation_people_number : int
+            Number of people
+        max_reservable_number : int
+            Seats of the shop multiplied by the number of 30-minute slots of
+            the day
+        seats_number : int
+            Seats of the shop or of the shard (capacity of each 30-minute
+            slot)
+        shard : int, optional
+            Shard of the day to be updated, by default 0
+
+        Returns
+        -------
+        action : dict
+            Update action for aws.dynamodb.transaction
+
+        Raises
+        ------
+        SlotCapacityExceededError
+            The party is larger than the shop, so no slot can ever take it
+        """
+        (key, update_expression, condition_expression,
+         expression_attribute_names, expression_value) = \
+            self._create_add_reservation_params(
+                shop_id, reserved_day, reserved_start_times,
+                reservation_people_number, max_reservable_number,
+                seats_number, shard)
+        return self._transact_update(
+            key, update_expression,
+            condition_expression=condition_expression,
+            expression_attribute_names=expression_attribute_names,
+            expression_value=expression_value,
+            return_values_on_condition_check_failure=True)
+
+    def migrate_legacy_slots(self, shop_id, reserved_day, item, shard=0):
+        """
+        Move the reservations a shard of the day keeps in the format of an
+        earlier version (the reservedInfo list) into the slot counters
+        * The reserved numbers are added to the counters with ADD and the
+          list is removed in one update, on condition that it has not
+          changed since item was read; totalReservedNumber already
+          includes them
+        * Called with the item returned when the guarded update of
+          create_add_reservation_action fails, so that items written before
+          the counters are migrated on their first booking
+
+        Parameters
+        ----------
+        shop_id : int
+            Shop ID
+        reserved_day : str
+            Reservation day
+        item : dict
+            Item of the shard as read (TransactionCanceledError.items)
+        shard : int, optional
+            Shard of the day, by default 0
+
+        Returns
+        -------
+        migrated : bool
+            True if the shard kept reservations in the legacy format (the
+            booking should be added again), False if it did not (the slots
+            are full)
+        """
+        if not item or not any(name in item
+                               for name in LEGACY_SLOTS_ATTRIBUTES):
+            return False
+
+        key = {'shopId': shop_id,
+               'reservedDay': shard_sort_key(reserved_day, shard)}
+        slots = slot_array.from_reserved_info(item.get('reservedInfo', []))
+        expression_attribute_names = {}
+        add_expressions = []
+        expression_value = {}
+        for index, reserved_number in enumerate(slots):
+            if not reserved_number:
+                continue
+            expression_attribute_names['#slot%d' % index] = \
+                self._slot_attribute_name(slot_array.slot_start_time(index))
+            expression_value[':slot%d' % index] = reserved_number
+            add_expressions.append('#slot%d :slot%d' % (index, index))
+
+        conditions = []
+        for index, name in enumerate(LEGACY_SLOTS_ATTRIBUTES):
+            expression_attribute_names['#legacy%d' % index] = name
+            if name in item:
+                expression_value[':legacy%d' % index] = item[name]
+                conditions.append('#legacy%d = :legacy%d' % (index, index))
+            else:
+                conditions.append('attribute_not_exists(#legacy%d)' % index)
+        update_expression = 'REMOVE ' + ', '.join(
+            '#legacy%d' % index
+            for index in range(len(LEGACY_SLOTS_ATTRIBUTES)))
+        if add_expressions:
+            update_expression = 'ADD ' + ', '.join(add_expressions) + ' ' \
+                + update_expression
+
+        try:
+            self._update_item_optional(
+                key, update_expression, ' AND '.join(conditions),
+                expression_attribute_names, expression_value, 'NONE')
+        except ClientError as e:
+            if e.response['Error']['Code'] != \
+                    'ConditionalCheckFailedException':
+                raise e
+            # Migrated or rewritten concurrently: the booking is added again
+            # against what is stored now
+        return True
+
+    def create_add_slots_action(self, shop_id, reserved_day,
+                                reserved_numbers, max_reservable_number):
+        """
+        Create an Update action that adds reserved numbers to the slots of the
+        day without a capacity condition
+        * Used to fold reservations that have already been accepted (see
+          restaurant.reservation_ledger), so the aggregate always equals the
+          sum of the accepted reservations
+        * The folded number is also added to ledgerReservedNumber
+
+        Parameters
+        ----------
+        shop_id : int
+            Shop ID
+        reserved_day : str
+            Reservation day
+        reserved_numbers : dict
+            Number of people to be added keyed by the start time (HH:MM) of
+            the 30-minute slot
+        max_reservable_number : int
+            Seats multiplied by the number of 30-minute slots of the day
+
+        Returns
+        -------
+        action : dict
+            Update action for aws.dynamodb.transaction
+        """
+        expression_attribute_names = {}
+        add_expressions = []
+        expression_value = {}
+        for index, (start_time, reserved_number) in enumerate(
+                sorted(reserved_numbers.items())):
+            expression_attribute_names['#slot%d' % index] = \
+                self._slot_attribute_name(start_time)
+            expression_value[':slot%d' % index] = reserved_number
+            add_expressions.append('#slot%d :slot%d' % (index, index))
+        add_expressions.append('totalReservedNumber :total_reserved_number')
+        add_expressions.append('#ledger :total_reserved_number')
+        expression_attribute_names['#ledger'] = LEDGER_TOTAL_ATTRIBUTE
+
+        now = datetime.now(gettz('Asia/Tokyo')).strftime("%Y/%m/%d %H:%M:%S")
+        expression_value.update({
+            ':total_reserved_number': sum(reserved_numbers.values()),
+            ':reserved_year_month': utils.format_date(
+                reserved_day, '%Y-%m-%d', '%Y-%m'),
+            ':max_reservable_number': max_reservable_number,
+            ':expiration_date': utils.get_ttl_time(
+                datetime.strptime(reserved_day, '%Y-%m-%d')),
+            ':now': now,
+        })
+        return self._transact_update(
+            {'shopId': shop_id, 'reservedDay': reserved_day},
+            'ADD ' + ', '.join(add_expressions) + ' '
+            'SET reservedYearMonth = :reserved_year_month, '
+            'maxReservableNumber = :max_reservable_number, '
+            'expirationDate = '
+            'if_not_exists(expirationDate, :expiration_date), '
+            'createdTime = if_not_exists(createdTime, :now), '
+            'updatedTime = :now',
+            expression_attribute_names=expression_attribute_names,
+            expression_value=expression_value)
+
+    def _create_add_reservation_params(self, shop_id, reserved_day,
+                                       reserved_start_times,
+                                       reservation_people_number,
+                                       max_reservable_number, seats_number,
+                                       shard):
+        """
+        Create the parameters of the update that adds a reservation
+
+        Parameters
+        ----------
+        Same as create_add_reservation_action
+
+        Returns
+        -------
+        key : dict
+            Key of the item to be updated
+        update_expression : str
+            Update expression
+        condition_expression : str
+            Capacity condition of every slot and absence of the reservations
+            in the format of an earlier version
+        expression_attribute_names : dict
+            Placeholders of the slot counters
+        expression_value : dict
+            Variable declarations
+        """
+        # A slot can take the party only while it holds at most this number
+        slot_limit = seats_number - reservation_people_number
+        if slot_limit < 0:
+            raise SlotCapacityExceededError(
+                shop_id, reserved_day, reserved_start_times)
+
+        key = {'shopId': shop_id,
+               'reservedDay': shard_sort_key(reserved_day, shard)}
+        expression_attribute_names = {}
+        add_expressions = []
+        conditions = []
+        for index, start_time in enumerate(reserved_start_times):
+            name = '#slot%d' % index
+            expression_attribute_names[name] = self._slot_attribute_name(
+                start_time)
+            add_expressions.append('%s :reservation_people_number' % name)
+            conditions.append('(attribute_not_exists(%s) OR %s <= :slot_limit)'
+                              % (name, name))
+        conditions += ['attribute_not_exists(%s)' % name
+                       for name in LEGACY_SLOTS_ATTRIBUTES]
+        add_expressions.append('totalReservedNumber :total_reserved_number')
+
+        update_expression = (
+            'ADD ' + ', '.join(add_expressions) + ' '
+            'SET reservedYearMonth = :reserved_year_month, '
+            'maxReservableNumber = :max_reservable_number, '
+            'expirationDate = '
+            'if_not_exists(expirationDate, :expiration_date), '
+            'createdTime = if_not_exists(createdTime, :now), '
+            'updatedTime = :now')
+        now = datetime.now(gettz('Asia/Tokyo')).strftime("%Y/%m/%d %H:%M:%S")
         expression_value = {
-            ':reserved_info': reserved_info,
+            ':reservation_people_number': reservation_people_number,
+            ':total_reserved_number':
+                reservation_people_number * len(reserved_start_times),
+            ':reserved_year_month': utils.format_date(
+                reserved_day, '%Y-%m-%d', '%Y-%m'),
+            ':max_reservable_number': max_reservable_number,
+            ':expiration_date': utils.get_ttl_time(
+                datetime.strptime(reserved_day, '%Y-%m-%d')),
+            ':now': now,
+            ':slot_limit': slot_limit,
+        }
+        return (key, update_expression, ' AND '.join(conditions),
+                expression_attribute_names, expression_value)
+
+    def _create_update_params(self, shop_id, reserved_day, reserved_info,
+                              total_reserved_number, vacancy_flg):
+        """
+        Create the key, update expression and values of update_item
+        * reserved_info replaces every reservation of the day: it is stored
+          as the slot counters, and the other slot counters and the
+          reservedInfo list are removed
+
+        Parameters
+        ----------
+        Same as update_item
+
+        Returns
+        -------
+        key : dict
+            Key of the item to be updated
+        expression : str
+            Update expression
+        expression_value : dict
+            Values to be updated
+        """
+        key = {'shopId': shop_id, 'reservedDay': reserved_day}
+        slot_counters = self._create_slot_counters(reserved_info)
+        set_expressions = []
+        expression_value = {}
+        for index, (name, reserved_number) in enumerate(
+                slot_counters.items()):
+            set_expressions.append('%s=:slot%d' % (name, index))
+            expression_value[':slot%d' % index] = reserved_number
+        set_expressions += ['totalReservedNumber=:total_reserved_number',
+                            'vacancyFlg=:vacancy_flg',
+                            'updatedTime=:updated_time']
+        expression = ('set ' + ', '.join(set_expressions) + ' '
+                      'remove ' + ', '.join(
+                          name for name in RESERVED_INFO_ATTRIBUTES
+                          if name not in slot_counters))
+        expression_value.update({
             ':total_reserved_number': total_reserved_number,
             ':vacancy_flg': vacancy_flg,
             ':updated_time': datetime.now(
                 gettz('Asia/Tokyo')).strftime("%Y/%m/%d %H:%M:%S")
-        }
-        return_value = "UPDATED_NEW"
+        })
+        return key, expression, expression_value
+
+    def create_add_summary_action(self, shop_id, reserved_day,
+                                  total_reserved_number,
+                                  max_reservable_number, shard=0):
+        """
+        Create an Update action that adds a reservation to the monthly
+        calendar summary, committed together with the day's update
+        * The day's total and the version of the summary are incremented
+          with ADD, so no read is needed
+        * With a sharded layout, the summary shard of the same number as the
+          day's shard is updated; max_reservable_number is that of the whole
+          shop on every shard
+        * A shard created by this action is not read until it is rebuilt
+          (see get_summary)
+
+        Parameters
+        ----------
+        shop_id : int
+            Shop ID
+        reserved_day : str
+            Reservation day
+        total_reserved_number : int
+            Number of people multiplied by the number of 30-minute slots
+        max_reservable_number : int
+            Seats multiplied by the number of 30-minute slots of the day
+        shard : int, optional
+            Shard of the summary to be updated, by default 0
+
+        Returns
+        -------
+        action : dict
+            Update action for aws.dynamodb.transaction
+        """
+        year_month, day = reserved_day[:7], reserved_day[8:10]
+        now = datetime.now(gettz('Asia/Tokyo')).strftime("%Y/%m/%d %H:%M:%S")
+        return self._transact_update(
+            self._summary_key(shop_id, year_month, shard),
+            'ADD #total :total_reserved_number, #version :one '
+            'SET #max = :max_reservable_number, '
+            'expirationDate = :expiration_date, '
+            'createdTime = if_not_exists(createdTime, :now), '
+            'updatedTime = :now',
+            expression_attribute_names={
+                '#total': SUMMARY_TOTAL_PREFIX + day,
+                '#max': SUMMARY_MAX_PREFIX + day,
+                '#version': SUMMARY_VERSION_ATTRIBUTE,
+            },
+            expression_value={
+                ':total_reserved_number': total_reserved_number,
+                ':one': 1,
+                ':max_reservable_number': max_reservable_number,
+                ':expiration_date': self._summary_expiration_date(
+                    year_month),
+                ':now': now,
+            })
+
+    def rebuild_summary(self, shop_id, year_month, max_reservable_number,
+                        shard_count=1):
+        """
+        Regenerate the shards of a monthly calendar summary from the day items
+        * The day items of the month are read with one strongly consistent
+          ranged query (the index is only eventually consistent)
+        * Each shard is replaced only if its version has not changed since
+          before the day items were read, so a booking committed during the
+          rebuild is never overwritten: the shards it changed (or is
+          changing) are read and written again after a backoff
+        * Summary shard k is rebuilt from day shard k; every shard below
+          shard_count and every shard found among the day items and the
+          summary shards is written, so days without reservations are
+          cleared
+
+        Parameters
+        ----------
+        shop_id : int
+            Shop ID
+        year_month : str
+            Reservation year and month (YYYY-MM)
+        max_reservable_number : int
+            Seats of the shop multiplied by the number of 30-minute slots of
+            the day, written as maxReservableNumber of every day (items
+            written by earlier versions do not keep it)
+        shard_count : int, optional
+            Shard count of the shop, by default 1
+
+        Raises
+        ------
+        ClientError
+            Bookings kept changing the summary after
+            SUMMARY_REBUILD_MAX_RETRIES retries
+        """
+        pending = None
+        for attempt in range(SUMMARY_REBUILD_MAX_RETRIES + 1):
+            versions = {
+                split_shard_sort_key(item['reservedDay'])[1]:
+                    item.get(SUMMARY_VERSION_ATTRIBUTE)
+                for item in self._iter_query_range(
+                    'shopId', shop_id, 'reservedDay',
+                    SUMMARY_DAY_PREFIX + year_month,
+                    SUMMARY_DAY_PREFIX + year_month + _SHARD_RANGE_END,
+                    attributes=['reservedDay', SUMMARY_VERSION_ATTRIBUTE],
+                    consistent_read=True)}
+            days_by_shard = {}
+            for item in self._iter_query_range(
+                    'shopId', shop_id, 'reservedDay', year_month + '-01',
+                    '%s-%02d%s' % (year_month, DAYS_PER_MONTH,
+                                   _SHARD_RANGE_END),
+                    attributes=['reservedDay', 'totalReservedNumber'],
+                    consistent_read=True):
+                reserved_day, shard = split_shard_sort_key(
+                    item['reservedDay'])
+                days_by_shard.setdefault(shard, []).append({
+                    'reservedDay': reserved_day,
+                    'totalReservedNumber': item.get('totalReservedNumber', 0),
+                    'maxReservableNumber': max_reservable_number,
+                })
+            if pending is None:
+                pending = set(range(shard_count)) | set(days_by_shard) \
+                    | set(versions)
+
+            for shard in sorted(pending):
+                try:
+                    self.put_summary(shop_id, year_month,
+                                     days_by_shard.get(shard, []), shard,
+                                     versions.get(shard))
+                except ClientError as e:
+                    # Updated by a booking since it was read, or being
+                    # updated by a booking transaction right now
+                    if e.response['Error']['Code'] not in (
+                            'ConditionalCheckFailedException',
+                            'TransactionConflictException') \
+                            or attempt == SUMMARY_REBUILD_MAX_RETRIES:
+                        raise e
+                    continue
+                pending.discard(shard)
+            if not pending:
+                return
+            self._sleep_before_retry(attempt)
+
+    def put_summary(self, shop_id, year_month, days, shard=0, version=None):
+        """
+        Register (replace) a shard of the monthly calendar summary on
+        condition that it is still at the given version
+
+        Parameters
+        ----------
+        shop_id : int
+            Shop ID
+        year_month : str
+            Reservation year and month (YYYY-MM)
+        days : list of dict
+            reservedDay / totalReservedNumber / maxReservableNumber of the
+            days of the month (of the same shard)
+        shard : int, optional
+            Shard of the summary, by default 0
+        version : int, optional
+            summaryVersion of the shard when it was read, by default None
+            (the shard did not exist or had no version)
 
+        Returns
+        -------
+        response : dict
+            Response information
+
+        Raises
+        ------
+        ClientError
+            ConditionalCheckFailedException if the shard has been updated
+            since it was read
+        """
+        if version is None:
+            condition_expression = 'attribute_not_exists(#version)'
+            expression_value = None
+        else:
+            condition_expression = '#version = :version'
+            expression_value = {':version': version}
         try:
-            response = self._update_item(key, expression,
-                                         expression_value, return_value)
+            response = self._put_item_optional(
+                self._create_summary_item(shop_id, year_month, days, shard,
+                                          version),
+                condition_expression, {'#version': SUMMARY_VERSION_ATTRIBUTE},
+                expression_value)
         except Exception as e:
             raise e
         return response
 
-    def get_item(self, shop_id, reserved_day):
+    def _create_summary_item(self, shop_id, year_month, days, shard,
+                             version):
+        """
+        Create the monthly calendar summary item
+
+        Parameters
+        ----------
+        Same as put_summary
+
+        Returns
+        -------
+        item : dict
+            Monthly calendar summary
+        """
+        now = datetime.now(gettz('Asia/Tokyo')).strftime("%Y/%m/%d %H:%M:%S")
+        item = {
+            **self._summary_key(shop_id, year_month, shard),
+            'expirationDate': self._summary_expiration_date(year_month),
+            'createdTime': now,
+            'updatedTime': now,
+            SUMMARY_REBUILT_ATTRIBUTE: now,
+        }
+        if version is not None:
+            item[SUMMARY_VERSION_ATTRIBUTE] = version
+        for day_info in days:
+            day = day_info['reservedDay'][8:10]
+            item[SUMMARY_TOTAL_PREFIX + day] = \
+                day_info['totalReservedNumber']
+            item[SUMMARY_MAX_PREFIX + day] = day_info['maxReservableNumber']
+        return item
+
+    def get_summary(self, shop_id, year_month):
+        """
+        Retrieve the monthly calendar summary with one query
+        * The shards of the summary are read together and merged
+        * A summary some shard of which has not been rebuilt from the day
+          items (see rebuild_summary) is not returned, as it may lack the
+          days booked before the shard was created
+
+        Parameters
+        ----------
+        shop_id : int
+            Shop ID
+        year_month : str
+            Reservation year and month (YYYY-MM)
+
+        Returns
+        -------
+        vacancy_flgs : list of int
+            Vacancy flag of each day of the month (index 0 is the 1st),
+            None for the days without reservations
+            None if the summary does not exist or has not been rebuilt
+        """
+        return self.get_summaries(shop_id, [year_month]).get(year_month)
+
+    def get_summaries(self, shop_id, year_months):
+        """
+        Retrieve the monthly calendar summaries of several months with one
+        ranged query
+        * The shards of each summary are read together and merged
+        * Summaries that have not been rebuilt are not returned (see
+          get_summary)
+
+        Parameters
+        ----------
+        shop_id : int
+            Shop ID
+        year_months : list of str
+            Reservation years and months (YYYY-MM)
+
+        Returns
+        -------
+        summaries : dict
+            Vacancy flags (see get_summary) keyed by year and month
+            The months without a rebuilt summary are not included
+        """
+        if not year_months:
+            return {}
+        summaries = {}
+        for item in self._iter_query_range(
+                'shopId', shop_id, 'reservedDay',
+                SUMMARY_DAY_PREFIX + min(year_months),
+                SUMMARY_DAY_PREFIX + max(year_months) + _SHARD_RANGE_END):
+            summary_day, _ = split_shard_sort_key(item['reservedDay'])
+            summaries.setdefault(
+                summary_day[len(SUMMARY_DAY_PREFIX):], []).append(item)
+        return {year_month: self._summary_vacancy_flgs(summaries[year_month])
+                for year_month in year_months if year_month in summaries
+                and all(SUMMARY_REBUILT_ATTRIBUTE in item
+                        for item in summaries[year_month])}
+
+    def _summary_key(self, shop_id, year_month, shard=0):
+        """Key of a shard of the monthly calendar summary"""
+        return {'shopId': shop_id, 'reservedDay': shard_sort_key(
+            SUMMARY_DAY_PREFIX + year_month, shard)}
+
+    def _summary_expiration_date(self, year_month):
+        """TTL of the monthly calendar summary (that of its last day)"""
+        year, month = map(int, year_month.split('-'))
+        return utils.get_ttl_time(datetime(
+            year, month, calendar.monthrange(year, month)[1]))
+
+    def _summary_vacancy_flgs(self, items):
+        """
+        Vacancy flag of each day of the shards of a monthly summary
+        * The totals of the shards are summed up and divided by the
+          maxReservableNumber of the whole shop, which every shard keeps
+          (the largest one is used)
+        """
+        vacancy_flgs = []
+        for day in range(1, DAYS_PER_MONTH + 1):
+            max_reservable_number = max(
+                item.get(SUMMARY_MAX_PREFIX + '%02d' % day, 0)
+                for item in items)
+            if not max_reservable_number:
+                vacancy_flgs.append(None)
+                continue
+            vacancy_flgs.append(get_vacancy_flg(sum(
+                item.get(SUMMARY_TOTAL_PREFIX + '%02d' % day, 0)
+                for item in items) / max_reservable_number))
+        return vacancy_flgs
+
+    def get_item(self, shop_id, reserved_day, attributes=None):
         """
         Retrieve data
+        * The shards of the day are read with one ranged query and merged,
+          so the result does not depend on the layout
 
         Parameters
         ----------
@@ -119,23 +924,109 @@ class RestaurantShopReservation(DynamoDB):
             Shop ID
         reserved_day : str
             Reservation day
+        attributes : list of str, optional
+            Attributes to be retrieved, by default None (all attributes)
+            Pass RESERVED_INFO_ATTRIBUTES (or the result of
+            get_reserved_info_attributes) to read only reservedInfo
 
         Returns
         -------
         item : dict
             Reservation information for a specific day
         """
-        key = {'shopId': shop_id, 'reservedDay': reserved_day}
+        if attributes is not None and 'reservedDay' not in attributes:
+            attributes = ['reservedDay'] + list(attributes)
+        try:
+            items = list(self._iter_query_range(
+                'shopId', shop_id, 'reservedDay', reserved_day,
+                reserved_day + _SHARD_RANGE_END, attributes=attributes))
+        except Exception as e:
+            raise e
+        if not items:
+            return {}
+        return self._merge_shards(items)
+
+    def iter_days(self, shop_id, from_day, to_day, attributes=None):
+        """
+        Retrieve the days from from_day to to_day with one ranged query
+        * Items are yielded in ascending order of reservedDay, one page at a
+          time, so the caller can stop reading once it has found enough days
+        * Days without reservations have no item and are skipped
+        * The shards of a day are adjacent in the range and merged
+
+        Parameters
+        ----------
+        shop_id : int
+            Shop ID
+        from_day : str
+            First day (YYYY-MM-DD)
+        to_day : str
+            Last day (YYYY-MM-DD)
+        attributes : list of str, optional
+            Attributes to be retrieved, by default None (all attributes)
+            reservedDay is always retrieved
+
+        Yields
+        ------
+        item : dict
+            Reservation information for a specific day
+        """
+        if attributes is not None and 'reservedDay' not in attributes:
+            attributes = ['reservedDay'] + list(attributes)
+        day_items = []
+        for item in self._iter_query_range('shopId', shop_id, 'reservedDay',
+                                           from_day,
+                                           to_day + _SHARD_RANGE_END,
+                                           attributes=attributes):
+            if day_items and split_shard_sort_key(item['reservedDay'])[0] \
+                    != split_shard_sort_key(day_items[0]['reservedDay'])[0]:
+                yield self._merge_shards(day_items)
+                day_items = []
+            day_items.append(item)
+        if day_items:
+            yield self._merge_shards(day_items)
+
+    def batch_get_days(self, keys, attributes=None, shard_counts=None):
+        """
+        Retrieve the days of several shops with BatchGetItem
+        * Every shard of a day is requested and the shards are merged
 
+        Parameters
+        ----------
+        keys : list of tuple
+            (shop_id, reserved_day) of the days to be retrieved
+        attributes : list of str, optional
+            Attributes to be retrieved, by default None (all attributes)
+            shopId and reservedDay are always retrieved
+        shard_counts : dict, optional
+            Shard count keyed by shop_id, by default None (1 for every shop)
+
+        Returns
+        -------
+        items : dict
+            Reservation information keyed by (shop_id, reserved_day)
+            Days without reservations are not included
+        """
+        if attributes is not None:
+            attributes = ['shopId', 'reservedDay'] + [
+                name for name in attributes
+                if name not in ('shopId', 'reservedDay')]
+        shard_counts = shard_counts or {}
         try:
-            item = self._get_item(key)
+            items, _ = self._batch_get_items(
+                [{'shopId': shop_id,
+                  'reservedDay': shard_sort_key(reserved_day, shard)}
+                 for shop_id, reserved_day in keys
+                 for shard in range(shard_counts.get(shop_id, 1))],
+                attributes)
         except Exception as e:
             raise e
-        return item
+        return {key: self._merge_shards(day_items) for key, day_items
+                in self._group_shards(items, with_shop_id=True).items()}
 
-    def query_index_shop_id_reserved_year_month(self, shop_id, reserved_year_month):  # noqa: E501
+    def query_index_shop_id_reserved_year_month(self, shop_id, reserved_year_month, attributes=None):  # noqa: E501
         """
-        Retrieve data from the shopId-reservedYearMonth-index using the query method
+        Retrieve data from RESERVED_YEAR_MONTH_INDEX using the query method
 
         Parameters
         ----------
@@ -143,13 +1034,19 @@ class RestaurantShopReservation(DynamoDB):
             Shop ID
         reserved_year_month : str
             Reservation year and month
+        attributes : list of str, optional
+            Attributes to be retrieved, by default None (all projected
+            attributes)
+            reservedDay is always retrieved
 
         Returns
         -------
         items : list
             List of reservation information for a specific year and month
         """
-        index = 'shopId-reservedYearMonth-index'
+        if attributes is not None and 'reservedDay' not in attributes:
+            attributes = ['reservedDay'] + list(attributes)
+        index = RESERVED_YEAR_MONTH_INDEX
         expression = 'shopId = :shop_id AND reservedYearMonth = :reserved_year_month'  # noqa: E501
         expression_value = {
             ':shop_id': shop_id,
@@ -157,7 +1054,207 @@ class RestaurantShopReservation(DynamoDB):
         }
 
         try:
-            items = self._query_index(index, expression, expression_value)
+            items = self._query_index(index, expression, expression_value,
+                                      attributes=attributes)
         except Exception as e:
             raise e
-        return items
+        return [self._merge_shards(day_items)
+                for day_items in self._group_shards(items).values()]
+
+    def query_index_shop_id_reserved_year_month_range(
+            self, shop_id, from_year_month, to_year_month, page_size=None,
+            attributes=None):
+        """
+        Retrieve the data of several months from RESERVED_YEAR_MONTH_INDEX
+        with one query (BETWEEN)
+        * Items are yielded in ascending order of reservedYearMonth, one month
+          at a time (the index does not order the days, and so the shards,
+          within a month)
+
+        Parameters
+        ----------
+        shop_id : int
+            Shop ID
+        from_year_month : str
+            First reservation year and month
+        to_year_month : str
+            Last reservation year and month
+        page_size : int, optional
+            Maximum number of items per request, by default None
+        attributes : list of str, optional
+            Attributes to be retrieved, by default None (all projected
+            attributes)
+            reservedDay and reservedYearMonth are always retrieved
+
+        Yields
+        ------
+        item : dict
+            Reservation information for a specific day
+        """
+        if attributes is not None:
+            attributes = ['reservedDay', 'reservedYearMonth'] + [
+                name for name in attributes
+                if name not in ('reservedDay', 'reservedYearMonth')]
+        index = RESERVED_YEAR_MONTH_INDEX
+        expression = ('shopId = :shop_id AND reservedYearMonth '
+                      'BETWEEN :from_year_month AND :to_year_month')
+        expression_value = {
+            ':shop_id': shop_id,
+            ':from_year_month': from_year_month,
+            ':to_year_month': to_year_month,
+        }
+
+        month_items = []
+        for item in self._iter_query_index(index, expression,
+                                           expression_value, page_size,
+                                           attributes):
+            if month_items and item['reservedYearMonth'] \
+                    != month_items[0]['reservedYearMonth']:
+                yield from self._merge_month(month_items)
+                month_items = []
+            month_items.append(item)
+        yield from self._merge_month(month_items)
+
+    def _merge_month(self, items):
+        """Merge the shards of the days of one month"""
+        for day_items in self._group_shards(items).values():
+            yield self._merge_shards(day_items)
+
+    def _group_shards(self, items, with_shop_id=False):
+        """
+        Group the items by day
+
+        Parameters
+        ----------
+        items : iterable of dict
+            Items read from the table or the index
+        with_shop_id : bool, optional
+            Whether to key the groups by (shop_id, reserved_day) instead of
+            reserved_day, by default False
+
+        Returns
+        -------
+        groups : dict
+            Items of the shards of each day, in the order of the first shard
+            read
+        """
+        groups = {}
+        for item in items:
+            reserved_day, _ = split_shard_sort_key(item['reservedDay'])
+            key = (int(item['shopId']), reserved_day) if with_shop_id \
+                else reserved_day
+            groups.setdefault(key, []).append(item)
+        return groups
+
+    def _merge_shards(self, items):
+        """
+        Merge the shards of one day into one item
+        * The reserved numbers, totalReservedNumber and
+          ledgerReservedNumber of the shards are summed up, and vacancyFlg
+          is derived from the sums and the maxReservableNumber of the whole
+          shop, which every shard keeps (the largest one is used)
+
+        Parameters
+        ----------
+        items : list of dict
+            Items of the shards of the day read from the table or the index
+
+        Returns
+        -------
+        item : dict
+            Item in the format of _normalize_item, whose reservedDay is the
+            day without the shard suffix
+        """
+        items = [self._normalize_item(item) for item in items]
+        merged = items[0]
+        merged['reservedDay'], _ = split_shard_sort_key(merged['reservedDay'])
+        if len(items) == 1:
+            return merged
+
+        for item in items[1:]:
+            for name in ('totalReservedNumber', LEDGER_TOTAL_ATTRIBUTE):
+                if name in item:
+                    merged[name] = merged.get(name, 0) + item[name]
+            if 'maxReservableNumber' in item:
+                merged['maxReservableNumber'] = max(
+                    merged.get('maxReservableNumber', 0),
+                    item['maxReservableNumber'])
+            if SLOTS_KEY in item:
+                slots = merged.get(SLOTS_KEY) or slot_array.new_slots()
+                merged[SLOTS_KEY] = [
+                    reserved_number + shard_reserved_number
+                    for reserved_number, shard_reserved_number
+                    in zip(slots, item[SLOTS_KEY])]
+        if SLOTS_KEY in merged:
+            merged['reservedInfo'] = slot_array.to_reserved_info(
+                merged[SLOTS_KEY])
+        if merged.get('maxReservableNumber'):
+            merged['vacancyFlg'] = get_vacancy_flg(
+                merged.get('totalReservedNumber', 0)
+                / merged['maxReservableNumber'])
+        return merged
+
+    def _normalize_item(self, item):
+        """
+        Convert an item into the format returned to the callers
+        * The reserved numbers are summed up as an array from the slot
+          counters and the reservedInfo list of items written by earlier
+          versions, and returned as reservedSlots (list of int) and
+          reservedInfo
+        * vacancyFlg is derived from totalReservedNumber / maxReservableNumber
+
+        Parameters
+        ----------
+        item : dict
+            Item read from the table or the index
+
+        Returns
+        -------
+        item : dict
+            Item with reservedSlots, reservedInfo and vacancyFlg
+        """
+        slot_attributes = [name for name in item
+                           if name.startswith(SLOT_ATTRIBUTE_PREFIX)]
+        if slot_attributes or 'reservedInfo' in item:
+            slots = slot_array.from_reserved_info(
+                item.get('reservedInfo', []))
+            for name in slot_attributes:
+                slots[self._slot_index(name)] += int(item.pop(name))
+            item[SLOTS_KEY] = slots
+            item['reservedInfo'] = slot_array.to_reserved_info(slots)
+
+        if item.get('maxReservableNumber'):
+            item['vacancyFlg'] = get_vacancy_flg(
+                item['totalReservedNumber'] / item['maxReservableNumber'])
+        return item
+
+    def _create_slot_counters(self, reserved_info):
+        """
+        Slot counters of reserved_info
+
+        Parameters
+        ----------
+        reserved_info : list of dict
+            reservedStartTime / reservedNumber of each slot
+
+        Returns
+        -------
+        slot_counters : dict
+            Reserved number keyed by the attribute name of the slot counter,
+            only for the slots with reservations
+        """
+        return {
+            self._slot_attribute_name(slot_array.slot_start_time(index)):
+                reserved_number
+            for index, reserved_number in enumerate(
+                slot_array.from_reserved_info(reserved_info))
+            if reserved_number}
+
+    def _slot_attribute_name(self, start_time):
+        """Attribute name of the slot counter (10:30 -> reservedSlot1030)"""
+        return SLOT_ATTRIBUTE_PREFIX + start_time.replace(':', '')
+
+    def _slot_index(self, attribute_name):
+        """Array index of a slot counter (reservedSlot1030 -> 21)"""
+        hhmm = attribute_name[len(SLOT_ATTRIBUTE_PREFIX):]
+        return slot_array.slot_index(hhmm[:2] + ':' + hhmm[2:])
@@ -0,0 +1,392 @@
+"""
+店舗の予約モデル
+予約処理で使用する店舗情報(営業時間の30分枠・席数・コース)を
+店舗情報から1度だけ算出して保持する
+
+"""
+import zlib
+from collections import deque
+from datetime import datetime
+from decimal import Decimal
+
+# 予約枠の単位(分)
+SLOT_MINUTES = 30
+# 予約モデルの作成に必要な店舗情報の属性
+SHOP_MODEL_ATTRIBUTES = ['shop.openTime', 'shop.closeTime',
+                         'shop.seatsNumber', 'shop.closeDay',
+                         'shop.reservationShardCount', 'course']
+
+
+def to_minutes(time_str):
+    """
+    HH:MM形式の時刻を0時からの経過分に変換する
+
+    Parameters
+    ----------
+    time_str : str
+        HH:MM形式の時刻
+
+    Returns
+    -------
+    minutes : int
+        0時からの経過分
+    """
+    hours, minutes = time_str.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def to_time_str(minutes):
+    """
+    0時からの経過分をHH:MM形式の時刻に変換する
+
+    Parameters
+    ----------
+    minutes : int
+        0時からの経過分
+
+    Returns
+    -------
+    time_str : str
+        HH:MM形式の時刻
+    """
+    return '%02d:%02d' % divmod(minutes, 60)
+
+
+class ShopModel:
+    """
+    店舗の予約モデル
+    ※キャッシュで共有するため、作成後は変更しないこと
+    ※店舗情報のreservationShardCount(既定値1)で、1日の予約状況を分割する
+    シャード数を指定する。各シャードは30分枠ごとの席数を等分して受け持つため、
+    席数/シャード数が1組の最大予約人数以上になるように設定すること。
+    また、予約が入っている日のシャード数を変更すると席数を超えて予約できる
+    ため、変更は予約受付前の日付にのみ影響する運用とすること
+
+    Parameters
+    ----------
+    shop_id : int
+        店舗ID
+    item : dict
+        SHOP_MODEL_ATTRIBUTESを含む店舗情報
+    """
+    __slots__ = ['shop_id', 'open_minutes', 'close_minutes', 'slot_count',
+                 'seats_number', 'max_reservable_number', 'close_weekdays',
+                 'shard_count', 'course_list', 'courses']
+
+    def __init__(self, shop_id, item):
+        shop = item['shop']
+        self.shop_id = shop_id
+        self.open_minutes = to_minutes(shop['openTime'])
+        self.close_minutes = to_minutes(shop['closeTime'])
+        # 営業時間の30分枠の数と、1枠あたりの予約可能人数(席数)
+        self.slot_count = max(
+            (self.close_minutes - self.open_minutes) // SLOT_MINUTES, 0)
+        self.seats_number = int(shop['seatsNumber'])
+        # 1日の予約可能人数 計算:席数*営業時間の30分区切り
+        self.max_reservable_number = self.seats_number * self.slot_count
+        # 定休日の曜日(1:月曜日～7:日曜日、0:定休日なし)
+        self.close_weekdays = frozenset(
+            int(weekday) for weekday in shop.get('closeDay', []))
+        # 1日の予約状況のシャード数(各シャードに1席以上を割り当てる)
+        self.shard_count = max(min(
+            int(shop.get('reservationShardCount', 1)), self.seats_number), 1)
+        self.course_list = item.get('course', [])
+        self.courses = {int(course['courseId']): course
+                        for course in self.course_list}
+
+    def is_open_on(self, day):
+        """
+        営業日か判定する
+
+        Parameters
+        ----------
+        day : str
+            日付(YYYY-MM-DD)
+
+        Returns
+        -------
+        is_open : bool
+            定休日でない場合True
+        """
+        weekday = datetime.strptime(day, '%Y-%m-%d').isoweekday()
+        return weekday not in self.close_weekdays
+
+    def shard_order(self, reservation_id):
+        """
+        予約を登録するシャードを試す順に取得する
+        ※予約IDのハッシュで選んだシャードから順に、満席の場合は次のシャードを試す
+
+        Parameters
+        ----------
+        reservation_id : str
+            予約ID
+
+        Returns
+        -------
+        shards : list of int
+            シャード番号
+        """
+        first = zlib.crc32(reservation_id.encode()) % self.shard_count
+        return [(first + offset) % self.shard_count
+                for offset in range(self.shard_count)]
+
+    def shard_seats_number(self, shard):
+        """
+        シャードが受け持つ30分枠あたりの席数を取得する
+        (全シャードの合計が席数になるように余りを先頭のシャードに割り当てる)
+
+        Parameters
+        ----------
+        shard : int
+            シャード番号
+
+        Returns
+        -------
+        seats_number : int
+            30分枠あたりの席数
+        """
+        seats_number, remainder = divmod(self.seats_number, self.shard_count)
+        return seats_number + (1 if shard < remainder else 0)
+
+    def course_price(self, course_id):
+        """
+        コースの値段を取得する
+
+        Parameters
+        ----------
+        course_id : int
+            コースID
+
+        Returns
+        -------
+        price : Decimal
+            コースの値段(該当するコースがない場合は0)
+        """
+        course = self.courses.get(int(course_id))
+        if course is None:
+            return Decimal(0)
+        return course['price']
+
+    def course_minutes(self, course_id):
+        """
+        コースの所要時間(分)を取得する
+
+        Parameters
+        ----------
+        course_id : int
+            コースID
+
+        Returns
+        -------
+        minutes : int
+            コースの所要時間(該当するコースがない場合はNone)
+        """
+        course = self.courses.get(int(course_id))
+        if course is None:
+            return None
+        return int(course['courseMinutes'])
+
+    def start_slot_range(self, course_id=None):
+        """
+        予約を開始できる30分枠の範囲を取得する
+
+        Parameters
+        ----------
+        course_id : int, optional
+            コースID, by default None(1枠の予約)
+            指定した場合、コースが閉店時刻までに終わる開始枠に限る
+
+        Returns
+        -------
+        slots : range
+            開店時刻からの枠番号の範囲
+        """
+        slots = self.course_slot_count(course_id)
+        return range(0, max(self.slot_count - slots + 1, 0))
+
+    def course_slot_count(self, course_id=None):
+        """
+        コースが使用する30分枠の数を取得する
+
+        Parameters
+        ----------
+        course_id : int, optional
+            コースID, by default None(1枠の予約)
+
+        Returns
+        -------
+        slots : int
+            30分枠の数(コースの所要時間を30分単位に切り上げた数)
+        """
+        minutes = course_id is not None and self.course_minutes(course_id)
+        if not minutes:
+            return 1
+        return -(-minutes // SLOT_MINUTES)
+
+    def slot_occupancy(self, day_slots=None):
+        """
+        営業時間の30分枠ごとの予約人数を取得する
+
+        Parameters
+        ----------
+        day_slots : list of int, optional
+            0時から30分ごとの1日の予約人数(restaurant.slot_array),
+            by default None(予約なし)
+
+        Returns
+        -------
+        occupancy : list of int
+            開店時刻からの枠番号ごとの予約人数
+        """
+        if day_slots is None:
+            return [0] * self.slot_count
+        offset = self.open_minutes // SLOT_MINUTES
+        return [int(reserved_number) for reserved_number
+                in day_slots[offset:offset + self.slot_count]]
+
+    def remaining_seats(self, day_slots=None):
+        """
+        営業時間の30分枠ごとの残席数を取得する
+
+        Parameters
+        ----------
+        day_slots : list of int, optional
+            slot_occupancyと同じ
+
+        Returns
+        -------
+        remaining_seats : list of int
+            開店時刻からの枠番号ごとの残席数
+        """
+        return [max(self.seats_number - reserved_number, 0)
+                for reserved_number in self.slot_occupancy(day_slots)]
+
+    def feasible_start_slots(self, day_slots, course_id, people_number):
+        """
+        コースの所要時間のすべての枠に予約人数分の空席がある開始枠を取得する
+        ※コースの枠数の区間の最大予約人数をスライディングウィンドウで求め、
+        1日の枠を1度走査するだけで判定する
+
+        Parameters
+        ----------
+        day_slots : list of int
+            slot_occupancyと同じ
+        course_id : int
+            コースID
+        people_number : int
+            予約人数
+
+        Returns
+        -------
+        slots : list of int
+            予約を開始できる開店時刻からの枠番号
+        """
+        occupancy = self.slot_occupancy(day_slots)
+        course_slots = self.course_slot_count(course_id)
+        limit = self.seats_number - people_number
+        feasible_slots = []
+        # 区間内の枠番号(予約人数の降順)、先頭が区間の最大予約人数の枠
+        window = deque()
+        for slot, reserved_number in enumerate(occupancy):
+            while window and occupancy[window[-1]] <= reserved_number:
+                window.pop()
+            window.append(slot)
+            start = slot - course_slots + 1
+            if start < 0:
+                continue
+            if window[0] < start:
+                window.popleft()
+            if occupancy[window[0]] <= limit:
+                feasible_slots.append(start)
+        return feasible_slots
+
+    def feasible_start_times(self, day_slots, course_id, people_number):
+        """
+        コースと人数で予約できる開始・終了時刻を取得する
+
+        Parameters
+        ----------
+        day_slots : list of int
+            slot_occupancyと同じ
+        course_id : int
+            コースID
+        people_number : int
+            予約人数
+
+        Returns
+        -------
+        start_times : list of dict
+            reservationStarttime / reservationEndtime(HH:MM)
+        """
+        course_slots = self.course_slot_count(course_id)
+        return [
+            {
+                'reservationStarttime': self.slot_time(slot),
+                'reservationEndtime': self.slot_time(slot + course_slots),
+            }
+            for slot in self.feasible_start_slots(
+                day_slots, course_id, people_number)
+        ]
+
+    def slot_time(self, slot):
+        """
+        30分枠の開始時刻を取得する
+
+        Parameters
+        ----------
+        slot : int
+            開店時刻からの枠番号
+
+        Returns
+        -------
+        time_str : str
+            HH:MM形式の開始時刻
+        """
+        return to_time_str(self.open_minutes + slot * SLOT_MINUTES)
+
+    def slot_start_times(self, start_time=None, end_time=None):
+        """
+        予約時間に含まれる30分枠の開始時刻を取得する
+
+        Parameters
+        ----------
+        start_time : str, optional
+            予約開始時刻(HH:MM), by default None(開店時刻)
+        end_time : str, optional
+            予約終了時刻(HH:MM), by default None(閉店時刻)
+
+        Returns
+        -------
+        start_times : list of str
+            30分枠の開始時刻
+        """
+        start = self.open_minutes if start_time is None \
+            else to_minutes(start_time)
+        end = self.close_minutes if end_time is None \
+            else to_minutes(end_time)
+        return [to_time_str(minutes) for minutes
+                in range(start, end - SLOT_MINUTES + 1, SLOT_MINUTES)]
+
+    def is_bookable(self, start_time, end_time):
+        """
+        予約時間が営業時間内の30分枠に収まっているか判定する
+
+        Parameters
+        ----------
+        start_time : str
+            予約開始時刻(HH:MM)
+        end_time : str
+            予約終了時刻(HH:MM)
+
+        Returns
+        -------
+        bookable : bool
+            営業時間内の30分枠に収まっている場合True
+        """
+        start = to_minutes(start_time)
+        end = to_minutes(end_time)
+        return (start < end
+                and (start - self.open_minutes) % SLOT_MINUTES == 0
+                and (end - start) % SLOT_MINUTES == 0
+                and self.open_minutes <= start
+                and end <= self.close_minutes)
@@ -0,0 +1,116 @@
+"""
+Fixed-length integer array of the reserved numbers of a day
+
+Index i holds the reserved number of the 30-minute slot starting
+i * 30 minutes after midnight (10:30 -> 21).
+The array is converted to and from the reservedInfo list of dicts the API
+returns.
+
+"""
+from restaurant.shop_model import (SLOT_MINUTES, to_minutes, to_time_str)
+
+# Number of 30-minute slots of a day
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+
+def new_slots():
+    """
+    Create an array with no reservations
+
+    Returns
+    -------
+    slots : list of int
+        Array filled with 0
+    """
+    return [0] * SLOTS_PER_DAY
+
+
+def slot_index(start_time):
+    """
+    Index of the slot starting at start_time
+
+    Parameters
+    ----------
+    start_time : str
+        Start time (HH:MM) of the slot
+
+    Returns
+    -------
+    index : int
+        Index in the array
+    """
+    return to_minutes(start_time) // SLOT_MINUTES
+
+
+def slot_start_time(index):
+    """Start time (HH:MM) of the slot at index"""
+    return to_time_str(index * SLOT_MINUTES)
+
+
+def slot_end_time(index):
+    """End time (HH:MM) of the slot at index"""
+    return to_time_str((index + 1) % SLOTS_PER_DAY * SLOT_MINUTES)
+
+
+def add_reserved_info(slots, reserved_info):
+    """
+    Add the reservedInfo list of dicts to an array
+
+    Parameters
+    ----------
+    slots : list of int
+        Array to be added to (updated in place)
+    reserved_info : list of dict
+        reservedStartTime / reservedNumber of each slot
+
+    Returns
+    -------
+    slots : list of int
+        The updated array
+    """
+    for reserved_time_info in reserved_info:
+        slots[slot_index(reserved_time_info['reservedStartTime'])] += \
+            int(reserved_time_info['reservedNumber'])
+    return slots
+
+
+def from_reserved_info(reserved_info):
+    """
+    Convert the reservedInfo list of dicts into an array
+
+    Parameters
+    ----------
+    reserved_info : list of dict
+        reservedStartTime / reservedNumber of each slot
+
+    Returns
+    -------
+    slots : list of int
+        Reserved numbers of the day
+    """
+    return add_reserved_info(new_slots(), reserved_info)
+
+
+def to_reserved_info(slots):
+    """
+    Convert an array into the reservedInfo list of dicts
+    Slots without reservations are omitted
+
+    Parameters
+    ----------
+    slots : list of int
+        Reserved numbers of the day
+
+    Returns
+    -------
+    reserved_info : list of dict
+        reservedStartTime / reservedEndTime / reservedNumber of each slot
+    """
+    return [
+        {
+            'reservedStartTime': slot_start_time(index),
+            'reservedEndTime': slot_end_time(index),
+            'reservedNumber': reserved_number,
+        }
+        for index, reserved_number in enumerate(slots) if reserved_number
+    ]
@@ -1,10 +1,15 @@
 from validation.param_check import ParamCheck
 
+# カレンダーで1度に取得できる月数
+CALENDAR_MAX_MONTHS = 12
+
 
 class RestaurantParamCheck(ParamCheck):
     def __init__(self, params):
         self.shop_id = params['shopId'] if 'shopId' in params else None
+        self.area_id = params['areaId'] if 'areaId' in params else None
         self.preferred_year_month = params['preferredYearMonth'] if 'preferredYearMonth' in params else None  # noqa:E501
+        self.preferred_end_year_month = params['preferredEndYearMonth'] if 'preferredEndYearMonth' in params else None  # noqa:E501
         self.preferred_day = params['preferredDay'] if 'preferredDay' in params else None  # noqa:E501
         self.access_token = params['accessToken'] if 'accessToken' in params else None  # noqa: E501
         self.course_id = params['courseId'] if 'courseId' in params else None
@@ -15,18 +20,45 @@ class RestaurantParamCheck(ParamCheck):
         self.course_name = params['courseName'] if 'courseName' in params else None  # noqa: E501
         self.shop_name = params['shopName'] if 'shopName' in params else None
         self.user_name = params['userName'] if 'userName' in params else None
+        self.count = params['count'] if 'count' in params else None
+        self.horizon_days = params['horizonDays'] if 'horizonDays' in params else None  # noqa:E501
 
         self.error_msg = []
 
     def check_api_shop_calendar(self):
         self.check_shop_id()
         self.check_preferred_year_month()
+        if self.preferred_end_year_month is not None:
+            self.check_preferred_end_year_month()
 
         return self.error_msg
 
     def check_api_reservation_time(self):
         self.check_shop_id()
         self.check_preferred_day()
+        # コースと人数を指定した場合は予約可能な開始時刻を返却する
+        if self.course_id is not None \
+                or self.reservation_people_number is not None:
+            self.check_course_id()
+            self.check_reservation_people_number()
+
+        return self.error_msg
+
+    def check_api_available_date(self):
+        self.check_shop_id()
+        self.check_preferred_day()
+        self.check_course_id()
+        self.check_reservation_people_number()
+        self.check_count()
+        self.check_horizon_days()
+
+        return self.error_msg
+
+    def check_api_area_availability(self):
+        self.check_area_id()
+        self.check_preferred_day()
+        if self.reservation_people_number is not None:
+            self.check_reservation_people_number()
 
         return self.error_msg
 
@@ -56,6 +88,14 @@ class RestaurantParamCheck(ParamCheck):
         if error := self.check_int(self.shop_id, 'shopId'):
             self.error_msg.append(error)
 
+    def check_area_id(self):
+        if error := self.check_required(self.area_id, 'areaId'):
+            self.error_msg.append(error)
+            return
+
+        if error := self.check_int(self.area_id, 'areaId'):
+            self.error_msg.append(error)
+
     def check_preferred_year_month(self):
         if error := self.check_required(self.preferred_year_month,
                                         'preferredYearMonth'):
@@ -66,6 +106,23 @@ class RestaurantParamCheck(ParamCheck):
                                           'preferredYearMonth'):
             self.error_msg.append(error)
 
+    def check_preferred_end_year_month(self):
+        if error := self.check_year_month(self.preferred_end_year_month,
+                                          'preferredEndYearMonth'):
+            self.error_msg.append(error)
+            return
+        if self.error_msg:
+            return
+
+        start = self.preferred_year_month.replace('-', '').replace('/', '')
+        end = self.preferred_end_year_month.replace('-', '').replace('/', '')
+        months = (int(end[:4]) - int(start[:4])) * 12 \
+            + int(end[4:]) - int(start[4:]) + 1
+        if not 1 <= months <= CALENDAR_MAX_MONTHS:
+            self.error_msg.append(
+                f'年月範囲エラー（最大{CALENDAR_MAX_MONTHS}か月）'
+                f' : preferredEndYearMonth({self.preferred_end_year_month})')
+
     def check_preferred_day(self):
         if error := self.check_required(self.preferred_day, 'preferredDay'):
             self.error_msg.append(error)
@@ -150,3 +207,17 @@ class RestaurantParamCheck(ParamCheck):
         if error := self.check_int(self.reservation_people_number,
                                    'reservationPeopleNumber'):
             self.error_msg.append(error)
+
+    def check_count(self):
+        if self.count is None:
+            return
+
+        if error := self.check_int(self.count, 'count'):
+            self.error_msg.append(error)
+
+    def check_horizon_days(self):
+        if self.horizon_days is None:
+            return
+
+        if error := self.check_int(self.horizon_days, 'horizonDays'):
+            self.error_msg.append(error)
@@ -1,13 +1,19 @@
 import logging
 import datetime
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from dateutil.tz import gettz
 import os
 import boto3
 import json
+import uuid
 
-from common import (line, utils)
+from aws import invoke
+from common import (flex_message_builder, line, utils)
+from common.rate_limiter import KeyedRateLimiter
 # Import DynamoDB operation class
-from common.remind_message import RemindMessage
+from common.remind_message import (
+    REMIND_STATUS_FAILED, REMIND_STATUS_SENT, RemindMessage)
 from common.channel_access_token import ChannelAccessToken
 
 
@@ -19,67 +25,449 @@ if LOGGER_LEVEL == 'DEBUG':
 else:
     logger.setLevel(logging.INFO)
 
+# Number of requests sent concurrently
+SEND_WORKERS = int(os.getenv('SEND_WORKERS', 8))
+# Upper limit of push / multicast requests per second for each channel
+# (the Messaging API allows 2,000 pushes and 200 multicasts per second)
+PUSH_RATE_LIMIT = float(os.getenv('PUSH_RATE_LIMIT', 1000))
+MULTICAST_RATE_LIMIT = float(os.getenv('MULTICAST_RATE_LIMIT', 100))
+# Messages handed to the workers at a time
+SEND_WINDOW_PER_WORKER = 4
+# Messages read from remindDate-index per page; identical messages are
+# coalesced within a page, so up to one multicast worth of recipients
+SEND_PAGE_SIZE = int(os.getenv('SEND_PAGE_SIZE',
+                               line.MULTICAST_MAX_RECIPIENTS))
+# Seconds a message stays claimed by a run; a message left "sending" by an
+# interrupted run is sent again after this (longer than the Lambda timeout)
+SENDING_LEASE_SECONDS = int(os.getenv('SENDING_LEASE_SECONDS', 900))
+# The run stops and continues in a new invocation when less time is left
+CONTINUATION_MARGIN_MILLIS = int(os.getenv('CONTINUATION_MARGIN_MILLIS',
+                                           10000))
+# Upper limit of the chained invocations for one day
+MAX_CONTINUATIONS = int(os.getenv('MAX_CONTINUATIONS', 100))
+
+# Result of sending one message
+RESULT_SENT = 'sent'
+RESULT_FAILED = 'failed'
+RESULT_SKIPPED = 'skipped'
+
 # Declaration of the table
 remind_message_table_controller = RemindMessage()
 channel_access_token_table_controller = ChannelAccessToken()
+channel_rate_limiter = KeyedRateLimiter(PUSH_RATE_LIMIT)
+channel_multicast_rate_limiter = KeyedRateLimiter(MULTICAST_RATE_LIMIT)
 
 
-def send_message_from_dynamodb():
-    """
-    Retrieve data registered in the table and send a push message.
+def get_today():
     """
+    Retrieve today's date in Japan
 
-    # Retrieve today's messages to be sent from the DynamoDB table
-    today = datetime.datetime.strftime(
+    Returns
+    -------
+    today : str
+        Today (YYYY-MM-DD)
+    """
+    return datetime.datetime.strftime(
         (datetime.datetime.now(gettz('Asia/Tokyo')).date()), '%Y-%m-%d')
 
-    today_messages = remind_message_table_controller.query_index_remind_date(today)
 
-    # NOTE: [Search with query] If no data→Items exist [Search with get_item] If no data→The key 'Items' itself does not exist
-    if not today_messages:
-        return
+def get_message_body(message_info):
+    """
+    Retrieve the flex message of a message
+    * Messages registered with a template (templateId and templateParams)
+      are rendered from the template cache as JSON, which is sent as it is;
+      messages registered before templates hold the whole body in
+      messageBody
+
+    Parameters
+    ----------
+    message_info : dict
+        messageInfo of the message, with Decimal converted to int
+
+    Returns
+    -------
+    message_body : dict or bytes
+        Flex message (not to be modified), or its JSON (UTF-8)
+    """
+    if 'messageBody' in message_info:
+        return message_info['messageBody']
+    return flex_message_builder.render_template(
+        message_info['templateId'], message_info['templateParams'])
+
+
+def create_chunks(message_items):
+    """
+    Group the messages by channel and message body into chunks, each sent
+    with one request
+    * Reminders of reservations with the same shop, date, time, course and
+      number of people have identical bodies and go to one multicast
+    * A chunk holds at most MULTICAST_MAX_RECIPIENTS messages, each to a
+      different user (a user with two identical reminders gets both)
+    * Messages registered with a template are compared by the template and
+      its parameters, without rendering them
+
+    Parameters
+    ----------
+    message_items : list of dict
+        Items of the message table
+
+    Returns
+    -------
+    chunks : list of list of dict
+        Messages of each chunk, in the order of their first message
+    """
+    open_chunks = {}
+    chunks = []
+    for message_item in message_items:
+        message_info = message_item['messageInfo']
+        if 'messageBody' in message_info:
+            body = message_info['messageBody']
+        else:
+            body = [message_info['templateId'],
+                    message_info['templateParams']]
+        body = json.dumps(body, sort_keys=True, default=utils.decimal_to_int)
+        key = (message_info['channelId'],
+               hashlib.sha256(body.encode()).hexdigest())
+        chunk = open_chunks.get(key)
+        if chunk is None \
+                or len(chunk['items']) >= line.MULTICAST_MAX_RECIPIENTS \
+                or message_info['userId'] in chunk['user_ids']:
+            chunk = {'items': [], 'user_ids': set()}
+            open_chunks[key] = chunk
+            chunks.append(chunk['items'])
+        chunk['items'].append(message_item)
+        chunk['user_ids'].add(message_info['userId'])
+    return chunks
+
 
-    # MEMO: If Lambda execution time becomes long, consider saving to SQS once and then polling with another Lambda.
-    # MEMO: In the above case (EventBridge→Lambda→SQS→Lambda)
-    for message_item in today_messages:
-        # Convert Decimal type to int
-        message_info = json.loads(json.dumps(
-            message_item['messageInfo'],
-            default=utils.decimal_to_int))
-        try:
-            channel_info = channel_access_token_table_controller.get_item(
+def create_retry_key(message_items):
+    """
+    Create the retry key of a request sending the messages
+    * Derived from the message IDs, so the same messages get the same key;
+      a single message uses its ID
+
+    Parameters
+    ----------
+    message_items : list of dict
+        Items of the message table
+
+    Returns
+    -------
+    retry_key : str
+        Retry key (UUID)
+    """
+    if len(message_items) == 1:
+        return message_items[0]['id']
+    return str(uuid.uuid5(uuid.UUID(message_items[0]['id']), ','.join(
+        message_item['id'] for message_item in message_items)))
+
+
+def claim_message(message_item, retry_key):
+    """
+    Claim a message before it is sent (remindStatus "sending")
+    * Called from the worker threads
+
+    Parameters
+    ----------
+    message_item : dict
+        Item of the message table
+    retry_key : str
+        Retry key of the request the message is to be sent with
+
+    Returns
+    -------
+    retry_key : str
+        Retry key to send the message with; the key of the earlier request
+        when an interrupted run tried to send it. None if it has been sent
+        or another run is sending it
+    error : Exception
+        Error raised while claiming, None if none
+    """
+    if message_item.get('remindStatus') == REMIND_STATUS_SENT:
+        return None, None
+    try:
+        return remind_message_table_controller.start_sending(
+            message_item['id'], SENDING_LEASE_SECONDS, retry_key), None
+    except Exception as e:
+        return None, e
+
+
+def send_request(request):
+    """
+    Send claimed messages with one push or multicast request
+    * Called from the worker threads; waits for the rate limit of the
+      channel before the request
+    * A message resent after an interrupted run uses the retry key of the
+      earlier request, so the LINE platform delivers it only once
+
+    Parameters
+    ----------
+    request : tuple
+        (retry key, messages) of the request
+
+    Returns
+    -------
+    error : Exception
+        Error raised while sending, None if sent
+    """
+    retry_key, message_items = request
+    # Convert Decimal type to int
+    message_info = json.loads(json.dumps(
+        message_items[0]['messageInfo'],
+        default=utils.decimal_to_int))
+    try:
+        # The token is cached, so the reminders of a channel read it once
+        channel_access_token = \
+            channel_access_token_table_controller.get_channel_access_token(
                 message_info['channelId'])
-            line.send_push_message(channel_info['channelAccessToken'],
-                                   message_info['messageBody'],
-                                   message_info['userId'])
-        except Exception as e:
-            logger.exception(
-                'An error occurred while sending the push message. Please check the corresponding message. Message ID: %s',
-                message_item['id'])
-            logger.exception('Error details: %s', e)
+        message_body = get_message_body(message_info)
+        if len(message_items) == 1:
+            channel_rate_limiter.acquire(message_info['channelId'])
+            line.send_push_message(channel_access_token, message_body,
+                                   message_info['userId'],
+                                   retry_key=retry_key)
+        else:
+            channel_multicast_rate_limiter.acquire(message_info['channelId'])
+            line.send_multicast_message(
+                channel_access_token, message_body,
+                [message_item['messageInfo']['userId']
+                 for message_item in message_items],
+                retry_key=retry_key)
+    except Exception as e:
+        return e
+    return None
+
+
+def finish_message(message_result):
+    """
+    Record the result of a sent message in its remindStatus
+    * Called from the worker threads
+
+    Parameters
+    ----------
+    message_result : tuple
+        (message_item, result) of the message
+    """
+    message_item, result = message_result
+    try:
+        remind_message_table_controller.finish_sending(
+            message_item['id'],
+            REMIND_STATUS_SENT if result == RESULT_SENT
+            else REMIND_STATUS_FAILED)
+    except Exception as e:
+        # The message is resent with the same retry key after the lease
+        logger.warning('Failed to record the result of message ID: %s, %s',
+                       message_item['id'], e)
+
+
+def send_chunks(chunks, executor):
+    """
+    Send chunks of messages concurrently with a pool of worker threads
+    * The messages are claimed, the requests sent and the results recorded
+      in three rounds, each spread over the workers
+    * A claimed message whose earlier request had another retry key is
+      sent in a request of its own key, with the messages sharing it
+
+    Parameters
+    ----------
+    chunks : list of list of dict
+        Messages of each chunk
+    executor : concurrent.futures.ThreadPoolExecutor
+        Pool of the worker threads
+
+    Returns
+    -------
+    results : list of tuple
+        (message_item, result, error) in the order of the chunks
+    request_count : int
+        Number of push and multicast requests sent
+    """
+    claims = [(message_item, create_retry_key(chunk))
+              for chunk in chunks for message_item in chunk]
+    claim_results = list(executor.map(lambda claim: claim_message(*claim),
+                                      claims))
+
+    results = {}
+    requests = {}
+    for (message_item, _), (retry_key, error) in zip(claims, claim_results):
+        if retry_key is None:
+            results[message_item['id']] = (
+                RESULT_SKIPPED if error is None else RESULT_FAILED, error)
             continue
+        requests.setdefault(retry_key, []).append(message_item)
+    requests = list(requests.items())
+    for (_, message_items), error in zip(
+            requests, executor.map(send_request, requests)):
+        for message_item in message_items:
+            results[message_item['id']] = (
+                RESULT_SENT if error is None else RESULT_FAILED, error)
+
+    list(executor.map(finish_message, [
+        (message_item, results[message_item['id']][0])
+        for _, message_items in requests for message_item in message_items]))
+    return [(message_item,) + results[message_item['id']]
+            for message_item, _ in claims], len(requests)
+
+
+def create_windows(chunks, size):
+    """
+    Split chunks into windows of about size messages (a chunk is never split)
+
+    Parameters
+    ----------
+    chunks : list of list of dict
+        Messages of each chunk
+    size : int
+        Messages per window
+
+    Yields
+    ------
+    window : list of list of dict
+        Chunks of the window
+    """
+    window = []
+    count = 0
+    for chunk in chunks:
+        window.append(chunk)
+        count += len(chunk)
+        if count >= size:
+            yield window
+            window = []
+            count = 0
+    if window:
+        yield window
+
+
+def send_message_from_dynamodb(remind_date=None, cursor=None,
+                               workers=SEND_WORKERS, should_stop=None):
+    """
+    Retrieve data registered in the table and send a push message.
+    * Pages of remindDate-index are read one at a time. The messages of a
+      page with the same channel and body are sent with one multicast, and
+      the page is sent a window at a time; should_stop is checked before
+      each window
+    * When stopped, the returned cursor is the start of the current page.
+      Resuming from it re-reads the page, and the messages already sent
+      from it are skipped by their remindStatus
+
+    Parameters
+    ----------
+    remind_date : str, optional
+        Remind date (YYYY-MM-DD), by default None (today)
+    cursor : dict, optional
+        Cursor returned by a stopped run, by default None (first page)
+    workers : int, optional
+        Number of requests sent concurrently, by default SEND_WORKERS
+    should_stop : callable, optional
+        Returns True when the run should stop, by default None
+
+    Returns
+    -------
+    results : dict
+        Number of messages sent, failed and skipped, and of requests
+    cursor : dict
+        Position to resume from, None if every message has been processed
+    """
+    # Retrieve today's messages to be sent from the DynamoDB table
+    remind_date = remind_date or get_today()
+
+    results = {RESULT_SENT: 0, RESULT_FAILED: 0, RESULT_SKIPPED: 0,
+               'requests': 0}
+    window_size = max(workers, 1) * SEND_WINDOW_PER_WORKER
+    page_key = cursor or None
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        while True:
+            if should_stop and should_stop():
+                return results, page_key or {}
+            message_items, next_page_key = \
+                remind_message_table_controller.query_index_remind_date_page(
+                    remind_date, SEND_PAGE_SIZE, page_key)
+            for index, window in enumerate(create_windows(
+                    create_chunks(message_items), window_size)):
+                if index and should_stop and should_stop():
+                    return results, page_key or {}
+                window_results, request_count = send_chunks(window, executor)
+                results['requests'] += request_count
+                for message_item, result, error in window_results:
+                    results[result] += 1
+                    if error is None:
+                        continue
+                    logger.error(
+                        'An error occurred while sending the push message. Please check the corresponding message. Message ID: %s',
+                        message_item['id'])
+                    logger.error('Error details: %s', error)
+            if next_page_key is None:
+                return results, None
+            page_key = next_page_key
+
+
+def continue_sending(context, remind_date, cursor, continuation):
+    """
+    Invoke this function again to send the rest of the messages
+
+    Parameters
+    ----------
+    context : __main__.LambdaContext
+        Context of the running invocation
+    remind_date : str
+        Remind date (YYYY-MM-DD)
+    cursor : dict
+        Position to resume from
+    continuation : int
+        Number of the next invocation in the chain of the day
+    """
+    if continuation > MAX_CONTINUATIONS:
+        logger.error('Too many continuations for %s, the rest of the '
+                     'messages are not sent. cursor: %s', remind_date, cursor)
+        return
+    invoke.invoke_async(context.function_name, {
+        'remindDate': remind_date,
+        'cursor': json.loads(json.dumps(cursor,
+                                        default=utils.decimal_to_int)),
+        'continuation': continuation,
+    })
+    logger.info('Continue sending %s in invocation %d', remind_date,
+                continuation)
 
 
 def lambda_handler(event, context):
     """
-    Return the content of the LINE talk sent to the Webhook
+    Send the reminders of the day
+    * Started by the schedule, the run stops CONTINUATION_MARGIN_MILLIS
+      before the time limit and invokes the function again with the
+      remind date and the cursor to continue from
 
     Parameters
     ----------
     event : dict
-        Request content to the Webhook.
+        Schedule event, or remindDate, cursor and continuation of a
+        continued run.
     context : dict
         Context content.
 
     Returns
     -------
     Response : dict
-        Response content to the Webhook.
+        Response content.
     """
     logger.info(event)
+    event = event or {}
+    # A continued run keeps the date of the run it continues
+    remind_date = event.get('remindDate') or get_today()
+
+    def should_stop():
+        return context.get_remaining_time_in_millis() \
+            < CONTINUATION_MARGIN_MILLIS
 
     try:
-        send_message_from_dynamodb()
+        results, cursor = send_message_from_dynamodb(
+            remind_date, event.get('cursor'),
+            should_stop=should_stop)
+        logger.info('Push messages sent: %(sent)d, failed: %(failed)d, '
+                    'skipped: %(skipped)d in %(requests)d requests', results)
+        if cursor is not None:
+            continue_sending(context, remind_date, cursor,
+                             int(event.get('continuation', 0)) + 1)
     except Exception as e:
         logger.exception('Occur Exception: %s', e)
         return utils.create_error_response('ERROR')
@@ -0,0 +1,118 @@
+import logging
+import datetime
+from dateutil.tz import gettz
+import os
+
+from restaurant.restaurant_shop_master import RestaurantShopMaster
+from restaurant.restaurant_shop_reservation import RestaurantShopReservation
+
+
+# Configuration for log output
+logger = logging.getLogger()
+LOGGER_LEVEL = os.getenv('LOGGER_LEVEL', None)
+if LOGGER_LEVEL == 'DEBUG':
+    logger.setLevel(logging.DEBUG)
+else:
+    logger.setLevel(logging.INFO)
+
+# Months rebuilt when the event does not specify them (from this month)
+DEFAULT_MONTHS = 12
+
+# Declaration of the table
+shop_master_table_controller = RestaurantShopMaster()
+shop_reservation_table_controller = RestaurantShopReservation()
+
+
+def get_year_months(from_year_month, months):
+    """
+    List the months starting from from_year_month
+
+    Parameters
+    ----------
+    from_year_month : str
+        First year and month (YYYY-MM)
+    months : int
+        Number of months
+
+    Returns
+    -------
+    year_months : list of str
+        Years and months (YYYY-MM)
+    """
+    year, month = map(int, from_year_month.split('-'))
+    month_index = year * 12 + month - 1
+    return ['%04d-%02d' % (index // 12, index % 12 + 1)
+            for index in range(month_index, month_index + months)]
+
+
+def rebuild_shop_summaries(shop_id, year_months):
+    """
+    Regenerate the monthly calendar summaries of a shop from its day items
+    * Every month in year_months is written, so months without reservations
+      get an empty summary
+    * maxReservableNumber of every day is that of the shop model, so that
+      day items written before it was stored are kept in the summary
+    * Bookings may go on during the rebuild: each summary shard is replaced
+      only if no booking has changed it since the day items were read (see
+      RestaurantShopReservation.rebuild_summary)
+
+    Parameters
+    ----------
+    shop_id : int
+        Shop ID
+    year_months : list of str
+        Years and months (YYYY-MM) to be rebuilt
+    """
+    shop_model = shop_master_table_controller.get_model(shop_id)
+    if shop_model is None:
+        logger.warning('shopId: %s not found in the shop master, '
+                       'summaries not rebuilt', shop_id)
+        return
+
+    for year_month in year_months:
+        shop_reservation_table_controller.rebuild_summary(
+            shop_id, year_month, shop_model.max_reservable_number,
+            shop_model.shard_count)
+    logger.info('shopId: %s summaries rebuilt (%s - %s)',
+                shop_id, year_months[0], year_months[-1])
+
+
+def lambda_handler(event, context):
+    """
+    Regenerate the monthly calendar summaries from the day items
+    Run once after deploying the summaries, or whenever they are suspected
+    to be out of sync
+    Bookings do not have to be paused. A shop whose summary is changed by
+    bookings on every retry is logged and skipped; run the batch again for
+    it (shopIds)
+
+    Parameters
+    ----------
+    event : dict
+        shopIds : list of int, optional
+            Shops to be rebuilt, by default all shops
+        fromYearMonth : str, optional
+            First month (YYYY-MM), by default this month
+        months : int, optional
+            Number of months, by default DEFAULT_MONTHS
+    """
+    event = event or {}
+    from_year_month = event.get('fromYearMonth') or datetime.datetime.now(
+        gettz('Asia/Tokyo')).strftime('%Y-%m')
+    year_months = get_year_months(
+        from_year_month, int(event.get('months', DEFAULT_MONTHS)))
+
+    shop_ids = event.get('shopIds')
+    if not shop_ids:
+        shop_ids = [int(shop['shopId']) for shop
+                    in shop_master_table_controller.scan(attributes=['shopId'])]
+
+    for shop_id in shop_ids:
+        # Ensure subsequent shops are processed even if an error occurs midway
+        try:
+            rebuild_shop_summaries(int(shop_id), year_months)
+        except Exception as e:
+            logger.exception('An error occurred while rebuilding the '
+                             'summaries. shopId: %s', shop_id)
+            logger.exception('Error details: %s', e)
+            continue
@@ -1,11 +1,9 @@
 import os
 import logging
-import json
-import requests
 from datetime import (datetime, timedelta)
 from dateutil.tz import gettz
 
-from common import common_const as const
+from common import line
 from common.channel_access_token import ChannelAccessToken
 
 # Environmental variables
@@ -47,6 +45,7 @@ def update_limited_channel_access_token(channel_id, channel_access_token):  # no
 def get_channel_access_token(channel_id, channel_secret):
     """
     Obtain a new short-term channel access token for the MINI app
+    * Sent over the connection shared with the other LINE API requests
 
     Returns
     -------
@@ -54,20 +53,8 @@ def get_channel_access_token(channel_id, channel_secret):
         access_token: short-term channel access token
     """
 
-    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-    body = {
-        'grant_type': 'client_credentials',
-        'client_id': channel_id,
-        'client_secret': channel_secret
-    }
-
-    response = requests.post(
-        const.API_ACCESSTOKEN_URL,
-        headers=headers,
-        data=body
-    )
-    logger.debug('new_channel_access_token %s', response.text)
-    res_body = json.loads(response.text)
+    res_body = line.issue_channel_access_token(channel_id, channel_secret)
+    logger.debug('new_channel_access_token %s', res_body)
 
     return res_body['access_token']
 
@@ -0,0 +1,256 @@
+"""
+Sequential versus transactional booking commit
+
+Books a shop through two write paths on the in-memory DynamoDB backend
+(aws.dynamodb.memory) with a simulated request latency:
+
+    sequential   the previous reservation_put: read the day, put or update
+                 it with the merged reservations, put the customer
+                 reservation, then put the two reminders one by one
+    transaction  reservation_put.commit_reservation: one TransactWriteItems
+                 request with the slot counters (ADD), the calendar summary,
+                 the customer reservation and both reminders
+
+Each path is run with one client (latency of a booking) and with several
+concurrent clients on the same day, where the read-modify-write of the
+sequential path loses bookings. A transaction cancelled by concurrent
+bookings is retried by commit_reservation; one that runs out of retries is
+counted and not committed.
+
+Run from the backend directory:
+
+    python benchmark/booking_commit.py --bookings 200 --clients 1 8
+
+Columns:
+    requests    DynamoDB requests per booking
+    ms/booking  mean time of one booking
+    conflict    bookings given up after the transaction retries ran out
+    lost        people-slots of committed bookings missing from the day
+                (totalReservedNumber) after the run
+
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Environment of the Lambda functions, set up for the in-memory backend
+ENVIRONMENT = {
+    'DYNAMODB_BACKEND': 'memory',
+    'DYNAMODB_MEMORY_TEMPLATES': os.pathsep.join([
+        os.path.join(BACKEND_DIR, 'APP', 'template.yaml'),
+        os.path.join(BACKEND_DIR, 'batch', 'template.yaml')]),
+    'DYNAMODB_MEMORY_ENVIRONMENT': 'dev',
+    'DYNAMODB_MEMORY_SEED': 'RestaurantShopMaster=' + os.path.join(
+        BACKEND_DIR, 'APP', 'dynamodb_data', '*.json'),
+    'SHOP_INFO_TABLE': 'RestaurantShopMaster',
+    'SHOP_RESERVATION_TABLE': 'RestaurantShopReservation',
+    'CUSTOMER_RESERVATION_TABLE': 'RestaurantReservationInfo',
+    'MESSAGE_DB': 'RemindMessageTableRestaurantDev',
+    'CHANNEL_ACCESS_TOKEN_DB': 'LINEChannelAccessTokenRestaurantDev',
+    'REMIND_DATE_DIFFERENCE': '-1',
+    'TTL_DAY': '10',
+    'OA_CHANNEL_ID': 'benchmark',
+    'LIFF_CHANNEL_ID': 'benchmark',
+    'AWS_DEFAULT_REGION': 'ap-northeast-1',
+}
+SHOP_ID = 1
+COURSE_ID = 1
+START_TIME = '12:00'
+END_TIME = '14:00'
+# Enough seats for every booking, so no booking is rejected as full
+SEATS = 100000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--bookings', type=int, default=200,
+                        help='bookings per run')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8],
+                        help='concurrent client counts to compare')
+    parser.add_argument('--people', type=int, default=2,
+                        help='people per booking')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='simulated request latency (seconds)')
+    return parser.parse_args()
+
+
+def setup(args):
+    """Configure the environment and import the booking function"""
+    for name, value in ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    os.environ['DYNAMODB_MEMORY_LATENCY'] = str(args.latency)
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'Layer', 'layer'))
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'APP', 'reservation_put'))
+    # The transaction retries are logged to the root logger
+    import logging
+    logging.disable(logging.INFO)
+
+    import reservation_put
+    return reservation_put
+
+
+def configure_shop(reservation_put, resource):
+    """Give the shop SEATS seats (one shard) and drop the cached model"""
+    table = resource.Table(os.environ['SHOP_INFO_TABLE'])
+    item = table.get_item(Key={'shopId': SHOP_ID})['Item']
+    item['shop']['seatsNumber'] = SEATS
+    item['shop']['reservationShardCount'] = 1
+    resource.seed(os.environ['SHOP_INFO_TABLE'], [item])
+    reservation_put.shop_master_table_controller.invalidate_cache(SHOP_ID)
+    return reservation_put.shop_master_table_controller.get_model(SHOP_ID)
+
+
+def commit_sequential(reservation_put, body, shop_model):
+    """
+    Commit a booking the way reservation_put did before the transaction:
+    each write is its own request, and the day is read, merged and written
+    back as a whole
+    """
+    from common import flex_message_builder, utils
+    from restaurant import slot_array
+    from restaurant.restaurant_shop_reservation import (
+        get_vacancy_flg, RESERVED_INFO_ATTRIBUTES)
+
+    controller = reservation_put.shop_reservation_table_controller
+    reserved_start_times = shop_model.slot_start_times(
+        body['reservationStarttime'], body['reservationEndtime'])
+    reserved_day = controller.get_item(
+        body['shopId'], body['reservationDate'],
+        attributes=RESERVED_INFO_ATTRIBUTES + ['totalReservedNumber'])
+    slots = reserved_day.get('reservedSlots') or slot_array.new_slots()
+    for start_time in reserved_start_times:
+        slots[slot_array.slot_index(start_time)] += \
+            body['reservationPeopleNumber']
+    total_reserved_number = reserved_day.get('totalReservedNumber', 0) \
+        + body['reservationPeopleNumber'] * len(reserved_start_times)
+    vacancy_flg = get_vacancy_flg(
+        total_reserved_number / shop_model.max_reservable_number)
+    if reserved_day:
+        controller.update_item(
+            body['shopId'], body['reservationDate'],
+            slot_array.to_reserved_info(slots), total_reserved_number,
+            vacancy_flg)
+    else:
+        controller.put_item(
+            body['shopId'], body['reservationDate'],
+            body['reservationDate'][:7], slot_array.to_reserved_info(slots),
+            total_reserved_number, vacancy_flg)
+
+    reservation_put.reservation_info_table_controller.put_item(
+        shop_id=body['shopId'], shop_name=body['shopName'],
+        user_id=body['userId'], user_name=body['userName'],
+        course_id=body['courseId'], course_name=body['courseName'],
+        reservation_people_number=body['reservationPeopleNumber'],
+        reservation_date=body['reservationDate'],
+        reservation_starttime=body['reservationStarttime'],
+        reservation_endtime=body['reservationEndtime'],
+        amount=shop_model.course_price(body['courseId']))
+
+    for remind_date_difference in (0, reservation_put.REMIND_DATE_DIFFERENCE):
+        reservation_put.message_table_controller.put_push_message(
+            body['userId'], reservation_put.CHANNEL_ID,
+            flex_message_builder.create_restaurant_remind(
+                shop_name=body['shopName'],
+                reservation_date='%s %s-%s' % (
+                    body['reservationDate'], body['reservationStarttime'],
+                    body['reservationEndtime']),
+                course_name=body['courseName'],
+                number_of_people=str(body['reservationPeopleNumber']),
+                remind_date_difference=remind_date_difference),
+            utils.calculate_date_str_difference(
+                body['reservationDate'], remind_date_difference))
+
+
+def run(reservation_put, resource, shop_model, args, mode, clients, day):
+    """Book the day with one write path and return the result row"""
+    from aws.dynamodb import transaction
+
+    if mode == 'sequential':
+        def commit(body):
+            commit_sequential(reservation_put, body, shop_model)
+    else:
+        def commit(body):
+            reservation_put.commit_reservation(body, shop_model)
+
+    bodies = [{
+        'shopId': SHOP_ID, 'shopName': 'benchmark',
+        'userId': 'U%05d' % number, 'userName': 'benchmark',
+        'courseId': COURSE_ID, 'courseName': 'benchmark',
+        'reservationPeopleNumber': args.people,
+        'reservationDate': day,
+        'reservationStarttime': START_TIME,
+        'reservationEndtime': END_TIME,
+    } for number in range(args.bookings)]
+    lock = threading.Lock()
+    queue = iter(bodies)
+    durations = []
+    results = {'booked': 0, 'conflict': 0}
+
+    def client():
+        while True:
+            with lock:
+                body = next(queue, None)
+            if body is None:
+                return
+            started = time.perf_counter()
+            try:
+                commit(body)
+                result = 'booked'
+            except transaction.TransactionCanceledError:
+                result = 'conflict'
+            with lock:
+                durations.append(time.perf_counter() - started)
+                results[result] += 1
+
+    requests_before = sum(resource.request_counts.values())
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    requests = sum(resource.request_counts.values()) - requests_before
+
+    expected = results['booked'] * args.people * len(
+        shop_model.slot_start_times(START_TIME, END_TIME))
+    reserved_day = reservation_put.shop_reservation_table_controller.get_item(
+        SHOP_ID, day, attributes=['totalReservedNumber'])
+    return {
+        'mode': mode,
+        'clients': clients,
+        'requests': requests / args.bookings,
+        'ms': sum(durations) / len(durations) * 1000,
+        'conflict': results['conflict'],
+        'lost': expected - reserved_day.get('totalReservedNumber', 0),
+    }
+
+
+def main():
+    args = parse_args()
+    reservation_put = setup(args)
+    from aws.dynamodb import connection
+    resource = connection.get_resource()
+    shop_model = configure_shop(reservation_put, resource)
+
+    first_day = date.today() + timedelta(days=30)
+    print('bookings=%d people=%d latency=%.3fs slots=%s-%s'
+          % (args.bookings, args.people, args.latency, START_TIME, END_TIME))
+    print('%-12s %7s %8s %10s %8s %6s' % (
+        'mode', 'clients', 'requests', 'ms/booking', 'conflict', 'lost'))
+    offset = 0
+    for clients in args.clients:
+        for mode in ('sequential', 'transaction'):
+            day = (first_day + timedelta(days=offset)).strftime('%Y-%m-%d')
+            offset += 1
+            row = run(reservation_put, resource, shop_model, args, mode,
+                      clients, day)
+            print('%(mode)-12s %(clients)7d %(requests)8.2f %(ms)10.1f '
+                  '%(conflict)8d %(lost)6d' % row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+Contention benchmark of the capacity-guarded booking
+
+N clients book the same 30-minute slots of one shop-day at once, through
+reservation_put.commit_reservation on the in-memory DynamoDB backend
+(aws.dynamodb.memory). Every booking is one conditional transaction: a
+concurrent booking of the item cancels it with TransactionConflict and it is
+retried with backoff, and a booking that would exceed the seats of a slot is
+rejected by the condition without retries or extra reads. The run is
+repeated for each client count on a separate day.
+
+Then checks the guard on days written in the format of earlier versions
+(the reservedInfo list), which are moved into the slot counters on their
+first booking: a full legacy day must reject a booking, and a legacy day
+with seats left must take exactly the seats left.
+
+Run from the backend directory:
+
+    python benchmark/booking_contention.py --clients 1 8 32
+
+Columns:
+    booked      bookings committed
+    full        bookings rejected because the slots had no seats left
+    conflict    bookings given up after the transaction retries ran out
+    attempts    TransactWriteItems requests per booking
+    max slot    most people in one 30-minute slot after the run (must not
+                exceed the seats)
+
+The script exits with status 1 if a slot ends up over the seats.
+
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Environment of the Lambda functions, set up for the in-memory backend
+ENVIRONMENT = {
+    'DYNAMODB_BACKEND': 'memory',
+    'DYNAMODB_MEMORY_TEMPLATES': os.pathsep.join([
+        os.path.join(BACKEND_DIR, 'APP', 'template.yaml'),
+        os.path.join(BACKEND_DIR, 'batch', 'template.yaml')]),
+    'DYNAMODB_MEMORY_ENVIRONMENT': 'dev',
+    'DYNAMODB_MEMORY_SEED': 'RestaurantShopMaster=' + os.path.join(
+        BACKEND_DIR, 'APP', 'dynamodb_data', '*.json'),
+    'SHOP_INFO_TABLE': 'RestaurantShopMaster',
+    'SHOP_RESERVATION_TABLE': 'RestaurantShopReservation',
+    'CUSTOMER_RESERVATION_TABLE': 'RestaurantReservationInfo',
+    'MESSAGE_DB': 'RemindMessageTableRestaurantDev',
+    'CHANNEL_ACCESS_TOKEN_DB': 'LINEChannelAccessTokenRestaurantDev',
+    'REMIND_DATE_DIFFERENCE': '-1',
+    'TTL_DAY': '10',
+    'OA_CHANNEL_ID': 'benchmark',
+    'LIFF_CHANNEL_ID': 'benchmark',
+    'AWS_DEFAULT_REGION': 'ap-northeast-1',
+}
+SHOP_ID = 1
+COURSE_ID = 1
+START_TIME = '12:00'
+END_TIME = '14:00'
+LEGACY_PEOPLE = 4
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32],
+                        help='concurrent client counts to compare')
+    parser.add_argument('--bookings', type=int, default=200,
+                        help='bookings per run')
+    parser.add_argument('--people', type=int, default=2,
+                        help='people per booking')
+    parser.add_argument('--seats', type=int, default=250,
+                        help='seats of the shop')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='simulated request latency (seconds)')
+    return parser.parse_args()
+
+
+def setup(args):
+    """Configure the environment and import the booking function"""
+    for name, value in ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    os.environ['DYNAMODB_MEMORY_LATENCY'] = str(args.latency)
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'Layer', 'layer'))
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'APP', 'reservation_put'))
+    # The transaction retries are logged to the root logger
+    import logging
+    logging.disable(logging.INFO)
+
+    import reservation_put
+    return reservation_put
+
+
+def configure_shop(reservation_put, resource, seats):
+    """Set the seats of the shop (one shard) and drop the cached model"""
+    table = resource.Table(os.environ['SHOP_INFO_TABLE'])
+    item = table.get_item(Key={'shopId': SHOP_ID})['Item']
+    item['shop']['seatsNumber'] = seats
+    item['shop']['reservationShardCount'] = 1
+    resource.seed(os.environ['SHOP_INFO_TABLE'], [item])
+    reservation_put.shop_master_table_controller.invalidate_cache(SHOP_ID)
+    return reservation_put.shop_master_table_controller.get_model(SHOP_ID)
+
+
+def create_body(number, day, people):
+    """Booking of START_TIME-END_TIME on the day"""
+    return {
+        'shopId': SHOP_ID, 'shopName': 'benchmark',
+        'userId': 'U%05d' % number, 'userName': 'benchmark',
+        'courseId': COURSE_ID, 'courseName': 'benchmark',
+        'reservationPeopleNumber': people,
+        'reservationDate': day,
+        'reservationStarttime': START_TIME,
+        'reservationEndtime': END_TIME,
+    }
+
+
+def book(reservation_put, body, shop_model):
+    """Commit a booking and return its result"""
+    from aws.dynamodb import transaction
+    from restaurant.restaurant_shop_reservation import \
+        SlotCapacityExceededError
+
+    try:
+        reservation_put.commit_reservation(body, shop_model)
+    except SlotCapacityExceededError:
+        return 'full'
+    except transaction.TransactionCanceledError:
+        return 'conflict'
+    return 'booked'
+
+
+def max_slot(reservation_put, day):
+    """Most people in one 30-minute slot of the day"""
+    reserved_day = reservation_put.shop_reservation_table_controller.get_item(
+        SHOP_ID, day)
+    return max(reserved_day.get('reservedSlots') or [0])
+
+
+def run(reservation_put, resource, shop_model, args, clients, day):
+    """Book the day concurrently and return the result row"""
+    bodies = [create_body(number, day, args.people)
+              for number in range(args.bookings)]
+    results = {'booked': 0, 'full': 0, 'conflict': 0}
+    lock = threading.Lock()
+    queue = iter(bodies)
+
+    def client():
+        while True:
+            with lock:
+                body = next(queue, None)
+            if body is None:
+                return
+            result = book(reservation_put, body, shop_model)
+            with lock:
+                results[result] += 1
+
+    attempts_before = resource.request_counts.get('TransactWriteItems', 0)
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    attempts = resource.request_counts.get('TransactWriteItems', 0) \
+        - attempts_before
+    return {
+        'clients': clients,
+        **results,
+        'seconds': elapsed,
+        'per_second': args.bookings / elapsed,
+        'attempts': attempts / args.bookings,
+        'max_slot': max_slot(reservation_put, day),
+    }
+
+
+def seed_legacy_day(resource, shop_model, day, reserved_number):
+    """Write a day in the format of earlier versions"""
+    from restaurant import slot_array
+
+    reserved_start_times = shop_model.slot_start_times(START_TIME, END_TIME)
+    slots = slot_array.new_slots()
+    for start_time in reserved_start_times:
+        slots[slot_array.slot_index(start_time)] = reserved_number
+    item = {
+        'shopId': SHOP_ID,
+        'reservedDay': day,
+        'reservedYearMonth': day[:7],
+        'totalReservedNumber': reserved_number * len(reserved_start_times),
+        'maxReservableNumber': shop_model.max_reservable_number,
+        'reservedInfo': slot_array.to_reserved_info(slots),
+    }
+    resource.seed(os.environ['SHOP_RESERVATION_TABLE'], [item])
+
+
+def check_legacy(reservation_put, resource, shop_model, args, first_day):
+    """Book legacy days that are full and that have seats left"""
+    rows = []
+    for offset, seats_left in enumerate((0, LEGACY_PEOPLE)):
+        day = (first_day + timedelta(days=offset)).strftime('%Y-%m-%d')
+        seed_legacy_day(resource, shop_model, day, args.seats - seats_left)
+        results = [book(reservation_put,
+                        create_body(number, day, LEGACY_PEOPLE), shop_model)
+                   for number in range(2)]
+        expected = ['booked', 'full'] if seats_left else ['full', 'full']
+        rows.append({
+            'seats_left': seats_left,
+            'results': ', '.join(results),
+            'max_slot': max_slot(reservation_put, day),
+            'ok': results == expected,
+        })
+    return rows
+
+
+def main():
+    args = parse_args()
+    reservation_put = setup(args)
+    from aws.dynamodb import connection
+    resource = connection.get_resource()
+    shop_model = configure_shop(reservation_put, resource, args.seats)
+
+    first_day = date.today() + timedelta(days=30)
+    print('bookings=%d people=%d seats=%d latency=%.3fs slots=%s-%s'
+          % (args.bookings, args.people, args.seats, args.latency,
+             START_TIME, END_TIME))
+    print('%7s %7s %5s %8s %8s %10s %8s %8s' % (
+        'clients', 'booked', 'full', 'conflict', 'seconds', 'bookings/s',
+        'attempts', 'max slot'))
+    overbooked = False
+    for offset, clients in enumerate(args.clients):
+        day = (first_day + timedelta(days=offset)).strftime('%Y-%m-%d')
+        row = run(reservation_put, resource, shop_model, args, clients, day)
+        overbooked |= row['max_slot'] > args.seats
+        print('%(clients)7d %(booked)7d %(full)5d %(conflict)8d '
+              '%(seconds)8.2f %(per_second)10.1f %(attempts)8.2f '
+              '%(max_slot)8d' % row)
+
+    print()
+    print('legacy reservedInfo days (two bookings of %d people each)'
+          % LEGACY_PEOPLE)
+    print('%10s %-16s %8s %6s' % (
+        'seats left', 'results', 'max slot', 'check'))
+    legacy_rows = check_legacy(reservation_put, resource, shop_model, args,
+                               first_day + timedelta(days=len(args.clients)))
+    for row in legacy_rows:
+        overbooked |= row['max_slot'] > args.seats
+        print('%10d %-16s %8d %6s' % (
+            row['seats_left'], row['results'], row['max_slot'],
+            'ok' if row['ok'] else 'FAIL'))
+
+    if overbooked or not all(row['ok'] for row in legacy_rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,67 @@
+"""
+Render benchmark of the flex message templates
+
+Compares renders per second of the reminder message built as a nested dict
+literal on every call (the previous common.flex_message_builder, kept below
+as create_restaurant_remind_literal) with common.flex_message_builder. The
+dict rows compare the previous builder with the current one, which builds
+the same literal without logging. The JSON rows compare json.dumps of the
+dict with the precompiled template (FlexTemplate.render_json), which fills
+the values into pre-serialized bytes. Every rendered message is checked
+against the literal builder first.
+
+The flex rows do the same for common_const.const.FLEX: json.dumps of a copy
+of the constant with the title replaced, against FLEX_TEMPLATE. The send
+rows compare the request bodies of common.line.PooledLineBotApi: the SDK
+path (FlexSendMessage.new_from_json_dict and as_json_dict, what the batch
+did with every message) against the rendered JSON sent as it is
+(SerializedMessage).
+
+The literal builder logged its parameters at INFO on every call; the
+"literal+log" row measures it so (to a discarded stream, as the functions
+log at INFO), the other rows with logging disabled.
+
+Run from the backend directory:
+
+    python benchmark/flex_render.py --seconds 1
+
+Columns:
+    renders/s   messages rendered per second
+    speed-up    relative to the baseline of the message
+
+"""
+import argparse
+import copy
+import json
 import logging
+import os
+import sys
+import time
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARAMS = {
+    'shop_name': 'レストラン 新宿本店',
+    'reservation_date': '2026-10-17 18:00-20:00',
+    'course_name': '～加茂茄子・鰹・太刀魚～と国産牛土鍋炊きを愉しむ２ｈ飲み放題付き',
+    'number_of_people': '2',
+    'remind_date_difference': -1,
+}
+TITLE = 'LINE Cafe 新宿本店'
 
+logger = logging.getLogger(__name__)
 
-def create_restaurant_remind(**kwargs):
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--seconds', type=float, default=1,
+                        help='time spent on each row')
+    return parser.parse_args()
+
+
+def create_restaurant_remind_literal(**kwargs):
     """
-    Messaging APIに渡すリマインド通知用メッセージの取得
+    The builder before the templates (common.flex_message_builder at the
+    time), building the nested dict literal on every call
 
     Parameters
     ----------
@@ -205,3 +260,111 @@ def create_restaurant_remind(**kwargs):
     }
 
     return flex_msg
+
+
+def create_flex_literal(title):
+    """json.dumps of common_const.const.FLEX with the title replaced"""
+    from common import common_const
+
+    flex_msg = copy.deepcopy(common_const.const.FLEX)
+    flex_msg['contents']['body']['contents'][0]['text'] = title
+    return json.dumps(flex_msg, ensure_ascii=False).encode()
+
+
+def measure(render, seconds):
+    """Renders per second of render over about seconds"""
+    count = 0
+    batch = 100
+    started = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            render()
+        count += batch
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'Layer', 'layer'))
+    from common import common_const, flex_message_builder, line
+    from linebot.models import FlexSendMessage
+    # The functions log at INFO; the records are discarded here
+    logger.propagate = False
+    logger.addHandler(logging.StreamHandler(open(os.devnull, 'w')))
+    logger.setLevel(logging.INFO)
+
+    for remind_date_difference in [0, -1, -3]:
+        params = dict(PARAMS, remind_date_difference=remind_date_difference)
+        expected = create_restaurant_remind_literal(**params)
+        assert flex_message_builder.create_restaurant_remind(
+            **params) == expected
+        assert json.loads(flex_message_builder.create_restaurant_remind_json(
+            **params)) == expected
+    assert json.loads(flex_message_builder.create_flex_message_json()) \
+        == common_const.const.FLEX
+    assert json.loads(flex_message_builder.create_flex_message_json(
+        title=TITLE)) == json.loads(create_flex_literal(TITLE))
+
+    class PostCapture(line.PooledLineBotApi):
+        """Keeps the posted body instead of sending it"""
+
+        def _post(self, path, data=None, headers=None, timeout=None,
+                  **kwargs):
+            self.data = data
+
+    api = PostCapture('benchmark')
+
+    def send_body(messages):
+        """Request body of the push message, as PooledLineBotApi posts it"""
+        api._send_message('/v2/bot/message/push', 'U0', messages, None,
+                          False, None)
+        return api.data
+
+    expected = json.loads(send_body([FlexSendMessage.new_from_json_dict(
+        create_restaurant_remind_literal(**PARAMS))]))
+    assert json.loads(send_body([line.SerializedMessage(
+        flex_message_builder.create_restaurant_remind_json(
+            **PARAMS))])) == expected
+
+    # (message, render, baseline of the message, logged, render function)
+    rows = [
+        ('remind', 'literal+log', True, True,
+         lambda: create_restaurant_remind_literal(**PARAMS)),
+        ('remind', 'literal dict', False, False,
+         lambda: create_restaurant_remind_literal(**PARAMS)),
+        ('remind', 'builder dict', False, False,
+         lambda: flex_message_builder.create_restaurant_remind(**PARAMS)),
+        ('remind', 'literal json', True, False,
+         lambda: json.dumps(create_restaurant_remind_literal(
+             **PARAMS), ensure_ascii=False).encode()),
+        ('remind', 'template json', False, False,
+         lambda: flex_message_builder.create_restaurant_remind_json(
+             **PARAMS)),
+        ('flex', 'literal json', True, False,
+         lambda: create_flex_literal(TITLE)),
+        ('flex', 'template json', False, False,
+         lambda: flex_message_builder.create_flex_message_json(title=TITLE)),
+        ('send', 'sdk', True, False,
+         lambda: send_body([FlexSendMessage.new_from_json_dict(
+             create_restaurant_remind_literal(**PARAMS))])),
+        ('send', 'template json', False, False,
+         lambda: send_body([line.SerializedMessage(
+             flex_message_builder.create_restaurant_remind_json(
+                 **PARAMS))])),
+    ]
+    print('%-10s %-14s %12s %9s' % ('message', 'render', 'renders/s',
+                                    'speed-up'))
+    baseline = None
+    for message, render, is_baseline, logged, function in rows:
+        logger.disabled = not logged
+        per_second = measure(function, args.seconds)
+        if is_baseline:
+            baseline = per_second
+        print('%-10s %-14s %12.0f %8.1fx' % (
+            message, render, per_second, per_second / baseline))
+
+
+if __name__ == '__main__':
+    main()
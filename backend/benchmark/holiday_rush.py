@@ -0,0 +1,192 @@
+"""
+Holiday-rush benchmark of the booking transaction
+
+Many clients book the same shop on the same popular day at once, through
+reservation_put.commit_reservation on the in-memory DynamoDB backend
+(aws.dynamodb.memory). Every transaction holds its items for the simulated
+request latency, so concurrent bookings of one shop-day item are cancelled
+with TransactionConflict and retried, as on the real service.
+The run is repeated for each shard count of the shop (the
+reservationShardCount attribute of the shop master) on a separate day.
+
+Run from the backend directory:
+
+    python benchmark/holiday_rush.py --shards 1 2 4 8
+
+Columns:
+    booked      bookings committed
+    full        bookings rejected because no shard had enough seats
+                (with several shards a party can be rejected while the whole
+                shop still has enough seats: the seats are split per shard)
+    conflict    bookings given up after the transaction retries ran out
+    attempts    TransactWriteItems requests per committed booking
+    max slot    most people in one 30-minute slot after the run (must not
+                exceed the seats)
+
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Environment of the Lambda functions, set up for the in-memory backend
+ENVIRONMENT = {
+    'DYNAMODB_BACKEND': 'memory',
+    'DYNAMODB_MEMORY_TEMPLATES': os.pathsep.join([
+        os.path.join(BACKEND_DIR, 'APP', 'template.yaml'),
+        os.path.join(BACKEND_DIR, 'batch', 'template.yaml')]),
+    'DYNAMODB_MEMORY_ENVIRONMENT': 'dev',
+    'DYNAMODB_MEMORY_SEED': 'RestaurantShopMaster=' + os.path.join(
+        BACKEND_DIR, 'APP', 'dynamodb_data', '*.json'),
+    'SHOP_INFO_TABLE': 'RestaurantShopMaster',
+    'SHOP_RESERVATION_TABLE': 'RestaurantShopReservation',
+    'CUSTOMER_RESERVATION_TABLE': 'RestaurantReservationInfo',
+    'MESSAGE_DB': 'RemindMessageTableRestaurantDev',
+    'CHANNEL_ACCESS_TOKEN_DB': 'LINEChannelAccessTokenRestaurantDev',
+    'REMIND_DATE_DIFFERENCE': '-1',
+    'TTL_DAY': '10',
+    'OA_CHANNEL_ID': 'benchmark',
+    'LIFF_CHANNEL_ID': 'benchmark',
+    'AWS_DEFAULT_REGION': 'ap-northeast-1',
+}
+SHOP_ID = 1
+COURSE_ID = 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='shard counts to compare')
+    parser.add_argument('--clients', type=int, default=32,
+                        help='concurrent clients')
+    parser.add_argument('--bookings', type=int, default=400,
+                        help='bookings per run')
+    parser.add_argument('--people', type=int, default=2,
+                        help='people per booking')
+    parser.add_argument('--seats', type=int, default=400,
+                        help='seats of the shop')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='simulated request latency (seconds)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the booking times')
+    return parser.parse_args()
+
+
+def setup(args):
+    """Configure the environment and import the booking function"""
+    for name, value in ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    os.environ['DYNAMODB_MEMORY_LATENCY'] = str(args.latency)
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'Layer', 'layer'))
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'APP', 'reservation_put'))
+
+    import reservation_put
+    return reservation_put
+
+
+def configure_shop(reservation_put, resource, seats, shard_count):
+    """Set the seats and shard count of the shop and drop the cached model"""
+    table = resource.Table(os.environ['SHOP_INFO_TABLE'])
+    item = table.get_item(Key={'shopId': SHOP_ID})['Item']
+    item['shop']['seatsNumber'] = seats
+    item['shop']['reservationShardCount'] = shard_count
+    resource.seed(os.environ['SHOP_INFO_TABLE'], [item])
+    reservation_put.shop_master_table_controller.invalidate_cache(SHOP_ID)
+    return reservation_put.shop_master_table_controller.get_model(SHOP_ID)
+
+
+def run(reservation_put, resource, args, shard_count, day):
+    """Book the day concurrently and return the result row"""
+    from aws.dynamodb import transaction
+    from restaurant.restaurant_shop_reservation import \
+        SlotCapacityExceededError
+
+    shop_model = configure_shop(reservation_put, resource, args.seats,
+                                shard_count)
+    start_slots = list(shop_model.start_slot_range(COURSE_ID))
+    course_slots = shop_model.course_slot_count(COURSE_ID)
+    randomizer = random.Random(args.seed)
+    bodies = []
+    for number in range(args.bookings):
+        slot = randomizer.choice(start_slots)
+        bodies.append({
+            'shopId': SHOP_ID, 'shopName': 'benchmark',
+            'userId': 'U%05d' % number, 'userName': 'benchmark',
+            'courseId': COURSE_ID, 'courseName': 'benchmark',
+            'reservationPeopleNumber': args.people,
+            'reservationDate': day,
+            'reservationStarttime': shop_model.slot_time(slot),
+            'reservationEndtime': shop_model.slot_time(slot + course_slots),
+        })
+
+    results = {'booked': 0, 'full': 0, 'conflict': 0}
+    lock = threading.Lock()
+    queue = iter(bodies)
+
+    def client():
+        while True:
+            with lock:
+                body = next(queue, None)
+            if body is None:
+                return
+            try:
+                reservation_put.commit_reservation(body, shop_model)
+                result = 'booked'
+            except SlotCapacityExceededError:
+                result = 'full'
+            except transaction.TransactionCanceledError:
+                result = 'conflict'
+            with lock:
+                results[result] += 1
+
+    attempts_before = resource.request_counts.get('TransactWriteItems', 0)
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    attempts = resource.request_counts.get('TransactWriteItems', 0) \
+        - attempts_before
+
+    reserved_day = reservation_put.shop_reservation_table_controller.get_item(
+        SHOP_ID, day)
+    return {
+        'shards': shop_model.shard_count,
+        **results,
+        'seconds': elapsed,
+        'per_second': results['booked'] / elapsed,
+        'attempts': attempts / max(results['booked'], 1),
+        'max_slot': max(reserved_day.get('reservedSlots') or [0]),
+    }
+
+
+def main():
+    args = parse_args()
+    reservation_put = setup(args)
+    from aws.dynamodb import connection
+    resource = connection.get_resource()
+
+    first_day = date.today() + timedelta(days=30)
+    print('clients=%d bookings=%d people=%d seats=%d latency=%.3fs'
+          % (args.clients, args.bookings, args.people, args.seats,
+             args.latency))
+    print('%6s %7s %5s %8s %8s %10s %8s %8s' % (
+        'shards', 'booked', 'full', 'conflict', 'seconds', 'booked/s',
+        'attempts', 'max slot'))
+    for offset, shard_count in enumerate(args.shards):
+        day = (first_day + timedelta(days=offset)).strftime('%Y-%m-%d')
+        row = run(reservation_put, resource, args, shard_count, day)
+        print('%(shards)6d %(booked)7d %(full)5d %(conflict)8d '
+              '%(seconds)8.2f %(per_second)10.1f %(attempts)8.2f '
+              '%(max_slot)8d' % row)
+
+
+if __name__ == '__main__':
+    main()
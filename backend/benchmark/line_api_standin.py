@@ -0,0 +1,145 @@
+"""
+Local stand-in of the LINE Messaging API for the benchmarks
+
+Serves the endpoints the functions call (any POST or GET answers {} with
+status 200) after sleeping for the injected latency, and counts the requests
+per path. Like the LINE platform, a request repeating the X-Line-Retry-Key of
+an accepted request is answered with 409 Conflict and not accepted again.
+Point the functions at it with the LINE_API_ENDPOINT environment variable
+(common_const.const.API_ENDPOINT) before importing them:
+
+    with LineApiStandIn(latency=0.05) as standin:
+        os.environ['LINE_API_ENDPOINT'] = standin.endpoint
+
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Answers every request with an empty JSON object"""
+    protocol_version = 'HTTP/1.1'
+    # The headers and body are written separately; without TCP_NODELAY a
+    # kept-alive connection waits for the client's delayed ACK in between
+    disable_nagle_algorithm = True
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        accepted = self.server.standin.record(
+            self.command, self.path, body, self.headers.get('X-Line-Retry-Key'))
+        time.sleep(self.server.standin.latency)
+        if accepted:
+            status, payload = 200, {}
+        else:
+            status, payload = 409, {
+                'message': 'The retry key is already accepted'}
+        payload = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    """Counts the TCP connections it accepts"""
+    daemon_threads = True
+    # Every push of the functions may open a connection; the default
+    # backlog of 5 resets them under load
+    request_queue_size = 128
+    connection_count = 0
+
+    def process_request(self, request, client_address):
+        self.connection_count += 1
+        super().process_request(request, client_address)
+
+
+class LineApiStandIn:
+    """
+    Threaded HTTP server standing in for api.line.me
+
+    Parameters
+    ----------
+    latency : float, optional
+        Seconds each request takes, by default 0
+    port : int, optional
+        Port to listen on, by default 0 (any free port)
+    """
+
+    def __init__(self, latency=0, port=0):
+        self.latency = latency
+        self.request_counts = {}
+        self.requests = []
+        self.retry_keys = set()
+        self.conflict_count = 0
+        self._lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', port), _Handler)
+        self._server.standin = self
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        """Base URL of the stand-in (for LINE_API_ENDPOINT)"""
+        host, port = self._server.server_address
+        return 'http://%s:%d' % (host, port)
+
+    @property
+    def connection_count(self):
+        """Number of TCP connections accepted so far"""
+        return self._server.connection_count
+
+    def record(self, method, path, body, retry_key=None):
+        """
+        Count a request (called from the handler threads)
+
+        Returns
+        -------
+        accepted : bool
+            False if the retry key has been accepted before
+        """
+        with self._lock:
+            if retry_key:
+                if retry_key in self.retry_keys:
+                    self.conflict_count += 1
+                    return False
+                self.retry_keys.add(retry_key)
+            key = '%s %s' % (method, path.split('?')[0])
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+            self.requests.append((method, path, body))
+            return True
+
+    def reset(self):
+        """Clear the recorded requests and connection count"""
+        with self._lock:
+            self.request_counts.clear()
+            self.requests.clear()
+            self.retry_keys.clear()
+            self.conflict_count = 0
+            self._server.connection_count = 0
+
+    def start(self):
+        self._server.connection_count = 0
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
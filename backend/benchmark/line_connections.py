@@ -0,0 +1,138 @@
+"""
+Connection reuse benchmark of the LINE API requests
+
+Sends pushes (and ID token verifications) to the local LINE API stand-in
+(benchmark/line_api_standin.py) from several threads and counts the TCP
+connections the stand-in accepts:
+
+    per-call    a new LineBotApi / bare requests.post for every request
+                (the previous common.line)
+    pooled      common.line, whose clients share one keep-alive session
+
+Run from the backend directory:
+
+    python benchmark/line_connections.py --pushes 1000 --workers 8
+
+Columns:
+    requests    requests the stand-in accepted
+    connections TCP connections the stand-in accepted
+    seconds     wall time
+    req/s       requests per second
+
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from line_api_standin import LineApiStandIn
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = 'benchmark'
+FLEX_MESSAGE = {
+    'type': 'flex',
+    'altText': 'benchmark',
+    'contents': {
+        'type': 'bubble',
+        'body': {
+            'type': 'box',
+            'layout': 'vertical',
+            'contents': [{'type': 'text', 'text': 'benchmark'}],
+        },
+    },
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--pushes', type=int, default=1000,
+                        help='pushes per run')
+    parser.add_argument('--verifications', type=int, default=200,
+                        help='ID token verifications per run')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='concurrent threads')
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='latency of the LINE API stand-in (seconds)')
+    return parser.parse_args()
+
+
+def setup(standin):
+    """Point the LINE API at the stand-in and import common.line"""
+    os.environ['LINE_API_ENDPOINT'] = standin.endpoint
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'Layer', 'layer'))
+    from common import line
+    return line
+
+
+def push_per_call(line, number):
+    """Push with a new client, as common.line did before"""
+    from linebot import LineBotApi
+    from linebot.models import FlexSendMessage
+
+    line_bot_api = LineBotApi(
+        TOKEN, endpoint=line.common_const.const.API_ENDPOINT)
+    line_bot_api.push_message('U%05d' % number,
+                              FlexSendMessage.new_from_json_dict(FLEX_MESSAGE))
+
+
+def push_pooled(line, number):
+    line.send_push_message(TOKEN, FLEX_MESSAGE, 'U%05d' % number)
+
+
+def verify_per_call(line, number):
+    """Verify an ID token with a bare requests.post, as before"""
+    response = requests.post(
+        line.common_const.const.API_USER_ID_URL,
+        headers={'Content-Type': 'application/x-www-form-urlencoded'},
+        data={'id_token': 'token%05d' % number, 'client_id': 'benchmark'})
+    json.loads(response.text)
+
+
+def verify_pooled(line, number):
+    line.get_profile('token%05d' % number, 'benchmark')
+
+
+def run(line, standin, request, count, workers):
+    """Send count requests from workers threads and return the result row"""
+    standin.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(lambda number: request(line, number),
+                              range(count)):
+            pass
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': sum(standin.request_counts.values()),
+        'connections': standin.connection_count,
+        'seconds': elapsed,
+        'per_second': count / elapsed,
+    }
+
+
+def main():
+    args = parse_args()
+    with LineApiStandIn(latency=args.latency) as standin:
+        line = setup(standin)
+        print('pushes=%d verifications=%d workers=%d latency=%.3fs'
+              % (args.pushes, args.verifications, args.workers,
+                 args.latency))
+        print('%-8s %-8s %8s %11s %8s %8s' % (
+            'request', 'client', 'requests', 'connections', 'seconds',
+            'req/s'))
+        for name, client, request, count in [
+                ('push', 'per-call', push_per_call, args.pushes),
+                ('push', 'pooled', push_pooled, args.pushes),
+                ('verify', 'per-call', verify_per_call, args.verifications),
+                ('verify', 'pooled', verify_pooled, args.verifications)]:
+            row = run(line, standin, request, count, args.workers)
+            print('%-8s %-8s ' % (name, client)
+                  + '%(requests)8d %(connections)11d %(seconds)8.2f '
+                  '%(per_second)8.1f' % row)
+
+
+if __name__ == '__main__':
+    main()
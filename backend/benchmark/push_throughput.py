@@ -0,0 +1,179 @@
+"""
+Throughput benchmark of the reminder push batch
+
+Seeds today's reminders into the message table of the in-memory DynamoDB
+backend (aws.dynamodb.memory) and runs
+messaging_put_dynamo.send_message_from_dynamodb against a local stand-in of
+the LINE Messaging API (benchmark/line_api_standin.py) that answers each
+request after the injected latency. The run is repeated for each worker count.
+
+--bodies spreads the reminders over that many distinct message bodies (as
+reservations of the same shop, date and course share one), which the batch
+coalesces into multicasts; 0 gives every reminder a body of its own.
+
+Run from the backend directory:
+
+    python benchmark/push_throughput.py --workers 1 4 8 16
+    python benchmark/push_throughput.py --messages 2000 --bodies 0 10
+
+Columns:
+    sent        reminders the batch reported as sent
+    failed      reminders the batch reported as failed
+    requests    push and multicast requests the stand-in accepted
+    token reads GetItem requests of the channel access token table
+    msgs/s      reminders sent per second
+
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+from dateutil.tz import gettz
+
+from line_api_standin import LineApiStandIn
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Environment of the batch function, set up for the in-memory backend
+ENVIRONMENT = {
+    'DYNAMODB_BACKEND': 'memory',
+    'DYNAMODB_MEMORY_TEMPLATES': os.path.join(
+        BACKEND_DIR, 'batch', 'template.yaml'),
+    'DYNAMODB_MEMORY_ENVIRONMENT': 'dev',
+    'MESSAGE_DB': 'RemindMessageTableRestaurantDev',
+    'CHANNEL_ACCESS_TOKEN_DB': 'LINEChannelAccessTokenRestaurantDev',
+    'AWS_DEFAULT_REGION': 'ap-northeast-1',
+}
+CHANNEL_ID = 'benchmark'
+FLEX_MESSAGE = {
+    'type': 'flex',
+    'altText': 'benchmark',
+    'contents': {
+        'type': 'bubble',
+        'body': {
+            'type': 'box',
+            'layout': 'vertical',
+            'contents': [{'type': 'text', 'text': 'benchmark'}],
+        },
+    },
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 4, 8, 16], help='worker counts to compare')
+    parser.add_argument('--messages', type=int, default=200,
+                        help='reminders sent per run')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='latency of the LINE API stand-in (seconds)')
+    parser.add_argument('--bodies', type=int, nargs='+', default=[0],
+                        help='distinct message bodies to compare '
+                             '(0: one per reminder)')
+    parser.add_argument('--rate', type=float, default=1000,
+                        help='push requests per second per channel')
+    return parser.parse_args()
+
+
+def setup(args, standin):
+    """Configure the environment and import the batch function"""
+    for name, value in ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    os.environ['LINE_API_ENDPOINT'] = standin.endpoint
+    os.environ['PUSH_RATE_LIMIT'] = str(args.rate)
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'Layer', 'layer'))
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'batch',
+                                    'messaging_put_dynamo'))
+    # The batch writes its progress to the root logger
+    import logging
+    logging.disable(logging.INFO)
+
+    import messaging_put_dynamo
+    return messaging_put_dynamo
+
+
+def create_flex_message(number):
+    """Message body number (the text differs between bodies)"""
+    return {
+        **FLEX_MESSAGE,
+        'contents': {
+            **FLEX_MESSAGE['contents'],
+            'body': {
+                **FLEX_MESSAGE['contents']['body'],
+                'contents': [{'type': 'text', 'text': 'benchmark %d' % number}],
+            },
+        },
+    }
+
+
+def seed(messaging_put_dynamo, resource, count, bodies):
+    """Replace the reminders with count reminders to be sent today"""
+    today = datetime.now(gettz('Asia/Tokyo')).strftime('%Y-%m-%d')
+    # Delete the reminders of the previous run (one by one, so the
+    # partitions of remindDate-index follow)
+    table = resource.get_memory_table(os.environ['MESSAGE_DB'], 'DeleteItem')
+    with resource.lock:
+        for key in list(table.items):
+            del table.items[key]
+    resource.seed(os.environ['CHANNEL_ACCESS_TOKEN_DB'], [{
+        'channelId': CHANNEL_ID,
+        'channelAccessToken': 'benchmark',
+        'limitDate': '2999-12-31 23:59:59+0900',
+    }])
+    messaging_put_dynamo.remind_message_table_controller.put_push_messages([
+        {'user_id': 'U%05d' % number, 'channel_id': CHANNEL_ID,
+         'flex_message': create_flex_message(
+             number % bodies if bodies else number),
+         'remind_date': today}
+        for number in range(count)])
+
+
+def run(messaging_put_dynamo, resource, standin, args, workers, bodies):
+    """Send the seeded reminders and return the result row"""
+    seed(messaging_put_dynamo, resource, args.messages, bodies)
+    standin.reset()
+    reads_before = resource.request_counts.get('GetItem', 0)
+    started = time.perf_counter()
+    results, _ = messaging_put_dynamo.send_message_from_dynamodb(
+        workers=workers)
+    elapsed = time.perf_counter() - started
+    token_reads = resource.request_counts.get('GetItem', 0) - reads_before
+    return {
+        'workers': workers,
+        'bodies': bodies,
+        **results,
+        'requests': sum(count for key, count
+                        in standin.request_counts.items()
+                        if key.endswith(('/message/push',
+                                         '/message/multicast'))),
+        'token_reads': token_reads,
+        'seconds': elapsed,
+        'per_second': results['sent'] / elapsed,
+    }
+
+
+def main():
+    args = parse_args()
+    with LineApiStandIn(latency=args.latency) as standin:
+        messaging_put_dynamo = setup(args, standin)
+        from aws.dynamodb import connection
+        resource = connection.get_resource()
+
+        print('messages=%d latency=%.3fs rate=%g/s per channel'
+              % (args.messages, args.latency, args.rate))
+        print('%6s %7s %6s %6s %8s %11s %8s %8s' % (
+            'bodies', 'workers', 'sent', 'failed', 'requests', 'token reads',
+            'seconds', 'msgs/s'))
+        for bodies in args.bodies:
+            for workers in args.workers:
+                row = run(messaging_put_dynamo, resource, standin, args,
+                          workers, bodies)
+                print('%(bodies)6d %(workers)7d %(sent)6d %(failed)6d '
+                      '%(requests)8d %(token_reads)11d %(seconds)8.2f '
+                      '%(per_second)8.1f' % row)
+
+
+if __name__ == '__main__':
+    main()
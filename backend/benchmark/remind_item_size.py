@@ -0,0 +1,218 @@
+"""
+Item size benchmark of the reminder messages
+
+Builds the two reminder items reservation_put registers for a booking, once
+with the whole flex message in messageBody (the previous items, still read
+by the batch) and once with the template ID and parameters, and compares
+their DynamoDB item sizes. Then seeds a mix of both kinds into the in-memory
+message table and sends them with messaging_put_dynamo against the local
+LINE API stand-in (benchmark/line_api_standin.py), checking that both kinds
+deliver the same message bodies (the template items are sent as the rendered
+JSON, the others through the SDK objects).
+
+Run from the backend directory:
+
+    python benchmark/remind_item_size.py --bookings 1000
+
+Columns:
+    bytes       DynamoDB size of one item (attribute names and values)
+    WCU         write capacity units of writing it (1 per started KB)
+    total KB    size of the items of all bookings (two per booking)
+
+"""
+import argparse
+import json
+import math
+import os
+import sys
+from datetime import datetime
+from decimal import Decimal
+
+from dateutil.tz import gettz
+
+from line_api_standin import LineApiStandIn
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Environment of the Lambda functions, set up for the in-memory backend
+ENVIRONMENT = {
+    'DYNAMODB_BACKEND': 'memory',
+    'DYNAMODB_MEMORY_TEMPLATES': os.path.join(
+        BACKEND_DIR, 'batch', 'template.yaml'),
+    'DYNAMODB_MEMORY_ENVIRONMENT': 'dev',
+    'MESSAGE_DB': 'RemindMessageTableRestaurantDev',
+    'CHANNEL_ACCESS_TOKEN_DB': 'LINEChannelAccessTokenRestaurantDev',
+    'AWS_DEFAULT_REGION': 'ap-northeast-1',
+}
+CHANNEL_ID = 'benchmark'
+BOOKING = {
+    'userId': 'U0123456789abcdef0123456789abcdef',
+    'shopName': 'レストラン 新宿本店',
+    'courseName': '～加茂茄子・鰹・太刀魚～と国産牛土鍋炊きを愉しむ２ｈ飲み放題付き',
+    'reservationDate': '2026-10-17',
+    'reservationStarttime': '18:00',
+    'reservationEndtime': '20:00',
+    'reservationPeopleNumber': 2,
+}
+REMIND_DATE_DIFFERENCES = [0, -1]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--bookings', type=int, default=1000,
+                        help='bookings to size (two reminders each)')
+    parser.add_argument('--messages', type=int, default=200,
+                        help='reminders sent in the send check')
+    return parser.parse_args()
+
+
+def setup(standin):
+    """Configure the environment and import the batch function"""
+    for name, value in ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    os.environ['LINE_API_ENDPOINT'] = standin.endpoint
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'Layer', 'layer'))
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'batch',
+                                    'messaging_put_dynamo'))
+    # The batch writes its progress to the root logger
+    import logging
+    logging.disable(logging.INFO)
+
+    import messaging_put_dynamo
+    return messaging_put_dynamo
+
+
+def attribute_size(value):
+    """DynamoDB size of an attribute value in bytes"""
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float, Decimal)):
+        digits = len(str(abs(Decimal(value))).replace('.', '').strip('0'))
+        return math.ceil(max(digits, 1) / 2) + 1
+    if isinstance(value, dict):
+        return 3 + sum(1 + len(name.encode()) + attribute_size(item)
+                       for name, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return 3 + sum(1 + attribute_size(item) for item in value)
+    raise TypeError(type(value))
+
+
+def item_size(item):
+    """DynamoDB size of an item in bytes"""
+    return sum(len(name.encode()) + attribute_size(value)
+               for name, value in item.items())
+
+
+def create_items(flex_message_builder, controller):
+    """The reminder items of BOOKING, with the body and with the template"""
+    reservation_datetime = BOOKING['reservationDate'] + ' ' + \
+        BOOKING['reservationStarttime'] + '-' + BOOKING['reservationEndtime']
+    body_items = []
+    template_items = []
+    for remind_date_difference in REMIND_DATE_DIFFERENCES:
+        flex_prm = {'shop_name': BOOKING['shopName'],
+                    'reservation_date': reservation_datetime,
+                    'course_name': BOOKING['courseName'],
+                    'number_of_people': str(
+                        BOOKING['reservationPeopleNumber']),
+                    'remind_date_difference': remind_date_difference}
+        body_items.append(controller.create_put_push_message_action(
+            BOOKING['userId'], CHANNEL_ID,
+            flex_message_builder.create_restaurant_remind(**flex_prm),
+            BOOKING['reservationDate'])['Put']['Item'])
+        template_items.append(controller.create_put_template_message_action(
+            BOOKING['userId'], CHANNEL_ID,
+            flex_message_builder.REMIND_TEMPLATE_ID,
+            flex_message_builder.create_template_params(
+                flex_message_builder.REMIND_TEMPLATE_ID, **flex_prm),
+            BOOKING['reservationDate'])['Put']['Item'])
+    return body_items, template_items
+
+
+def check_send(messaging_put_dynamo, flex_message_builder, resource, standin,
+               count):
+    """Send a mix of both kinds of items and compare the delivered bodies"""
+    today = datetime.now(gettz('Asia/Tokyo')).strftime('%Y-%m-%d')
+    resource.seed(os.environ['CHANNEL_ACCESS_TOKEN_DB'], [{
+        'channelId': CHANNEL_ID,
+        'channelAccessToken': 'benchmark',
+        'limitDate': '2999-12-31 23:59:59+0900',
+    }])
+    push_messages = []
+    for number in range(count):
+        flex_prm = {'shop_name': 'shop %d' % (number % 7),
+                    'reservation_date': today + ' 18:00-20:00',
+                    'course_name': BOOKING['courseName'],
+                    'number_of_people': str(number % 4 + 1),
+                    'remind_date_difference': 0}
+        push_message = {'user_id': 'U%05d' % number,
+                        'channel_id': CHANNEL_ID, 'remind_date': today}
+        if number % 2:
+            push_message['flex_message'] = \
+                flex_message_builder.create_restaurant_remind(**flex_prm)
+        else:
+            push_message['template_id'] = \
+                flex_message_builder.REMIND_TEMPLATE_ID
+            push_message['template_params'] = \
+                flex_message_builder.create_template_params(
+                    flex_message_builder.REMIND_TEMPLATE_ID, **flex_prm)
+        push_messages.append(push_message)
+    messaging_put_dynamo.remind_message_table_controller.put_push_messages(
+        push_messages)
+    standin.reset()
+    results, _ = messaging_put_dynamo.send_message_from_dynamodb(
+        remind_date=today)
+    delivered = {}
+    for _, path, body in standin.requests:
+        if path.endswith(('/message/push', '/message/multicast')):
+            body = json.loads(body)
+            to = body['to'] if isinstance(body['to'], list) else [body['to']]
+            for user_id in to:
+                delivered[user_id] = body['messages'][0]
+    expected = {
+        push_message['user_id']: push_message.get('flex_message')
+        or json.loads(flex_message_builder.render_template(
+            push_message['template_id'], push_message['template_params']))
+        for push_message in push_messages}
+    mismatches = sum(delivered.get(user_id) != flex_message
+                     for user_id, flex_message in expected.items())
+    return results, mismatches
+
+
+def main():
+    args = parse_args()
+    with LineApiStandIn() as standin:
+        messaging_put_dynamo = setup(standin)
+        from aws.dynamodb import connection
+        from common import flex_message_builder
+        resource = connection.get_resource()
+        controller = messaging_put_dynamo.remind_message_table_controller
+
+        body_items, template_items = create_items(flex_message_builder,
+                                                  controller)
+        print('bookings=%d (two reminders each)' % args.bookings)
+        print('%-10s %8s %8s %5s %9s' % (
+            'item', 'reminder', 'bytes', 'WCU', 'total KB'))
+        for name, items in [('body', body_items),
+                            ('template', template_items)]:
+            total = sum(item_size(item) for item in items) * args.bookings
+            for remind_date_difference, item in zip(REMIND_DATE_DIFFERENCES,
+                                                    items):
+                size = item_size(item)
+                print('%-10s %8s %8d %5d %9.1f' % (
+                    name, 'on day' if remind_date_difference == 0
+                    else '%d day' % remind_date_difference, size,
+                    math.ceil(size / 1024), total / 1024))
+
+        results, mismatches = check_send(
+            messaging_put_dynamo, flex_message_builder, resource, standin,
+            args.messages)
+        print('send check (half body, half template items): '
+              'sent=%(sent)d failed=%(failed)d requests=%(requests)d'
+              % results + ' mismatched bodies=%d' % mismatches)
+
+
+if __name__ == '__main__':
+    main()
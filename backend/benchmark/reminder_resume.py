@@ -0,0 +1,253 @@
+"""
+Resumable reminder batch benchmark
+
+Runs messaging_put_dynamo.lambda_handler on the in-memory DynamoDB backend
+against the local LINE API stand-in (benchmark/line_api_standin.py), with
+asynchronous invocations queued on the local stand-in of aws.invoke
+(LAMBDA_BACKEND=local), so a day that does not fit in one invocation is
+continued by the invocations the function queues for itself.
+
+Scenarios:
+    chunked     the day is sent by a chain of invocations, each stopping
+                before its time limit (--timeout-ms)
+    crash       the first invocation is interrupted after --crash-after
+                messages are sent, leaving messages "sending"; an immediate
+                rerun skips them, and a rerun after their lease resends them
+                with the same retry key
+
+Every reminder has the same body, so they go out in multicasts of up to
+500 recipients; --bodies 0 gives each its own body (one push per reminder).
+
+Run from the backend directory:
+
+    python benchmark/reminder_resume.py --messages 500 --timeout-ms 1500
+
+Columns:
+    invocations handler invocations (including continuations and reruns)
+    sent        messages with remindStatus "sent" at the end
+    requests    push and multicast requests the stand-in accepted
+    conflicts   resent requests the stand-in rejected by their retry key
+    seconds     wall time of the scenario
+
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+from dateutil.tz import gettz
+
+from line_api_standin import LineApiStandIn
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTION_NAME = 'Restaurant-MessagingPut-dev'
+
+# Environment of the batch function, set up for the in-memory backend
+ENVIRONMENT = {
+    'DYNAMODB_BACKEND': 'memory',
+    'DYNAMODB_MEMORY_TEMPLATES': os.path.join(
+        BACKEND_DIR, 'batch', 'template.yaml'),
+    'DYNAMODB_MEMORY_ENVIRONMENT': 'dev',
+    'LAMBDA_BACKEND': 'local',
+    'MESSAGE_DB': 'RemindMessageTableRestaurantDev',
+    'CHANNEL_ACCESS_TOKEN_DB': 'LINEChannelAccessTokenRestaurantDev',
+    'AWS_DEFAULT_REGION': 'ap-northeast-1',
+}
+CHANNEL_ID = 'benchmark'
+FLEX_MESSAGE = {
+    'type': 'flex',
+    'altText': 'benchmark',
+    'contents': {
+        'type': 'bubble',
+        'body': {
+            'type': 'box',
+            'layout': 'vertical',
+            'contents': [{'type': 'text', 'text': 'benchmark'}],
+        },
+    },
+}
+
+
+class Crash(BaseException):
+    """Interrupts an invocation (not caught by the handler)"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--messages', type=int, default=500,
+                        help='reminders of the day')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='messages sent concurrently')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='latency of the LINE API stand-in (seconds)')
+    parser.add_argument('--timeout-ms', type=int, default=1500,
+                        help='time limit of each invocation (milliseconds)')
+    parser.add_argument('--margin-ms', type=int, default=500,
+                        help='time left when an invocation stops')
+    parser.add_argument('--crash-after', type=int, default=100,
+                        help='messages sent before the crash scenario '
+                             'interrupts')
+    parser.add_argument('--bodies', type=int, default=1,
+                        help='distinct message bodies (0: one per reminder)')
+    return parser.parse_args()
+
+
+def setup(args, standin):
+    """Configure the environment and import the batch function"""
+    for name, value in ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    os.environ['LINE_API_ENDPOINT'] = standin.endpoint
+    os.environ['SEND_WORKERS'] = str(args.workers)
+    os.environ['CONTINUATION_MARGIN_MILLIS'] = str(args.margin_ms)
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'Layer', 'layer'))
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'batch',
+                                    'messaging_put_dynamo'))
+    # The batch writes its progress to the root logger
+    import logging
+    logging.disable(logging.INFO)
+
+    import messaging_put_dynamo
+    return messaging_put_dynamo
+
+
+def create_flex_message(number):
+    """Message body number (the text differs between bodies)"""
+    return {
+        **FLEX_MESSAGE,
+        'contents': {
+            **FLEX_MESSAGE['contents'],
+            'body': {
+                **FLEX_MESSAGE['contents']['body'],
+                'contents': [{'type': 'text', 'text': 'benchmark %d' % number}],
+            },
+        },
+    }
+
+
+def seed(messaging_put_dynamo, resource, count, bodies):
+    """Replace the reminders with count reminders to be sent today"""
+    today = datetime.now(gettz('Asia/Tokyo')).strftime('%Y-%m-%d')
+    # Delete the reminders of the previous run (one by one, so the
+    # partitions of remindDate-index follow)
+    table = resource.get_memory_table(os.environ['MESSAGE_DB'], 'DeleteItem')
+    with resource.lock:
+        for key in list(table.items):
+            del table.items[key]
+    resource.seed(os.environ['CHANNEL_ACCESS_TOKEN_DB'], [{
+        'channelId': CHANNEL_ID,
+        'channelAccessToken': 'benchmark',
+        'limitDate': '2999-12-31 23:59:59+0900',
+    }])
+    messaging_put_dynamo.remind_message_table_controller.put_push_messages([
+        {'user_id': 'U%05d' % number, 'channel_id': CHANNEL_ID,
+         'flex_message': create_flex_message(
+             number % bodies if bodies else number),
+         'remind_date': today}
+        for number in range(count)])
+    return table
+
+
+def count_statuses(table):
+    """Number of messages per remindStatus"""
+    statuses = {}
+    for item in list(table.items.values()):
+        status = item.get('remindStatus', 'unsent')
+        statuses[status] = statuses.get(status, 0) + 1
+    return statuses
+
+
+def run_chain(messaging_put_dynamo, args):
+    """Start the day and run every continuation it queues"""
+    from aws.invoke import local_invoker
+
+    local_invoker.invoke(FUNCTION_NAME, {})
+    return len(local_invoker.run(
+        {FUNCTION_NAME: messaging_put_dynamo.lambda_handler},
+        args.timeout_ms))
+
+
+def chunked(messaging_put_dynamo, resource, standin, args):
+    """Send the day with a chain of time-limited invocations"""
+    table = seed(messaging_put_dynamo, resource, args.messages, args.bodies)
+    standin.reset()
+    started = time.perf_counter()
+    invocations = run_chain(messaging_put_dynamo, args)
+    return table, invocations, time.perf_counter() - started
+
+
+def crash(messaging_put_dynamo, resource, standin, args):
+    """Interrupt the first invocation, rerun, and rerun after the lease"""
+    from aws.invoke import local_invoker
+    from common.remind_message import RemindMessage
+
+    table = seed(messaging_put_dynamo, resource, args.messages, args.bodies)
+    standin.reset()
+    pushes = []
+
+    class InterruptedRemindMessage(RemindMessage):
+        def finish_sending(self, id, remind_status):
+            # The push has been accepted, but its result is never recorded
+            pushes.append(id)
+            if len(pushes) > args.crash_after:
+                raise Crash()
+            return super().finish_sending(id, remind_status)
+
+    controller = messaging_put_dynamo.remind_message_table_controller
+    lease_seconds = messaging_put_dynamo.SENDING_LEASE_SECONDS
+    started = time.perf_counter()
+    messaging_put_dynamo.SENDING_LEASE_SECONDS = 1
+    messaging_put_dynamo.remind_message_table_controller = \
+        InterruptedRemindMessage()
+    invocations = 0
+    try:
+        try:
+            invocations += run_chain(messaging_put_dynamo, args)
+        except Crash:
+            invocations += 1
+            # The queue of the interrupted chain is lost with the run
+            local_invoker.clear()
+    finally:
+        messaging_put_dynamo.remind_message_table_controller = controller
+    print('  after crash:       %s' % count_statuses(table))
+    # The messages left "sending" are skipped until their lease expires
+    invocations += run_chain(messaging_put_dynamo, args)
+    print('  rerun:             %s' % count_statuses(table))
+    # The lease is kept in whole seconds and expires after a full second
+    time.sleep(2.1)
+    invocations += run_chain(messaging_put_dynamo, args)
+    print('  rerun after lease: %s' % count_statuses(table))
+    messaging_put_dynamo.SENDING_LEASE_SECONDS = lease_seconds
+    return table, invocations, time.perf_counter() - started
+
+
+def main():
+    args = parse_args()
+    with LineApiStandIn(latency=args.latency) as standin:
+        messaging_put_dynamo = setup(args, standin)
+        from aws.dynamodb import connection
+        resource = connection.get_resource()
+
+        print('messages=%d bodies=%d workers=%d latency=%.3fs timeout=%dms '
+              'margin=%dms' % (args.messages, args.bodies, args.workers,
+                               args.latency, args.timeout_ms, args.margin_ms))
+        rows = []
+        for name, scenario in [('chunked', chunked), ('crash', crash)]:
+            table, invocations, elapsed = scenario(
+                messaging_put_dynamo, resource, standin, args)
+            rows.append((name, invocations,
+                         count_statuses(table).get('sent', 0),
+                         sum(count for key, count
+                             in standin.request_counts.items()
+                             if key.endswith(('/message/push',
+                                              '/message/multicast'))),
+                         standin.conflict_count, elapsed))
+        print('%-8s %11s %6s %8s %9s %8s' % (
+            'scenario', 'invocations', 'sent', 'requests', 'conflicts',
+            'seconds'))
+        for row in rows:
+            print('%-8s %11d %6d %8d %9d %8.2f' % row)
+
+
+if __name__ == '__main__':
+    main()